@@ -0,0 +1,124 @@
+import numpy as np
+
+
+class FrameReplayBuffer(object):
+    """Replay buffer for vision runs that keeps every frame once as uint8.
+
+    A transition at step t is stored as the frame observed at t together with
+    the action taken, the reward received and the done flag. The stacked state
+    for t and the stacked next state for t + 1 are rebuilt from frame indices
+    at sample time, so neither next_state nor the frame stack is duplicated in
+    memory. Frames before the start of an episode are replaced by its first
+    frame. Only the sampled batch is converted to float.
+    """
+
+    def __init__(self, buffer_size=1000000, frame_shape=(64, 64, 3), stack_size=4,
+                 action_dim=3, low_dim=0):
+        self.buffer_size = buffer_size
+        self.frame_shape = tuple(frame_shape)
+        self.stack_size = stack_size
+        self.action_dim = action_dim
+        self.low_dim = low_dim
+
+        # np.zeros only commits pages as they are written, so a 1M frame
+        # buffer costs memory in proportion to what has been collected
+        self.frames = np.zeros((buffer_size,) + self.frame_shape, dtype=np.uint8)
+        self.actions = np.zeros((buffer_size, action_dim), dtype=np.float32)
+        self.rewards = np.zeros(buffer_size, dtype=np.float32)
+        self.dones = np.zeros(buffer_size, dtype=np.bool_)
+        self.episode_start = np.zeros(buffer_size, dtype=np.int64)
+        self.low_dim_obs = np.zeros((buffer_size, low_dim), dtype=np.float32) if low_dim else None
+
+        self.num_experiences = 0
+        self.next_step = 0          # global step index of the next write
+        self.current_episode_start = 0
+        self._stack_offsets = np.arange(stack_size - 1, -1, -1, dtype=np.int64)
+
+    @staticmethod
+    def memory_required(buffer_size, frame_shape=(64, 64, 3), action_dim=3, low_dim=0):
+        """Return the number of bytes a full buffer of this size occupies"""
+        frame_bytes = int(np.prod(frame_shape))
+        per_step = frame_bytes + 4 * action_dim + 4 + 1 + 8 + 4 * low_dim
+        return buffer_size * per_step
+
+    def add(self, frame, action, reward, done, low_dim_obs=None):
+        """Store the frame seen at this step with the action taken on it"""
+        slot = self.next_step % self.buffer_size
+
+        self.frames[slot] = np.asarray(frame, dtype=np.uint8).reshape(self.frame_shape)
+        self.actions[slot] = action
+        self.rewards[slot] = reward
+        self.dones[slot] = done
+        self.episode_start[slot] = self.current_episode_start
+        if self.low_dim_obs is not None:
+            self.low_dim_obs[slot] = low_dim_obs
+
+        self.next_step += 1
+        if done:
+            self.current_episode_start = self.next_step
+        if self.num_experiences < self.buffer_size:
+            self.num_experiences += 1
+
+    def _valid_steps(self):
+        """Return the [low, high) range of global steps that can be sampled"""
+        oldest = self.next_step - self.num_experiences
+        # The oldest frames have lost their stack history to overwrites, and
+        # the newest step has no next frame yet unless it ended the episode
+        low = oldest + self.stack_size - 1 if self.num_experiences == self.buffer_size else oldest
+        high = self.next_step - 1
+        if self.num_experiences and self.dones[(self.next_step - 1) % self.buffer_size]:
+            high = self.next_step
+        return low, high
+
+    def _stack_indices(self, steps, starts):
+        """Return ring slots of the frame stacks ending at the given steps"""
+        stacked = steps[:, None] - self._stack_offsets[None, :]
+        stacked = np.maximum(stacked, starts[:, None])
+        return stacked % self.buffer_size
+
+    def getBatch(self, batch_size):
+        """Sample a batch of stacked transitions as float32 arrays.
+
+        Returns states, actions, rewards, new_states and dones. States have
+        shape (batch, height, width, stack_size * channels) with pixel values
+        scaled to [0, 1].
+        """
+        low, high = self._valid_steps()
+        if high <= low:
+            raise ValueError("Not enough frames in the buffer to sample a batch")
+
+        steps = np.random.randint(low, high, size=batch_size)
+        slots = steps % self.buffer_size
+        starts = self.episode_start[slots]
+        dones = self.dones[slots]
+
+        # The next state of a terminal step is masked out by the target, so
+        # reuse the current stack instead of reading the next episode
+        next_steps = np.where(dones, steps, steps + 1)
+
+        states = self._gather_stack(self._stack_indices(steps, starts))
+        new_states = self._gather_stack(self._stack_indices(next_steps, starts))
+
+        batch = [states, self.actions[slots], self.rewards[slots], new_states, dones]
+        if self.low_dim_obs is not None:
+            batch.append(self.low_dim_obs[slots])
+            batch.append(self.low_dim_obs[next_steps % self.buffer_size])
+        return tuple(batch)
+
+    def _gather_stack(self, stack_slots):
+        """Gather uint8 frames by slot and convert only the batch to float"""
+        frames = self.frames[stack_slots]  # (batch, stack, h, w, c)
+        frames = np.moveaxis(frames, 1, -2)  # (batch, h, w, stack, c)
+        frames = frames.reshape(frames.shape[:-2] + (-1,))
+        return frames.astype(np.float32) * (1.0 / 255.0)
+
+    def size(self):
+        return self.buffer_size
+
+    def count(self):
+        return self.num_experiences
+
+    def erase(self):
+        self.num_experiences = 0
+        self.next_step = 0
+        self.current_episode_start = 0
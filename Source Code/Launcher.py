@@ -621,6 +621,29 @@ def destringify(s):
             return [destringify(i) for i in s]
 
 
+def heuristic_control(angle, track_pos, speed_x, wheel_spin_vel, accel, target_speed=300):
+    '''Steering and throttle of the example driver for one tick.
+    accel is the throttle of the previous tick; the controller nudges it.'''
+    # Steer To Corner
+    steer = angle * 10 / PI
+    # Steer To Center
+    steer -= track_pos * 0.10
+
+    # Throttle Control
+    if speed_x < target_speed - (steer * 50):
+        accel += 0.05
+    else:
+        accel -= 0.01
+    if speed_x < 10:
+        accel += 1 / (speed_x + 0.1)
+
+    # Traction Control System
+    if ((wheel_spin_vel[2] + wheel_spin_vel[3]) -
+       (wheel_spin_vel[0] + wheel_spin_vel[1]) > 5):
+        accel -= 0.2
+
+    return steer, accel
+
 def drive_example(c):
     # This is a simple example of a driver that uses the server state
     S, R = c.S.d, c.R.d
@@ -685,24 +708,8 @@ def drive_example(c):
         #return  # Skip normal driving logic while in recovery
     
     # Normal driving logic (only executed when not in recovery)
-    
-    # Steer To Corner
-    R['steer'] = S['angle'] * 10 / PI
-    # Steer To Center
-    R['steer'] -= S['trackPos'] * 0.10
-
-    # Throttle Control
-    if S['speedX'] < target_speed - (R['steer'] * 50):
-        R['accel'] += 0.05
-    else:
-        R['accel'] -= 0.01
-    if S['speedX'] < 10:
-        R['accel'] += 1 / (S['speedX'] + 0.1)
-
-    # Traction Control System
-    if ((S['wheelSpinVel'][2] + S['wheelSpinVel'][3]) -
-       (S['wheelSpinVel'][0] + S['wheelSpinVel'][1]) > 5):
-        R['accel'] -= 0.2
+    R['steer'], R['accel'] = heuristic_control(S['angle'], S['trackPos'], S['speedX'],
+                                               S['wheelSpinVel'], R['accel'], target_speed)
 
     # Automatic Gear Change Logic
     if S['rpm'] > 6000:
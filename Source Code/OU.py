@@ -1,7 +1,180 @@
 import random
-import numpy as np 
+import numpy as np
 
 class OU(object):
 
     def function(self, x, mu, theta, sigma):
-        return theta * (mu - x) + sigma * np.random.randn(1)
\ No newline at end of file
+        return theta * (mu - x) + sigma * np.random.randn()
+
+
+class NoiseProcess(object):
+    """Exploration noise over a (num_envs, action_dim) array.
+
+    Standard normals are drawn block_steps at a time, so a step of any
+    number of cars costs one slice of a pre-generated block. The output is
+    multiplied by a scale that decays linearly from scale to final_scale
+    over decay_steps calls of sample(); decay_steps=0 keeps it constant.
+    """
+
+    def __init__(self, num_envs, action_dim, seed=None, block_steps=1000, scale=1.0, final_scale=0.0,
+                 decay_steps=0):
+        self.num_envs = num_envs
+        self.action_dim = action_dim
+        self.rng = np.random.default_rng(seed)
+        self.block_steps = block_steps
+        self.initial_scale = scale
+        self.final_scale = final_scale
+        self.decay_steps = decay_steps
+        self.steps = 0
+        self._block = None
+        self._position = block_steps
+
+    @property
+    def scale(self):
+        """Scale applied at the current step"""
+        if not self.decay_steps:
+            return self.initial_scale
+        fraction = min(1.0, self.steps / self.decay_steps)
+        return self.initial_scale + fraction * (self.final_scale - self.initial_scale)
+
+    def _normal(self):
+        """Next (num_envs, action_dim) slice of standard normals"""
+        if self._position >= self.block_steps:
+            self._block = self.rng.standard_normal((self.block_steps, self.num_envs, self.action_dim),
+                                                   dtype=np.float32)
+            self._position = 0
+        normal = self._block[self._position]
+        self._position += 1
+        return normal
+
+    def _next(self):
+        raise NotImplementedError
+
+    def sample(self):
+        """Noise for every env at this step, shaped (num_envs, action_dim)"""
+        noise = self._next() * self.scale
+        self.steps += 1
+        return noise
+
+    def reset(self, mask=None):
+        """Restart the process for the envs in mask (all if None), e.g. when their episodes end"""
+        return
+
+
+class GaussianNoise(NoiseProcess):
+    """Independent Gaussian noise with per-dimension mean and standard deviation"""
+
+    def __init__(self, num_envs, action_dim, mu=0.0, sigma=1.0, **kwargs):
+        super(GaussianNoise, self).__init__(num_envs, action_dim, **kwargs)
+        self.mu = np.asarray(mu, dtype=np.float32)
+        self.sigma = np.asarray(sigma, dtype=np.float32)
+
+    def _next(self):
+        return self.mu + self.sigma * self._normal()
+
+
+class OrnsteinUhlenbeckNoise(NoiseProcess):
+    """Stateful Ornstein-Uhlenbeck process, x += theta * (mu - x) * dt + sigma * sqrt(dt) * N(0, 1).
+
+    Each env keeps its own state, so consecutive steps are correlated and a
+    reset only restarts the envs whose episodes ended.
+    """
+
+    def __init__(self, num_envs, action_dim, mu=0.0, theta=0.15, sigma=0.2, dt=1.0, **kwargs):
+        super(OrnsteinUhlenbeckNoise, self).__init__(num_envs, action_dim, **kwargs)
+        self.mu = np.asarray(mu, dtype=np.float32)
+        self.theta = np.asarray(theta, dtype=np.float32)
+        self.sigma = np.asarray(sigma, dtype=np.float32)
+        self.dt = dt
+        self.state = np.empty((num_envs, action_dim), dtype=np.float32)
+        self.reset()
+
+    def _next(self):
+        self.state += self.theta * (self.mu - self.state) * self.dt + self.sigma * np.sqrt(self.dt) * self._normal()
+        return self.state.copy()
+
+    def reset(self, mask=None):
+        if mask is None:
+            self.state[:] = self.mu
+        else:
+            self.state[mask] = np.broadcast_to(self.mu, self.state.shape)[mask]
+
+
+class PinkNoise(NoiseProcess):
+    """Pink (1/f) noise, generated one sequence of sequence_steps per env and action.
+
+    Each sequence is Gaussian noise shaped to a 1/f power spectrum with an
+    FFT and normalized to unit variance. Envs move through their own
+    sequence and get a fresh one when they reset or reach its end.
+    """
+
+    def __init__(self, num_envs, action_dim, sigma=1.0, sequence_steps=1000, **kwargs):
+        super(PinkNoise, self).__init__(num_envs, action_dim, **kwargs)
+        self.sigma = np.asarray(sigma, dtype=np.float32)
+        self.sequence_steps = sequence_steps
+        self.sequences = np.empty((num_envs, action_dim, sequence_steps), dtype=np.float32)
+        self.positions = np.zeros(num_envs, dtype=np.int64)
+
+        frequencies = np.fft.rfftfreq(sequence_steps)
+        frequencies[0] = frequencies[1]
+        self._amplitudes = 1.0 / np.sqrt(frequencies)
+        self.reset()
+
+    def _generate(self, count):
+        white = self.rng.standard_normal((count, self.action_dim, self.sequence_steps))
+        pink = np.fft.irfft(np.fft.rfft(white) * self._amplitudes, n=self.sequence_steps)
+        pink -= pink.mean(axis=2, keepdims=True)
+        pink /= pink.std(axis=2, keepdims=True)
+        return pink.astype(np.float32)
+
+    def _next(self):
+        finished = self.positions >= self.sequence_steps
+        if finished.any():
+            self.reset(finished)
+        noise = self.sequences[np.arange(self.num_envs), :, self.positions]
+        self.positions += 1
+        return self.sigma * noise
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        count = int(np.count_nonzero(mask))
+        if count:
+            self.sequences[mask] = self._generate(count)
+            self.positions[mask] = 0
+
+
+NOISE_TYPES = {
+    'gaussian': GaussianNoise,
+    'ou': OrnsteinUhlenbeckNoise,
+    'pink': PinkNoise,
+}
+
+
+def make_noise(kind, num_envs, action_dim, **kwargs):
+    """Build a noise process by name: 'gaussian', 'ou' or 'pink'"""
+    if kind not in NOISE_TYPES:
+        raise ValueError(f"Unknown noise type {kind!r}, expected one of {', '.join(NOISE_TYPES)}")
+    return NOISE_TYPES[kind](num_envs, action_dim, **kwargs)
+
+
+class PlayGameNoise(OrnsteinUhlenbeckNoise):
+    """Exploration of ddpg.playGame for [steer, accel, brake] over many cars.
+
+    Actions are pulled toward MU at rate THETA as in the original
+    OU.function calls, and the random part is now a real OU process with
+    the same theta and sigma, so steering noise is correlated across steps.
+    The scale plays the role of playGame's epsilon.
+    """
+
+    MU = np.array([0.0, 0.5, -0.1], dtype=np.float32)
+    THETA = np.array([0.60, 1.00, 1.00], dtype=np.float32)
+    SIGMA = np.array([0.30, 0.10, 0.05], dtype=np.float32)
+
+    def __init__(self, num_envs=1, **kwargs):
+        super(PlayGameNoise, self).__init__(num_envs, 3, mu=0.0, theta=self.THETA, sigma=self.SIGMA, **kwargs)
+
+    def perturb(self, actions):
+        """Noise to add to a (num_envs, 3) batch of actor outputs"""
+        pull = self.scale * self.THETA * (self.MU - actions)
+        return pull + self.sample()
@@ -1,5 +1,6 @@
 from collections import deque
 import random
+import threading
 
 class ReplayBuffer(object):
 
@@ -7,25 +8,28 @@ class ReplayBuffer(object):
         self.buffer_size = buffer_size
         self.num_experiences = 0
         self.buffer = deque()
+        self.lock = threading.Lock()    # a learner thread may sample while the control loop adds
 
     def getBatch(self, batch_size):
         # Randomly sample batch_size examples
-        if self.num_experiences < batch_size:
-            return random.sample(self.buffer, self.num_experiences)
-        else:
-            return random.sample(self.buffer, batch_size)
+        with self.lock:
+            if self.num_experiences < batch_size:
+                return random.sample(self.buffer, self.num_experiences)
+            else:
+                return random.sample(self.buffer, batch_size)
 
     def size(self):
         return self.buffer_size
 
     def add(self, state, action, reward, new_state, done):
         experience = (state, action, reward, new_state, done)
-        if self.num_experiences < self.buffer_size:
-            self.buffer.append(experience)
-            self.num_experiences += 1
-        else:
-            self.buffer.popleft()
-            self.buffer.append(experience)
+        with self.lock:
+            if self.num_experiences < self.buffer_size:
+                self.buffer.append(experience)
+                self.num_experiences += 1
+            else:
+                self.buffer.popleft()
+                self.buffer.append(experience)
 
     def count(self):
         # if buffer is full, return buffer size
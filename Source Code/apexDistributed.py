@@ -0,0 +1,545 @@
+import argparse
+import collections as col
+import io
+import json
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from OU import PlayGameNoise
+from numpyActor import NumpyActor
+
+# Message types
+HELLO = 1
+TRANSITIONS = 2
+WEIGHTS = 3
+STOP = 4
+
+# Frame header: message type and payload length
+HEADER = struct.Struct('!BI')
+
+
+def encode_arrays(arrays, meta=None, level=1):
+    """Pack named arrays and a JSON-able meta dict into a compressed payload"""
+    buffer = io.BytesIO()
+    np.savez(buffer, meta=json.dumps(meta or {}), **arrays)
+    return zlib.compress(buffer.getvalue(), level)
+
+
+def decode_arrays(payload):
+    """Inverse of encode_arrays: (dict of arrays, meta dict)"""
+    with np.load(io.BytesIO(zlib.decompress(payload)), allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files if name != 'meta'}
+        meta = json.loads(str(data['meta']))
+    return arrays, meta
+
+
+def send_frame(sock, kind, payload=b''):
+    """Send one length-prefixed frame"""
+    sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """Receive one frame as (kind, payload)"""
+    kind, size = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return kind, _recv_exact(sock, size)
+
+
+def playgame_state(ob):
+    """The 29-dim state playGame builds from a TorcsEnv observation"""
+    return np.hstack((ob.angle, ob.track, ob.trackPos, ob.speedX, ob.speedY, ob.speedZ,
+                      ob.wheelSpinVel / 100.0, ob.rpm)).astype(np.float32)
+
+
+class StandInEnv(object):
+    """Loopback stand-in for TorcsEnv, for exercising the pipeline without a server.
+
+    A point car drives a road of slowly varying curvature. Observations carry
+    the fields and scaling of TorcsEnv.make_observaton and the reward is the
+    same progress term, so collectors run unchanged against either. raw holds
+    the unscaled server values of the last step, with laps of lap_length
+    metres and damage for every step spent beyond the track edge. As in
+    TORCS, the angle is positive when the car points right of the track axis
+    and the rangefinder angles are clockwise, while heading and offset are
+    measured to the left like trackPos.
+    """
+
+    Observation = col.namedtuple('Observaion', ['angle', 'track', 'trackPos', 'speedX', 'speedY',
+                                                'speedZ', 'wheelSpinVel', 'rpm', 'damage'])
+    # Rangefinder angles of the default Client, in degrees
+    TRACK_ANGLES = np.radians([-45, -19, -12, -7, -4, -2.5, -1.7, -1, -.5, 0,
+                               .5, 1, 1.7, 2.5, 4, 7, 12, 19, 45])
+
+    def __init__(self, seed=None, max_steps=1000, dt=0.2, half_width=6.0, lap_length=2000.0):
+        self.rng = np.random.default_rng(seed)
+        self.max_steps = max_steps
+        self.dt = dt
+        self.half_width = half_width
+        self.lap_length = lap_length
+
+    def reset(self, relaunch=False):
+        self.time_step = 0
+        self.speed = 0.0       # km/h
+        self.heading = 0.0     # rad, relative to the track axis
+        self.offset = 0.0      # m from the centre line
+        self.curvature = 0.0   # 1/m
+        self.dist_raced = 0.0
+        self.damage = 0.0
+        self.lap = 1
+        self.cur_lap_time = 0.0
+        self.last_lap_time = 0.0
+        return self._observe()
+
+    def _observe(self):
+        # Distance along each rangefinder to the edge of a straight road segment
+        directions = self.heading - self.TRACK_ANGLES
+        lateral = np.sin(directions)
+        with np.errstate(divide='ignore'):
+            to_edge = np.where(lateral > 0, (self.half_width - self.offset) / lateral,
+                               (-self.half_width - self.offset) / lateral)
+        track = np.clip(np.where(np.abs(lateral) < 1e-6, 200.0, to_edge), 0.0, 200.0)
+
+        wheel_spin = self.speed / 3.6 / 0.3
+        self.raw = {'angle': -self.heading, 'track': list(track), 'trackPos': self.offset / self.half_width,
+                    'speedX': self.speed, 'speedY': 0.0, 'speedZ': 0.0, 'rpm': 1000.0 + 30.0 * self.speed,
+                    'damage': self.damage, 'z': 0.35, 'wheelSpinVel': [wheel_spin] * 4,
+                    'opponents': [200.0] * 36, 'distRaced': self.dist_raced,
+                    'distFromStart': self.dist_raced % self.lap_length, 'curLapTime': self.cur_lap_time,
+                    'lastLapTime': self.last_lap_time, 'lap': self.lap}
+        return self.Observation(angle=np.float32(-self.heading / 3.1416),
+                                track=(track / 200.0).astype(np.float32),
+                                trackPos=np.float32(self.offset / self.half_width),
+                                speedX=np.float32(self.speed / 300.0),
+                                speedY=np.float32(0.0),
+                                speedZ=np.float32(0.0),
+                                wheelSpinVel=np.full(4, wheel_spin, dtype=np.float32),
+                                rpm=np.float32(min(1.0, 0.1 + self.speed / 300.0)),
+                                damage=np.float32(0.0))
+
+    def step(self, u):
+        steer, accel, brake = float(u[0]), float(np.clip(u[1], 0, 1)), float(np.clip(u[2], 0, 1))
+        self.curvature = np.clip(self.curvature + self.rng.normal(0, 2e-4), -0.01, 0.01)
+
+        self.speed = max(0.0, self.speed + self.dt * (40.0 * accel - 80.0 * brake - 0.002 * self.speed ** 2))
+        v = self.speed / 3.6
+        self.heading += self.dt * (v * 0.05 * np.clip(steer, -1, 1) - v * self.curvature)
+        self.offset += self.dt * v * np.sin(self.heading)
+        self.time_step += 1
+
+        self.dist_raced += self.dt * v * np.cos(self.heading)
+        self.cur_lap_time += self.dt
+        if self.dist_raced >= self.lap * self.lap_length:
+            self.last_lap_time = self.cur_lap_time
+            self.cur_lap_time = 0.0
+            self.lap += 1
+        if abs(self.offset) > self.half_width:
+            self.damage += 10.0
+
+        ob = self._observe()
+        sp = self.speed
+        reward = sp * np.cos(self.heading) - np.abs(sp * np.sin(self.heading)) - sp * np.abs(ob.trackPos)
+        terminal = np.cos(self.heading) < 0 or abs(self.offset) > 2 * self.half_width
+        # The step limit also ends the episode, but info tells it apart from a real ending
+        truncated = not terminal and self.time_step >= self.max_steps
+        return ob, float(reward), bool(terminal or truncated), {'truncated': truncated}
+
+    def end(self):
+        return
+
+
+class ApexCollector(object):
+    """Drives one environment with a local actor copy and streams transitions.
+
+    The actor is a NumpyActor, so a collector never imports TensorFlow. It is
+    built from the first weights message and refreshed whenever the learner
+    publishes. Every send_every steps the buffered transitions are shipped as
+    one compressed frame tagged with the weights version that produced them.
+    """
+
+    def __init__(self, host, port, actor_id, env, send_every=256, noise_scale=1.0, explore=100000):
+        self.actor_id = actor_id
+        self.env = env
+        self.send_every = send_every
+        self.noise_scale = noise_scale
+        self.explore = explore
+
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send_frame(self.sock, HELLO, encode_arrays({}, {'actor_id': actor_id, 'host': socket.gethostname()}))
+
+        # The first weights message carries the whole actor graph
+        kind, payload = recv_frame(self.sock)
+        arrays, meta = decode_arrays(payload)
+        self.engine = NumpyActor.from_npz(io.BytesIO(arrays['npz'].tobytes()))
+        self.version = meta['version']
+
+        self._latest = None
+        self._latest_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self._receiver = threading.Thread(target=self._receive, name='collector-receiver', daemon=True)
+        self._receiver.start()
+
+        self.steps = 0
+        self.episodes = 0
+
+    def _receive(self):
+        """Keep the newest published weights until the control loop picks them up"""
+        try:
+            while True:
+                kind, payload = recv_frame(self.sock)
+                if kind == STOP:
+                    break
+                if kind == WEIGHTS:
+                    with self._latest_lock:
+                        self._latest = payload
+        except (ConnectionError, OSError):
+            pass
+        self.stopped.set()
+
+    def _refresh_weights(self):
+        with self._latest_lock:
+            payload, self._latest = self._latest, None
+        if payload is not None:
+            arrays, meta = decode_arrays(payload)
+            self.engine.set_weights([arrays['w%d' % i] for i in range(len(arrays))])
+            self.version = meta['version']
+
+    def _send(self, transitions):
+        states, actions, rewards, next_states, dones = zip(*transitions)
+        arrays = {'states': np.asarray(states, dtype=np.float32),
+                  'actions': np.asarray(actions, dtype=np.float32),
+                  'rewards': np.asarray(rewards, dtype=np.float32),
+                  'next_states': np.asarray(next_states, dtype=np.float32),
+                  'dones': np.asarray(dones, dtype=np.float32)}
+        send_frame(self.sock, TRANSITIONS,
+                   encode_arrays(arrays, {'actor_id': self.actor_id, 'version': self.version}))
+
+    def run(self, max_steps=100, episodes=None):
+        """Collect until the learner says stop, or for a number of episodes"""
+        transitions = []
+        # Same OU exploration as playGame, scaled per collector
+        exploration = PlayGameNoise(1, scale=self.noise_scale, final_scale=0.0, decay_steps=self.explore)
+        try:
+            while not self.stopped.is_set() and (episodes is None or self.episodes < episodes):
+                ob = self.env.reset()
+                s_t = playgame_state(ob)
+                exploration.reset()
+                for j in range(max_steps):
+                    self._refresh_weights()
+                    a_t = self.engine.predict(s_t)[0].copy()
+                    a_t += exploration.perturb(a_t[None])[0]
+                    a_t[0] /= 4
+
+                    ob, r_t, done, info = self.env.step(a_t)
+                    s_t1 = playgame_state(ob)
+                    # A step-limit ending is still bootstrapped from s_t1
+                    transitions.append((s_t, a_t, r_t, s_t1, done and not info.get('truncated', False)))
+                    self.steps += 1
+                    s_t = s_t1
+
+                    if len(transitions) >= self.send_every:
+                        self._send(transitions)
+                        transitions = []
+                    if done or self.stopped.is_set():
+                        break
+                self.episodes += 1
+            if transitions and not self.stopped.is_set():
+                self._send(transitions)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.env.end()
+            self.sock.close()
+
+
+class ApexLearner(object):
+    """Central learner for many collectors, over plain TCP.
+
+    Collector connections are served by one reader thread each, which
+    decompresses transition batches into the replay buffer. The learner
+    trains with the same compiled update as playGame and, every
+    publish_interval updates, broadcasts the actor weights to every
+    collector. Per collector it tracks received transitions, compressed
+    bytes, throughput and the staleness of the weights each batch was
+    collected with, both in publications and in updates.
+    """
+
+    def __init__(self, host='0.0.0.0', port=5555, batch_size=32, buffer_size=100000, gamma=0.99,
+                 tau=0.001, lra=0.0001, lrc=0.001, publish_interval=100, weights_path=None):
+        from ddpg import batch_to_arrays, create_actor_model, create_critic_model, make_train_step
+        from ReplayBuffer import ReplayBuffer
+
+        self.state_dim = 29
+        self.action_dim = 3
+        self.batch_size = batch_size
+        self.publish_interval = publish_interval
+
+        self.actor = create_actor_model(self.state_dim)
+        self.actor_target = create_actor_model(self.state_dim)
+        self.critic = create_critic_model(self.state_dim, self.action_dim)
+        self.critic_target = create_critic_model(self.state_dim, self.action_dim)
+        if weights_path is not None:
+            self.actor.load_weights(weights_path[0])
+            self.critic.load_weights(weights_path[1])
+        self.actor_target.set_weights(self.actor.get_weights())
+        self.critic_target.set_weights(self.critic.get_weights())
+        self.train_step = make_train_step(self.actor, self.critic, self.actor_target, self.critic_target,
+                                          gamma, tau, lra, lrc)
+        self.buff = ReplayBuffer(buffer_size)
+        self.batch_to_arrays = batch_to_arrays
+
+        self.engine = NumpyActor.from_model(self.actor)
+        self.version = 0
+        self.updates = 0
+        self.updates_at_version = {0: 0}
+
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.connections = {}
+        self.connections_lock = threading.Lock()
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self._closing = False
+        threading.Thread(target=self._accept, name='apex-accept', daemon=True).start()
+
+    def _accept(self):
+        while not self._closing:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(sock,), name='apex-reader', daemon=True).start()
+
+    def _full_actor(self):
+        """Weights message carrying the whole NumpyActor, for new collectors"""
+        buffer = io.BytesIO()
+        self.engine.save_npz(buffer)
+        return encode_arrays({'npz': np.frombuffer(buffer.getvalue(), dtype=np.uint8)}, {'version': self.version})
+
+    def _serve(self, sock):
+        """Read frames from one collector until it disconnects"""
+        actor_id = None
+        send_lock = threading.Lock()
+        try:
+            kind, payload = recv_frame(sock)
+            actor_id = decode_arrays(payload)[1]['actor_id']
+            with self.stats_lock:
+                self.stats[actor_id] = {'transitions': 0, 'batches': 0, 'bytes': 0, 'first_seen': time.time(),
+                                        'last_seen': time.time(), 'staleness_versions': 0.0,
+                                        'staleness_updates': 0.0, 'connected': True}
+            with send_lock:
+                send_frame(sock, WEIGHTS, self._full_actor())
+            with self.connections_lock:
+                self.connections[actor_id] = (sock, send_lock)
+
+            while True:
+                kind, payload = recv_frame(sock)
+                if kind != TRANSITIONS:
+                    continue
+                arrays, meta = decode_arrays(payload)
+                for experience in zip(arrays['states'], arrays['actions'], arrays['rewards'],
+                                      arrays['next_states'], arrays['dones']):
+                    self.buff.add(*experience)
+
+                n = len(arrays['states'])
+                with self.stats_lock:
+                    entry = self.stats[actor_id]
+                    entry['transitions'] += n
+                    entry['batches'] += 1
+                    entry['bytes'] += len(payload) + HEADER.size
+                    entry['last_seen'] = time.time()
+                    # Running means over batches
+                    lag_versions = self.version - meta['version']
+                    lag_updates = self.updates - self.updates_at_version.get(meta['version'], 0)
+                    entry['staleness_versions'] += (lag_versions - entry['staleness_versions']) / entry['batches']
+                    entry['staleness_updates'] += (lag_updates - entry['staleness_updates']) / entry['batches']
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.connections_lock:
+                self.connections.pop(actor_id, None)
+            if actor_id is not None:
+                with self.stats_lock:
+                    self.stats[actor_id]['connected'] = False
+            sock.close()
+
+    def _broadcast(self, kind, payload=b''):
+        with self.connections_lock:
+            connections = list(self.connections.items())
+        for actor_id, (sock, send_lock) in connections:
+            try:
+                with send_lock:
+                    send_frame(sock, kind, payload)
+            except OSError:
+                pass
+
+    def publish(self):
+        """Push the current actor weights to every collector"""
+        weights = self.actor.get_weights()
+        self.engine.set_weights(weights)
+        self.version += 1
+        self.updates_at_version[self.version] = self.updates
+        payload = encode_arrays({'w%d' % i: w for i, w in enumerate(weights)}, {'version': self.version})
+        self._broadcast(WEIGHTS, payload)
+
+    def run(self, updates=None, duration=None, report_every=10.0):
+        """Train on incoming transitions until updates or duration runs out"""
+        start = time.time()
+        last_report = start
+        while (updates is None or self.updates < updates) and \
+                (duration is None or time.time() - start < duration):
+            if self.buff.count() <= self.batch_size:
+                time.sleep(0.01)
+                continue
+
+            self.train_step(*self.batch_to_arrays(self.buff.getBatch(self.batch_size)))
+            self.updates += 1
+            if self.updates % self.publish_interval == 0:
+                self.publish()
+
+            if time.time() - last_report >= report_every:
+                self.print_stats()
+                last_report = time.time()
+
+    def print_stats(self):
+        """Per-collector throughput and staleness"""
+        now = time.time()
+        with self.stats_lock:
+            stats = {actor_id: dict(entry) for actor_id, entry in self.stats.items()}
+        print(f"Learner: {self.updates} updates, weights version {self.version}, replay {self.buff.count()}")
+        for actor_id, entry in sorted(stats.items()):
+            elapsed = max((now if entry['connected'] else entry['last_seen']) - entry['first_seen'], 1e-9)
+            print(f"  actor {actor_id}: {entry['transitions']} transitions, "
+                  f"{entry['transitions'] / elapsed:.1f}/s, {entry['bytes'] / 1024:.0f} KiB, "
+                  f"staleness {entry['staleness_versions']:.2f} versions / "
+                  f"{entry['staleness_updates']:.0f} updates"
+                  f"{'' if entry['connected'] else ' (disconnected)'}")
+
+    def close(self, save=True):
+        """Stop the collectors and optionally save the actor and critic like playGame"""
+        self._broadcast(STOP)
+        self._closing = True
+        self.server.close()
+        with self.connections_lock:
+            for sock, send_lock in self.connections.values():
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if save:
+            from checkpointWriter import CheckpointWriter, KerasSnapshot
+
+            checkpoints = CheckpointWriter()
+            checkpoints.submit(KerasSnapshot(self.actor).writer(self.actor), "actormodel.h5",
+                               tmp_suffix='.tmp.weights.h5')
+            checkpoints.submit(KerasSnapshot(self.critic).writer(self.critic), "criticmodel.h5",
+                               tmp_suffix='.tmp.weights.h5')
+            checkpoints.close()
+
+
+def apex_noise_scales(num_collectors, base=0.4, alpha=7.0):
+    """Per-collector exploration scales, base ** (1 + alpha * i / (N - 1)) as in Ape-X"""
+    if num_collectors == 1:
+        return [base]
+    return [base ** (1 + alpha * i / (num_collectors - 1)) for i in range(num_collectors)]
+
+
+def _run_collector(host, port, actor_id, env_name, noise_scale, max_steps, send_every, seed, race_config=None):
+    if env_name == 'torcs':
+        # Collector N drives its own server on port 3001 + N, which only a
+        # headless race config using scr_server N + 1 can provide
+        torcs_port = 3001 + actor_id
+        if race_config is None and actor_id > 0:
+            raise ValueError("TORCS collectors after the first need a race_config per port, "
+                             "e.g. 'raceconfigs/scr_{server}.xml'")
+        if race_config is not None:
+            race_config = race_config.format(port=torcs_port, server=torcs_port - 3000)
+        from gym_torcs import TorcsEnv
+        env = TorcsEnv(vision=False, throttle=True, gear_change=False, port=torcs_port, race_config=race_config)
+    else:
+        env = StandInEnv(seed=seed)
+    np.random.seed(seed)
+    collector = ApexCollector(host, port, actor_id, env, send_every=send_every, noise_scale=noise_scale)
+    collector.run(max_steps=max_steps)
+
+
+def main():
+    """Run a learner, a collector, or a whole loopback setup"""
+    parser = argparse.ArgumentParser(description='Ape-X style distributed collectors and learner over TCP')
+    parser.add_argument('role', choices=['learner', 'collector', 'local'],
+                        help="'local' starts a learner and stand-in collectors on loopback")
+    parser.add_argument('--host', default='127.0.0.1', help='Learner address (collector) or bind address')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--actor-id', type=int, default=0, help='Collector id')
+    parser.add_argument('--collectors', type=int, default=4, help='Collectors to start (local)')
+    parser.add_argument('--env', choices=['torcs', 'standin'], default='torcs', help='Collector environment')
+    parser.add_argument('--race-config', default=None,
+                        help='TORCS race config, formatted with {port} and {server} (--env torcs)')
+    parser.add_argument('--noise-scale', type=float, default=None, help='Collector exploration scale')
+    parser.add_argument('--max-steps', type=int, default=1000, help='Steps per episode')
+    parser.add_argument('--send-every', type=int, default=256, help='Transitions per frame')
+    parser.add_argument('--publish-interval', type=int, default=100, help='Updates between weight pushes')
+    parser.add_argument('--updates', type=int, default=None, help='Learner updates')
+    parser.add_argument('--duration', type=float, default=None, help='Learner time limit in seconds')
+    parser.add_argument('--load', action='store_true', help='Start the learner from actormodel.h5/criticmodel.h5')
+    args = parser.parse_args()
+
+    if args.role == 'collector':
+        noise_scale = args.noise_scale if args.noise_scale is not None else 1.0
+        _run_collector(args.host, args.port, args.actor_id, args.env, noise_scale,
+                       args.max_steps, args.send_every, args.actor_id, race_config=args.race_config)
+        return
+
+    import multiprocessing
+
+    weights = ("actormodel.h5", "criticmodel.h5") if args.load else None
+    bind = args.host if args.role == 'learner' else '127.0.0.1'
+    learner = ApexLearner(bind, args.port, publish_interval=args.publish_interval, weights_path=weights)
+    print(f"Learner listening on {bind}:{learner.port}")
+
+    processes = []
+    if args.role == 'local':
+        # Collectors are separate processes, as they would be on other nodes
+        context = multiprocessing.get_context('spawn')
+        for actor_id, scale in enumerate(apex_noise_scales(args.collectors)):
+            process = context.Process(target=_run_collector,
+                                      args=('127.0.0.1', learner.port, actor_id, 'standin', scale,
+                                            args.max_steps, args.send_every, actor_id))
+            process.start()
+            processes.append(process)
+
+    duration = args.duration
+    if args.updates is None and duration is None:
+        duration = 60.0
+    try:
+        learner.run(args.updates, duration)
+    finally:
+        learner.print_stats()
+        learner.close()
+        for process in processes:
+            process.join()
+    print("Finish.")
+
+
+if __name__ == "__main__":
+    main()
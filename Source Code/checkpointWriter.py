@@ -0,0 +1,204 @@
+import copy
+import os
+import threading
+from collections import deque
+
+
+class CheckpointWriter(object):
+    """Serializes checkpoints on a background thread.
+
+    Callers snapshot their weights in memory and submit a write function;
+    the writer runs it against a temporary file and renames that over the
+    target with os.replace, so a crash mid-write never leaves a half-written
+    checkpoint behind. Rolling checkpoints are submitted under a group (one
+    group may span several files, e.g. actor and critic weights) and pruned
+    to the last keep_last groups plus the best-scoring one. Rolling
+    checkpoints left by earlier runs are brought under the same policy
+    with adopt().
+    """
+
+    def __init__(self, keep_last=5, keep_best=True):
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+
+        self.retained = []  # [group, score, paths] of rolling checkpoints, oldest first
+        self.written = 0
+        self.errors = 0
+
+        self._jobs = deque()
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, write_fn, path, score=None, group=None, tmp_suffix='.tmp'):
+        """
+        Queue a checkpoint write
+
+        Args:
+            write_fn: Called with a temporary path to write the snapshot to.
+            path: Final checkpoint path.
+            score: Score used to keep the best rolling checkpoint.
+            group: Rolling checkpoint this file belongs to. Files without a
+                group are never pruned.
+            tmp_suffix: Suffix of the temporary file, for writers that infer
+                the format from the file extension.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("CheckpointWriter is closed")
+
+            # A newer snapshot for the same path supersedes one still queued
+            for job in list(self._jobs):
+                if job[1] == path:
+                    self._jobs.remove(job)
+                    self._pending -= 1
+
+            self._jobs.append((write_fn, path, score, group, tmp_suffix))
+            self._pending += 1
+            self._condition.notify_all()
+        return path
+
+    def adopt(self, paths, group_fn=None, score_fn=None):
+        """
+        Take rolling checkpoints already on disk under the retention policy
+
+        Call before the first submit. The files count as older than anything
+        written from now on, oldest first by modification time, and are
+        pruned with the next rolling checkpoint.
+
+        Args:
+            paths: Existing checkpoint files.
+            group_fn: Maps a path to its group; each file is its own group if None.
+            score_fn: Maps a path to its score, or None where it is unknown.
+        """
+        adopted = []
+        for path in sorted(paths, key=os.path.getmtime):
+            group = group_fn(path) if group_fn is not None else path
+            score = score_fn(path) if score_fn is not None else None
+            entry = next((entry for entry in adopted if entry[0] == group), None)
+            if entry is None:
+                adopted.append([group, score, [path]])
+            else:
+                entry[2].append(path)
+                if score is not None:
+                    entry[1] = score
+        with self._condition:
+            self.retained = adopted + self.retained
+        return len(adopted)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._jobs and not self._closed:
+                    self._condition.wait()
+                if not self._jobs:
+                    return
+                job = self._jobs.popleft()
+
+            try:
+                self._write(*job)
+            finally:
+                with self._condition:
+                    self._pending -= 1
+                    self._condition.notify_all()
+
+    def _write(self, write_fn, path, score, group, tmp_suffix):
+        """Write one checkpoint atomically and apply the retention policy"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = path + tmp_suffix
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.errors += 1
+            print(f"Failed to write checkpoint {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self.written += 1
+        print(f"Model saved to {path}")
+        if group is not None:
+            self._retain(group, path, score)
+
+    def _retain(self, group, path, score):
+        """Keep the last keep_last rolling checkpoints plus the best one"""
+        entry = next((entry for entry in self.retained if entry[0] == group), None)
+        if entry is None:
+            entry = [group, score, []]
+            self.retained.append(entry)
+        if score is not None:
+            entry[1] = score
+        if path not in entry[2]:
+            entry[2].append(path)
+
+        keep = set(entry[0] for entry in self.retained[-self.keep_last:])
+        scored = [entry for entry in self.retained if entry[1] is not None]
+        if self.keep_best and scored:
+            keep.add(max(scored, key=lambda entry: entry[1])[0])
+
+        # Never delete a file that a kept checkpoint still points at
+        keep_paths = set(path for entry in self.retained if entry[0] in keep for path in entry[2])
+        for entry in self.retained:
+            if entry[0] in keep:
+                continue
+            for old_path in entry[2]:
+                if old_path not in keep_paths and os.path.exists(old_path):
+                    os.remove(old_path)
+        self.retained = [entry for entry in self.retained if entry[0] in keep]
+
+    def flush(self):
+        """Block until every queued checkpoint is on disk"""
+        with self._condition:
+            while self._pending > 0:
+                self._condition.wait()
+
+    def close(self):
+        """Write out the queue and stop the writer thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+
+def text_writer(text):
+    """Return a write function for CheckpointWriter that writes text"""
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+    return write
+
+
+def snapshot_state_dict(state_dict):
+    """In-memory copy of a module or optimizer state_dict, tensors included"""
+    return copy.deepcopy(state_dict)
+
+
+class KerasSnapshot(object):
+    """Writes Keras weights from an in-memory copy instead of the live model.
+
+    A clone of the model is built once on the calling thread; each snapshot
+    copies get_weights() into it on the writer thread and saves from there,
+    so training can keep updating the original while the file is written.
+    """
+
+    def __init__(self, model):
+        from tensorflow.keras.models import clone_model
+
+        self.shadow = clone_model(model)
+        self.lock = threading.Lock()
+
+    def writer(self, model):
+        """Snapshot the weights of model now and return a write function for CheckpointWriter"""
+        weights = model.get_weights()
+
+        def write(tmp_path):
+            with self.lock:
+                self.shadow.set_weights(weights)
+                self.shadow.save_weights(tmp_path)
+        return write
@@ -4,7 +4,6 @@ import os
 import matplotlib.pyplot as plt
 from datetime import datetime
 import pickle
-import torch # type: ignore
 
 class DataAnalyzer:
     """
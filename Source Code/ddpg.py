@@ -1,4 +1,3 @@
-from gym_torcs import TorcsEnv
 import random
 import argparse
 import json
@@ -17,10 +16,25 @@ os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
 HIDDEN1_UNITS = 64
 HIDDEN2_UNITS = 32
 
-def create_actor_model(state_size):
+# Training hyperparameters of playGame; a config dict overrides any of them
+DEFAULT_HYPERPARAMETERS = {
+    'buffer_size': 100000,
+    'batch_size': 32,
+    'gamma': 0.99,
+    'tau': 0.001,           # Target Network HyperParameters
+    'lra': 0.0001,          # Learning rate for Actor
+    'lrc': 0.001,           # Learning rate for Critic
+    'explore': 100000,      # Steps over which exploration noise fades out
+    'episode_count': 2000,
+    'max_steps': 100,
+    'hidden1_units': HIDDEN1_UNITS,
+    'hidden2_units': HIDDEN2_UNITS,
+}
+
+def create_actor_model(state_size, hidden1_units=HIDDEN1_UNITS, hidden2_units=HIDDEN2_UNITS):
     S = Input(shape=[state_size])   
-    h0 = Dense(HIDDEN1_UNITS, activation='relu')(S)
-    h1 = Dense(HIDDEN2_UNITS, activation='relu')(h0)
+    h0 = Dense(hidden1_units, activation='relu')(S)
+    h1 = Dense(hidden2_units, activation='relu')(h0)
     Steering = Dense(1,activation='tanh')(h1)  
     Acceleration = Dense(1,activation='sigmoid')(h1)   
     Brake = Dense(1,activation='sigmoid')(h1) 
@@ -28,57 +42,139 @@ def create_actor_model(state_size):
     model = Model(inputs=S,outputs=V)
     return model
 
-def create_critic_model(state_size, action_dim):
+def create_critic_model(state_size, action_dim, hidden1_units=HIDDEN1_UNITS, hidden2_units=HIDDEN2_UNITS):
     S = Input(shape=[state_size])  
     A = Input(shape=[action_dim],name='action2')   
-    w1 = Dense(HIDDEN1_UNITS, activation='relu')(S)
-    a1 = Dense(HIDDEN2_UNITS, activation='linear')(A) 
-    h1 = Dense(HIDDEN2_UNITS, activation='linear')(w1)
+    w1 = Dense(hidden1_units, activation='relu')(S)
+    a1 = Dense(hidden2_units, activation='linear')(A) 
+    h1 = Dense(hidden2_units, activation='linear')(w1)
     h2 = concatenate([h1,a1])    
-    h3 = Dense(HIDDEN2_UNITS, activation='relu')(h2)
+    h3 = Dense(hidden2_units, activation='relu')(h2)
     V = Dense(action_dim,activation='linear')(h3)   
     model = Model(inputs=[S,A],outputs=V)
     adam = Adam(learning_rate=0.001)
     model.compile(loss='mse', optimizer=adam)
     return model
 
+def make_train_step(actor, critic, actor_target, critic_target, gamma, tau, lra, lrc):
+    """Build one graph-compiled DDPG update with persistent optimizers.
+
+    A single call computes the TD targets, updates the critic and the actor,
+    and Polyak-averages both target networks in place.
+    """
+    critic_optimizer = Adam(learning_rate=lrc)
+    actor_optimizer = Adam(learning_rate=lra)
+
+    # Create optimizer slots up front so the traced graph does not make variables
+    for optimizer, model in ((critic_optimizer, critic), (actor_optimizer, actor)):
+        if hasattr(optimizer, 'build'):
+            optimizer.build(model.trainable_variables)
+
+    @tf.function
+    def train_step(states, actions, rewards, new_states, dones):
+        # Targets: r for terminal steps, r + gamma * Q'(s', mu'(s')) otherwise
+        target_q = critic_target([new_states, actor_target(new_states)])
+        y_t = rewards[:, None] + gamma * (1.0 - dones[:, None]) * target_q
+
+        with tf.GradientTape() as tape:
+            q = critic([states, actions], training=True)
+            critic_loss = tf.reduce_mean(tf.square(y_t - q))
+        critic_grads = tape.gradient(critic_loss, critic.trainable_variables)
+        critic_optimizer.apply_gradients(zip(critic_grads, critic.trainable_variables))
+
+        # Ascend Q(s, mu(s)) by descending its negative
+        with tf.GradientTape() as tape:
+            actor_loss = -tf.reduce_mean(critic([states, actor(states, training=True)]))
+        actor_grads = tape.gradient(actor_loss, actor.trainable_variables)
+        actor_optimizer.apply_gradients(zip(actor_grads, actor.trainable_variables))
+
+        # Soft updates of the target variables themselves
+        for target, source in zip(critic_target.weights, critic.weights):
+            target.assign(tau * source + (1.0 - tau) * target)
+        for target, source in zip(actor_target.weights, actor.weights):
+            target.assign(tau * source + (1.0 - tau) * target)
+
+        return critic_loss, actor_loss
+
+    return train_step
+
+def batch_to_arrays(batch):
+    """Split a list of replay tuples into float32 arrays"""
+    states = np.asarray([e[0] for e in batch], dtype=np.float32)
+    actions = np.asarray([e[1] for e in batch], dtype=np.float32)
+    rewards = np.asarray([e[2] for e in batch], dtype=np.float32)
+    new_states = np.asarray([e[3] for e in batch], dtype=np.float32)
+    dones = np.asarray([e[4] for e in batch], dtype=np.float32)
+    return states, actions, rewards, new_states, dones
+
 from ReplayBuffer import ReplayBuffer
-from OU import OU
+from OU import PlayGameNoise
+from numpyActor import NumpyActor
+from learnerThread import LearnerThread
+from updateScheduler import UpdateScheduler
+from checkpointWriter import CheckpointWriter, KerasSnapshot, text_writer
+from lazyImport import timed_import
+import glob
+import threading
 import timeit
 
-OU = OU()       #Ornstein-Uhlenbeck Process
 
-def playGame(train_indicator=1):    # 1 means Train, 0 means simply Run
-    BUFFER_SIZE = 100000
-    BATCH_SIZE = 32
-    GAMMA = 0.99
-    TAU = 0.001     # Target Network HyperParameters
-    LRA = 0.0001    # Learning rate for Actor
-    LRC = 0.001     # Learning rate for Critic
+def playGame(train_indicator=1, inference='keras', async_learning=False, publish_interval=100,
+             updates_per_step=1.0, inline_updates=None, max_banked_updates=1000,
+             config=None, env=None, episode_callback=None):    # 1 means Train, 0 means simply Run
+    # inference: 'keras' runs actor.predict() every tick, 'numpy' runs the
+    # NumpyActor engine, refreshed from the live actor after every update
+    # async_learning: train in a background thread; the control loop only runs
+    # the NumpyActor engine and gets new weights every publish_interval updates
+    # updates_per_step: gradient updates per env step; at most inline_updates of
+    # them run during the step, the rest are banked (up to max_banked_updates)
+    # and run while TORCS resets or relaunches
+    # config: dict overriding DEFAULT_HYPERPARAMETERS
+    # env: environment to drive instead of launching TorcsEnv
+    # episode_callback: called with (episode, total_reward) after every
+    # episode; returning False stops the run
+    unknown = set(config or {}) - set(DEFAULT_HYPERPARAMETERS)
+    if unknown:
+        raise ValueError("Unknown hyperparameters: " + ", ".join(sorted(unknown)))
+    hp = dict(DEFAULT_HYPERPARAMETERS, **(config or {}))
+
+    BUFFER_SIZE = hp['buffer_size']
+    BATCH_SIZE = hp['batch_size']
+    GAMMA = hp['gamma']
+    TAU = hp['tau']     # Target Network HyperParameters
+    LRA = hp['lra']     # Learning rate for Actor
+    LRC = hp['lrc']     # Learning rate for Critic
+    KEEP_CHECKPOINTS = 5    # Rolling per-episode checkpoints kept besides the best one
 
     action_dim = 3  # Steering/Acceleration/Brake
     state_dim = 29  # Number of sensors input
 
     vision = False
 
-    EXPLORE = 100000
-    episode_count = 2000
-    max_steps = 100
+    EXPLORE = hp['explore']
+    episode_count = hp['episode_count']
+    max_steps = hp['max_steps']
     reward = 0
     done = False
     step = 0
-    epsilon = 1
     indicator = 0
+
+    # Ornstein-Uhlenbeck exploration whose scale (epsilon) fades out over EXPLORE steps
+    exploration = PlayGameNoise(1, scale=1.0, final_scale=0.0, decay_steps=EXPLORE)
     
     # Create actor and critic networks
-    actor = create_actor_model(state_dim)
-    actor_target = create_actor_model(state_dim)
-    critic = create_critic_model(state_dim, action_dim)
-    critic_target = create_critic_model(state_dim, action_dim)
+    hidden = (hp['hidden1_units'], hp['hidden2_units'])
+    actor = create_actor_model(state_dim, *hidden)
+    actor_target = create_actor_model(state_dim, *hidden)
+    critic = create_critic_model(state_dim, action_dim, *hidden)
+    critic_target = create_critic_model(state_dim, action_dim, *hidden)
     buff = ReplayBuffer(BUFFER_SIZE)    # Create replay buffer
+    train_step = make_train_step(actor, critic, actor_target, critic_target, GAMMA, TAU, LRA, LRC)
 
     # Generate a Torcs environment
-    env = TorcsEnv(vision=vision, throttle=True, gear_change=False)
+    if env is None:
+        # gym_torcs pulls in gym and the client, which stand-in runs do not need
+        env = timed_import('gym_torcs').TorcsEnv(vision=vision, throttle=True, gear_change=False)
 
     # Now load the weight
     print("Now we load the weight")
@@ -91,34 +187,74 @@ def playGame(train_indicator=1):    # 1 means Train, 0 means simply Run
     except:
         print("Cannot find the weight")
 
+    if async_learning:
+        inference = 'numpy'
+    engine = NumpyActor.from_model(actor) if inference == 'numpy' else None
+    engine_lock = threading.Lock()
+    train_lock = threading.Lock()
+
+    def update():
+        return train_step(*batch_to_arrays(buff.getBatch(BATCH_SIZE)))
+
+    scheduler = UpdateScheduler(update, updates_per_step, inline_updates, max_banked_updates,
+                                ready_fn=lambda: buff.count() > BATCH_SIZE)
+
+    learner = None
+    if async_learning and train_indicator == 1:
+        def publish_actor():
+            weights = actor.get_weights()
+            with engine_lock:
+                engine.set_weights(weights)
+
+        # Paced at updates_per_step updates per env step, as the scheduler would run them
+        learner = LearnerThread(update, publish_actor, publish_interval,
+                                ready_fn=lambda: buff.count() > BATCH_SIZE, lock=train_lock,
+                                step_fn=lambda: step, updates_per_step=updates_per_step).start()
+
+    # Saves snapshot the weights in memory and write them on a background thread;
+    # rolling copies of earlier runs are pruned with this run's, their rewards unknown
+    checkpoints = CheckpointWriter(keep_last=KEEP_CHECKPOINTS)
+    checkpoints.adopt(glob.glob(os.path.join("checkpoints", "*model_ep*.h5")),
+                      group_fn=lambda path: "earlier_" + os.path.basename(path).split("_", 1)[1])
+    if train_indicator:
+        actor_snapshot = KerasSnapshot(actor)
+        critic_snapshot = KerasSnapshot(critic)
+        actor_json = json.dumps(actor.to_json())
+        critic_json = json.dumps(critic.to_json())
+
+    episode_rewards = []
     print("TORCS Experiment Start.")
     for i in range(episode_count):
 
         print("Episode : " + str(i) + " Replay Buffer " + str(buff.count()))
 
+        # Banked updates run while TORCS resets
         if np.mod(i, 3) == 0:
-            ob = env.reset(relaunch=True)   # relaunch TORCS every 3 episode because of the memory leak error
+            ob = scheduler.during(env.reset, relaunch=True)   # relaunch TORCS every 3 episode because of the memory leak error
         else:
-            ob = env.reset()
+            ob = scheduler.during(env.reset)
+        if engine is not None and learner is None:
+            engine.load_weights_from_model(actor)
 
         s_t = np.hstack((ob.angle, ob.track, ob.trackPos, ob.speedX, ob.speedY, ob.speedZ, ob.wheelSpinVel/100.0, ob.rpm))
         print(s_t)
+        exploration.reset()
         total_reward = 0.
         for j in range(max_steps):
             start_time = time.process_time()
             loss = 0 
-            epsilon -= 1.0 / EXPLORE
             a_t = np.zeros([1, action_dim])
             noise_t = np.zeros([1, action_dim])
             
             # Get action from actor network
-            a_t_original = actor.predict(s_t.reshape(1, s_t.shape[0]))
+            if engine is not None:
+                with engine_lock:
+                    a_t_original = engine.predict(s_t).copy()
+            else:
+                a_t_original = actor.predict(s_t.reshape(1, s_t.shape[0]))
             
             # Add exploration noise
-            # Fix for DeprecationWarning - extract scalar values properly
-            noise_t[0][0] = train_indicator * max(epsilon, 0) * OU.function(float(a_t_original[0][0]), 0.0, 0.60, 0.30)
-            noise_t[0][1] = train_indicator * max(epsilon, 0) * OU.function(float(a_t_original[0][1]), 0.5, 1.00, 0.10)
-            noise_t[0][2] = train_indicator * max(epsilon, 0) * OU.function(float(a_t_original[0][2]), -0.1, 1.00, 0.05)
+            noise_t[0] = train_indicator * exploration.perturb(np.reshape(a_t_original, (1, action_dim)))[0]
 
             # Apply noise to action
             a_t[0][0] = (a_t_original[0][0] + noise_t[0][0])/4
@@ -134,73 +270,23 @@ def playGame(train_indicator=1):    # 1 means Train, 0 means simply Run
             buff.add(s_t, a_t[0], r_t, s_t1, done)
             
             # Only train if we have enough samples in buffer
-            if buff.count() > BATCH_SIZE:
-                # Do the batch update
-                batch = buff.getBatch(BATCH_SIZE)
-                print(len(batch))
-                
-                # Extract batch components
-                states = np.asarray([e[0] for e in batch])
-                actions = np.asarray([e[1] for e in batch])
-                rewards = np.asarray([e[2] for e in batch])
-                new_states = np.asarray([e[3] for e in batch])
-                dones = np.asarray([e[4] for e in batch])
-                y_t = np.asarray([e[1] for e in batch])
-                
-                # Calculate target Q values
-                target_q_values = critic_target.predict([new_states, actor_target.predict(new_states)])
-                
-                # Update target values with rewards and discounted future rewards
-                for k in range(len(batch)):
-                    if dones[k]:
-                        y_t[k] = rewards[k]
-                    else:
-                        y_t[k] = rewards[k] + GAMMA * target_q_values[k]
-                
-                # Train the networks
-                if (train_indicator == 1):
-                    with tf.GradientTape() as tape:
-                        # Train critic network
-                        critic_loss = critic.train_on_batch([states, actions], y_t)
-                        loss = tf.convert_to_tensor(critic_loss)
-                        
-                        # Get actions from actor for gradient calculation
-                        states_tensor = tf.convert_to_tensor(states, dtype=tf.float32)
-                        a_for_grad = actor(states_tensor)
-                        
-                        # Calculate critic output for policy gradient
-                        # IMPORTANT FIX: Make sure both inputs are tensors
-                        qsa = critic([states_tensor, a_for_grad])
-                    
-                    # Calculate gradients
-                    grads = tape.gradient(qsa, actor.trainable_weights)
-                    
-                    # Apply gradients to actor network
-                    opt = Adam(learning_rate=0.001)
-                    opt.apply_gradients(zip(grads, actor.trainable_weights))
-                    
-                    # Update target networks with soft updates
-                    for i in range(len(critic.trainable_weights)):
-                        critic_target.trainable_weights[i] = TAU * critic.trainable_weights[i] + (1 - TAU) * critic_target.trainable_weights[i]
-                    
-                    for i in range(len(actor.trainable_weights)):
-                        actor_target.trainable_weights[i] = TAU * actor.trainable_weights[i] + (1 - TAU) * actor_target.trainable_weights[i]
-                    
-                    # Update total reward
-                    total_reward += r_t
-                    
-                    # Update state
-                    s_t = s_t1
-                    
-                    # Print timing info
-                    print(time.process_time() - start_time, 'time')
-            
+            result = None
+            if learner is None and train_indicator == 1:
+                # Batch updates run as compiled graph calls
+                result = scheduler.step()
+            if result is not None:
+                critic_loss, actor_loss = result
+                loss = float(critic_loss)
+                if engine is not None:
+                    engine.load_weights_from_model(actor)
+
+                # Print timing info
+                print(time.process_time() - start_time, 'time')
                 print("Episode", i, "Step", step, "Action", a_t, "Reward", r_t, "Loss", loss)
-            
-            else:
-                # If not enough samples, just update state
-                s_t = s_t1
-                total_reward += r_t
+
+            # Update total reward and state
+            total_reward += r_t
+            s_t = s_t1
             
             step += 1
             if done:
@@ -210,23 +296,126 @@ def playGame(train_indicator=1):    # 1 means Train, 0 means simply Run
         if np.mod(i, 3) == 0:
             if (train_indicator):
                 print("Now we save model")
-                
+
+                # Never snapshot halfway through a background update
+                with train_lock:
+                    write_actor = actor_snapshot.writer(actor)
+                    write_critic = critic_snapshot.writer(critic)
+
                 # Save actor model
-                actor.save_weights("actormodel.h5", overwrite=True)
-                with open("actormodel.json", "w") as outfile:
-                    json.dump(actor.to_json(), outfile)
+                checkpoints.submit(write_actor, "actormodel.h5", tmp_suffix='.tmp.weights.h5')
+                checkpoints.submit(text_writer(actor_json), "actormodel.json")
 
                 # Save critic model
-                critic.save_weights("criticmodel.h5", overwrite=True)
-                with open("criticmodel.json", "w") as outfile:
-                    json.dump(critic.to_json(), outfile)
+                checkpoints.submit(write_critic, "criticmodel.h5", tmp_suffix='.tmp.weights.h5')
+                checkpoints.submit(text_writer(critic_json), "criticmodel.json")
+
+                # Rolling copies, pruned to the last few and the best episode
+                group = "ep" + str(i)
+                checkpoints.submit(write_actor, os.path.join("checkpoints", "actormodel_" + group + ".h5"),
+                                   score=total_reward, group=group, tmp_suffix='.tmp.weights.h5')
+                checkpoints.submit(write_critic, os.path.join("checkpoints", "criticmodel_" + group + ".h5"),
+                                   score=total_reward, group=group, tmp_suffix='.tmp.weights.h5')
 
         print("TOTAL REWARD @ " + str(i) + "-th Episode  : Reward " + str(total_reward))
         print("Total Step: " + str(step))
+        if learner is not None:
+            print("Learner updates: " + str(learner.updates) + ", published: " + str(learner.publications))
+        elif train_indicator == 1:
+            print("Updates: " + str(scheduler.updates) + ", banked: " + str(scheduler.banked) +
+                  ", per step: " + "%.2f" % scheduler.replay_ratio())
         print("")
 
+        episode_rewards.append(total_reward)
+        if episode_callback is not None and episode_callback(i, total_reward) is False:
+            print("Stopped after episode " + str(i))
+            break
+
+    if learner is not None:
+        learner.stop()
+    checkpoints.close()
     env.end()  # This is for shutting down TORCS
     print("Finish.")
+    return episode_rewards
+
+def benchmark_train_step(n_steps=200, batch_size=32, state_dim=29, action_dim=3):
+    """Compare steps per second of the compiled train step against the old eager loop body"""
+    GAMMA, TAU, LRA, LRC = 0.99, 0.001, 0.0001, 0.001
+
+    actor = create_actor_model(state_dim)
+    actor_target = create_actor_model(state_dim)
+    critic = create_critic_model(state_dim, action_dim)
+    critic_target = create_critic_model(state_dim, action_dim)
+
+    buff = ReplayBuffer(10000)
+    for _ in range(10000):
+        buff.add(np.random.rand(state_dim), np.random.rand(action_dim), np.random.rand(),
+                 np.random.rand(state_dim), np.random.rand() < 0.01)
+
+    def legacy_step(batch):
+        # The update as playGame used to run it, one eager call at a time
+        states, actions, rewards, new_states, dones = batch_to_arrays(batch)
+        y_t = actions.copy()
+        target_q_values = critic_target.predict([new_states, actor_target.predict(new_states, verbose=0)], verbose=0)
+        for k in range(len(batch)):
+            if dones[k]:
+                y_t[k] = rewards[k]
+            else:
+                y_t[k] = rewards[k] + GAMMA * target_q_values[k]
+        with tf.GradientTape() as tape:
+            critic.train_on_batch([states, actions], y_t)
+            states_tensor = tf.convert_to_tensor(states, dtype=tf.float32)
+            qsa = critic([states_tensor, actor(states_tensor)])
+        grads = tape.gradient(qsa, actor.trainable_weights)
+        opt = Adam(learning_rate=0.001)
+        opt.apply_gradients(zip(grads, actor.trainable_weights))
+        critic_weights = list(critic_target.trainable_weights)
+        for w in range(len(critic.trainable_weights)):
+            critic_weights[w] = TAU * critic.trainable_weights[w] + (1 - TAU) * critic_weights[w]
+        actor_weights = list(actor_target.trainable_weights)
+        for w in range(len(actor.trainable_weights)):
+            actor_weights[w] = TAU * actor.trainable_weights[w] + (1 - TAU) * actor_weights[w]
+
+    train_step = make_train_step(actor, critic, actor_target, critic_target, GAMMA, TAU, LRA, LRC)
+
+    def compiled_step(batch):
+        train_step(*batch_to_arrays(batch))
+
+    results = {}
+    for name, step_fn in (("eager loop", legacy_step), ("compiled", compiled_step)):
+        step_fn(buff.getBatch(batch_size))  # warm up / trace
+        start = time.perf_counter()
+        for _ in range(n_steps):
+            step_fn(buff.getBatch(batch_size))
+        elapsed = time.perf_counter() - start
+        results[name] = n_steps / elapsed
+        print(f"{name:>10}: {results[name]:8.1f} steps/s")
+
+    print(f"Speedup: {results['compiled'] / results['eager loop']:.1f}x")
+    return results
 
 if __name__ == "__main__":
-    playGame()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='DDPG training for TORCS')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark the train step instead of playing')
+    parser.add_argument('--steps', type=int, default=200, help='Train steps per benchmark run')
+    parser.add_argument('--inference', choices=['keras', 'numpy'], default='keras', help='Actor inference engine')
+    parser.add_argument('--async-learning', action='store_true', help='Train in a background learner thread')
+    parser.add_argument('--publish-interval', type=int, default=100, help='Learner updates between actor weight publications')
+    parser.add_argument('--updates-per-step', type=float, default=1.0, help='Gradient updates per env step')
+    parser.add_argument('--inline-updates', type=int, default=None, help='Most updates run inside a step; the rest wait for reset downtime')
+    parser.add_argument('--max-banked-updates', type=int, default=1000, help='Cap on deferred updates')
+    parser.add_argument('--config', default=None, help='JSON file overriding DEFAULT_HYPERPARAMETERS')
+    args = parser.parse_args()
+
+    config = None
+    if args.config is not None:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    if args.benchmark:
+        benchmark_train_step(n_steps=args.steps)
+    else:
+        playGame(inference=args.inference, async_learning=args.async_learning,
+                 publish_interval=args.publish_interval, updates_per_step=args.updates_per_step,
+                 inline_updates=args.inline_updates, max_banked_updates=args.max_banked_updates,
+                 config=config)
\ No newline at end of file
@@ -0,0 +1,258 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import torch # type: ignore
+import torch.nn.functional as F # type: ignore
+
+from learningAgent import ActorNetwork, make_adam
+from stateProcessor import StateProcessor
+from telemetryImporter import episode_boundaries, load_telemetry_arrays
+
+STUDENT_MODEL_PATH = os.path.join('models', 'student_model.pt')
+STUDENT_ACTOR_PATH = os.path.join('models', 'student_actor.npz')
+
+
+def load_actor(model_path):
+    """Build an ActorNetwork from a checkpoint, sized after its weights"""
+    actor_state = torch.load(model_path)['actor_state_dict']
+    hidden_size, state_size = actor_state['fc1.weight'].shape
+    actor = ActorNetwork(state_size, actor_state['fc3.weight'].shape[0], hidden_size)
+    actor.load_state_dict(actor_state)
+    return actor.eval()
+
+
+def load_corpus(telemetry=None, states_path=None):
+    """
+    Recorded states to distill on
+
+    Args:
+        telemetry: Telemetry CSV files, processed exactly as the driver would.
+        states_path: .npy array of processed states, or an .npz holding one
+            under 'states' (e.g. a dump of ReplayBuffer.states).
+
+    Returns:
+        (N, state_size) float32 array.
+    """
+    corpora = []
+    if telemetry:
+        columns = load_telemetry_arrays(telemetry)
+        if columns is not None:
+            corpora.append(StateProcessor().process_batch(columns, episode_starts=episode_boundaries(columns)))
+    if states_path:
+        states = np.load(states_path)
+        if isinstance(states, np.lib.npyio.NpzFile):
+            states = states['states']
+        corpora.append(np.asarray(states, dtype=np.float32))
+
+    if not corpora:
+        raise ValueError("No states to distill on")
+    return np.concatenate(corpora)
+
+
+def distill(teacher, states, hidden_size=32, epochs=20, batch_size=4096, lr=1e-3,
+            state_noise=0.01, holdout=0.1, seed=0):
+    """
+    Train a smaller actor to reproduce the teacher's actions
+
+    The teacher labels the whole corpus in one pass; the student is then fit
+    to those actions with MSE over large shuffled minibatches. Each epoch
+    also labels a noisy copy of the batch so the student sees states just
+    off the recorded racing line, where its own mistakes will take it.
+
+    Args:
+        teacher: Trained ActorNetwork.
+        states: (N, state_size) corpus of processed states.
+        hidden_size: Width of the student's hidden layers.
+        epochs: Passes over the training states.
+        batch_size: States per gradient step.
+        lr: Student learning rate.
+        state_noise: Standard deviation of the Gaussian state perturbation.
+        holdout: Fraction of states kept back for evaluation.
+        seed: Seed for the split, shuffling and student initialization.
+
+    Returns:
+        (student, held-out states)
+    """
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+
+    states = torch.from_numpy(states[rng.permutation(len(states))])
+    num_holdout = int(len(states) * holdout)
+    eval_states, train_states = states[:num_holdout], states[num_holdout:]
+
+    teacher = teacher.eval()
+    with torch.no_grad():
+        targets = teacher(train_states)
+
+    student = ActorNetwork(teacher.fc1.in_features, teacher.fc3.out_features, hidden_size)
+    optimizer = make_adam(student.parameters(), lr)
+
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        order = torch.from_numpy(rng.permutation(len(train_states)))
+        total_loss = torch.zeros(())
+        for first in range(0, len(order), batch_size):
+            indices = order[first:first + batch_size]
+            batch, batch_targets = train_states[indices], targets[indices]
+
+            # Noisy copies of the batch, labelled by the teacher
+            if state_noise > 0:
+                noisy = batch + state_noise * torch.randn_like(batch)
+                with torch.no_grad():
+                    noisy_targets = teacher(noisy)
+                batch = torch.cat([batch, noisy])
+                batch_targets = torch.cat([batch_targets, noisy_targets])
+
+            loss = F.mse_loss(student(batch), batch_targets)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.detach()
+
+        batches = (len(order) + batch_size - 1) // batch_size
+        print(f"Epoch {epoch + 1}/{epochs}: loss {total_loss.item() / batches:.6f} "
+              f"({time.perf_counter() - start:.1f}s)")
+
+    return student.eval(), eval_states.numpy()
+
+
+def save_student(student, model_path=STUDENT_MODEL_PATH, actor_path=STUDENT_ACTOR_PATH):
+    """
+    Write the student as an actor-only checkpoint and as a race actor
+
+    The checkpoint loads with DDPGAgent.load_model and RacingAI; the .npz
+    runs with racePolicy.RacePolicy without torch.
+    """
+    directory = os.path.dirname(model_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    torch.save({'actor_state_dict': student.state_dict(), 'hidden_size': student.fc1.out_features}, model_path)
+    student.to_numpy().save_npz(actor_path)
+    print(f"Student saved to {model_path} and {actor_path}")
+
+
+def lap_times(paths):
+    """
+    Completed lap times recorded in telemetry logs
+
+    A lap ends where curLapTime falls back within an episode; the last value
+    before the drop is the lap time.
+    """
+    columns = load_telemetry_arrays(paths)
+    if columns is None:
+        return np.zeros(0, dtype=np.float32)
+
+    lap_time = columns['curLapTime']
+    same_episode = ~episode_boundaries(columns)[1:]
+    finished = same_episode & (lap_time[1:] < lap_time[:-1])
+    return lap_time[:-1][finished]
+
+
+def _time_per_call(predict, states, calls):
+    """Median seconds per single-state action"""
+    samples = []
+    for i in range(calls):
+        state = states[i % len(states)]
+        start = time.perf_counter()
+        predict(state)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def compare(teacher, student, states, calls=2000, teacher_logs=None, student_logs=None):
+    """
+    Side-by-side report of the teacher and the student
+
+    Action error is measured on the held-out states. Latency is timed on the
+    two serving paths a race would use: the torch InferenceSession and the
+    torch-free NumpyActor. Lap times come from telemetry recorded while each
+    actor drove, when given.
+    """
+    from inferenceSession import InferenceSession
+
+    with torch.no_grad():
+        batch = torch.from_numpy(states)
+        errors = (teacher(batch) - student(batch)).abs().numpy()
+
+    report = {'states': len(states),
+              'mean_abs_error': errors.mean(axis=0),
+              'max_abs_error': errors.max(axis=0)}
+    for name, actor, logs in (('teacher', teacher, teacher_logs), ('student', student, student_logs)):
+        session = InferenceSession(actor, states.shape[1])
+        engine = actor.to_numpy()
+        _time_per_call(session.run, states, 50)
+        _time_per_call(engine.predict, states, 50)
+        report[name] = {
+            'parameters': sum(p.numel() for p in actor.parameters()),
+            'torch_us': _time_per_call(session.run, states, calls) * 1e6,
+            'numpy_us': _time_per_call(engine.predict, states, calls) * 1e6,
+            'laps': lap_times(logs) if logs else None,
+        }
+    return report
+
+
+def print_report(report):
+    """Print a distillation report"""
+    names = ['steering', 'acceleration', 'brake']
+    print(f"Compared on {report['states']} held-out states")
+    for i, name in enumerate(names[:len(report['mean_abs_error'])]):
+        print(f"  {name:<13} mean |error| {report['mean_abs_error'][i]:.5f}   "
+              f"max |error| {report['max_abs_error'][i]:.5f}")
+
+    print(f"  {'':<22}{'teacher':>12}{'student':>12}")
+    rows = [('parameters', 'parameters', '{:12d}'),
+            ('torch latency (us)', 'torch_us', '{:12.1f}'),
+            ('numpy latency (us)', 'numpy_us', '{:12.1f}')]
+    for label, key, fmt in rows:
+        print(f"  {label:<22}" + ''.join(fmt.format(report[name][key]) for name in ('teacher', 'student')))
+
+    laps = [report[name]['laps'] for name in ('teacher', 'student')]
+    if any(lap is not None for lap in laps):
+        cells = []
+        for lap in laps:
+            if lap is None or len(lap) == 0:
+                cells.append(f"{'-':>12}")
+            else:
+                cells.append(f"{lap.min():12.2f}")
+        print(f"  {'best lap (s)':<22}" + ''.join(cells))
+        cells = [f"{len(lap) if lap is not None else 0:12d}" for lap in laps]
+        print(f"  {'laps recorded':<22}" + ''.join(cells))
+
+
+def main():
+    """Distill a trained actor into a smaller one and report how they compare"""
+    parser = argparse.ArgumentParser(description='Distill the trained actor into a compact student')
+    parser.add_argument('--model', default=os.path.join('models', 'best_model.pt'), help='Teacher checkpoint')
+    parser.add_argument('--telemetry', nargs='*', default=None, help='Telemetry CSV files [logs/telemetry_*.csv]')
+    parser.add_argument('--states', default=None, help='.npy/.npz of processed states, e.g. a replay dump')
+    parser.add_argument('--hidden-size', type=int, default=32, help='Student hidden layer width')
+    parser.add_argument('--epochs', type=int, default=20, help='Passes over the corpus')
+    parser.add_argument('--batch-size', type=int, default=4096, help='States per gradient step')
+    parser.add_argument('--lr', type=float, default=1e-3, help='Student learning rate')
+    parser.add_argument('--state-noise', type=float, default=0.01, help='Std of the state perturbation')
+    parser.add_argument('--out', default=STUDENT_MODEL_PATH, help='Student checkpoint')
+    parser.add_argument('--actor-out', default=STUDENT_ACTOR_PATH, help='Student race actor (.npz)')
+    parser.add_argument('--teacher-logs', nargs='*', default=None, help='Telemetry of the teacher racing')
+    parser.add_argument('--student-logs', nargs='*', default=None, help='Telemetry of the student racing')
+    parser.add_argument('--calls', type=int, default=2000, help='Timed single-state calls per actor')
+    args = parser.parse_args()
+
+    telemetry = args.telemetry
+    if telemetry is None and args.states is None:
+        telemetry = sorted(glob.glob(os.path.join('logs', 'telemetry_*.csv')))
+    states = load_corpus(telemetry, args.states)
+    print(f"Distilling on {len(states)} states")
+
+    teacher = load_actor(args.model)
+    student, eval_states = distill(teacher, states, hidden_size=args.hidden_size, epochs=args.epochs,
+                                   batch_size=args.batch_size, lr=args.lr, state_noise=args.state_noise)
+    save_student(student, args.out, args.actor_out)
+
+    print_report(compare(teacher, student, eval_states, args.calls, args.teacher_logs, args.student_logs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import torch # type: ignore
+import torch.distributed as dist # type: ignore
+import torch.multiprocessing as mp # type: ignore
+
+from learningAgent import DDPGAgent, StateProcessor, checkpoint_hidden_size
+from telemetryImporter import build_transitions, load_telemetry_arrays
+
+
+class GradientAllReduce(object):
+    """Gradient hook for DDPGAgent that averages gradients across learners.
+
+    The gradients of a parameter list are packed into one flat buffer so
+    each update costs a single all-reduce per network instead of one per
+    tensor.
+    """
+
+    def __init__(self, world_size):
+        self.world_size = world_size
+        self._buffers = {}
+
+    def __call__(self, params):
+        grads = [p.grad for p in params if p.grad is not None]
+        numel = sum(g.numel() for g in grads)
+        key = id(params)
+        if key not in self._buffers or self._buffers[key].numel() != numel:
+            self._buffers[key] = torch.empty(numel, dtype=grads[0].dtype)
+        flat = self._buffers[key]
+
+        offset = 0
+        for g in grads:
+            flat[offset:offset + g.numel()].copy_(g.reshape(-1))
+            offset += g.numel()
+
+        dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+        flat.div_(self.world_size)
+
+        offset = 0
+        for g in grads:
+            g.copy_(flat[offset:offset + g.numel()].view_as(g))
+            offset += g.numel()
+
+
+def _agent_params(agent):
+    """Every parameter the learners must agree on, targets included"""
+    return [p for net in (agent.actor, agent.critic, agent.actor_target, agent.critic_target)
+            for p in net.parameters()]
+
+
+def broadcast_agent(agent, src=0):
+    """Overwrite every learner's networks with those of rank src"""
+    params = _agent_params(agent)
+    with torch.no_grad():
+        flat = torch.cat([p.reshape(-1) for p in params])
+        dist.broadcast(flat, src)
+        offset = 0
+        for p in params:
+            p.copy_(flat[offset:offset + p.numel()].view_as(p))
+            offset += p.numel()
+
+
+def parameter_divergence(agent):
+    """Largest difference of any parameter between learners; 0 when in sync"""
+    with torch.no_grad():
+        flat = torch.cat([p.reshape(-1) for p in _agent_params(agent)])
+        high, low = flat.clone(), flat.clone()
+        dist.all_reduce(high, op=dist.ReduceOp.MAX)
+        dist.all_reduce(low, op=dist.ReduceOp.MIN)
+    return (high - low).max().item()
+
+
+def shard_paths(paths, rank, world_size):
+    """Telemetry files of one learner, so each file is parsed only once
+
+    Whole files go to the learner with the fewest bytes so far, largest
+    first, which keeps the shards close in size and episodes whole.
+    """
+    loads = [0] * world_size
+    owner = {}
+    for path in sorted(paths, key=os.path.getsize, reverse=True):
+        learner = loads.index(min(loads))
+        owner[path] = learner
+        loads[learner] += os.path.getsize(path)
+    return [path for path in paths if owner[path] == rank]
+
+
+def _learner(rank, world_size, port, config):
+    """Body of one learner process"""
+    dist.init_process_group('gloo', init_method=f"tcp://127.0.0.1:{port}",
+                            rank=rank, world_size=world_size)
+    torch.set_num_threads(config['threads'])
+
+    # Same initial weights everywhere, different replay samples per learner
+    torch.manual_seed(config['seed'])
+    np.random.seed(config['seed'] + rank)
+
+    agent = DDPGAgent(state_size=StateProcessor().get_state_dim(), action_size=3,
+                      hidden_size=config['hidden_size'], batch_size=config['batch_size'],
+                      buffer_size=config['buffer_size'])
+    # Every learner loads the checkpoint, so Adam moments and epsilon match too
+    if config['model']:
+        agent.load_model(config['model'])
+    broadcast_agent(agent)
+
+    # Each learner parses and replays only its own shard of the logs
+    columns = load_telemetry_arrays(shard_paths(config['paths'], rank, world_size))
+    states, actions, rewards, next_states, dones, dist_from_start = build_transitions(columns)
+    agent.replay_buffer.add_batch(states, actions, rewards, next_states, dones, dist_from_start)
+    # Every learner has to take part in every all-reduce
+    if len(agent.replay_buffer) < agent.batch_size:
+        raise RuntimeError(f"Learner {rank} has {len(agent.replay_buffer)} transitions, "
+                           f"fewer than a batch of {agent.batch_size}")
+
+    agent.gradient_hook = GradientAllReduce(world_size)
+    dist.barrier()
+
+    start = time.perf_counter()
+    last_report = start
+    for update in range(1, config['updates'] + 1):
+        agent.train()
+
+        # Averaged gradients keep the learners identical; a periodic
+        # broadcast guards against any floating-point drift
+        if config['sync_interval'] and update % config['sync_interval'] == 0:
+            broadcast_agent(agent)
+
+        if rank == 0 and update % config['report_every'] == 0:
+            now = time.perf_counter()
+            rate = config['report_every'] / (now - last_report)
+            print(f"Updates: {update}, {rate:.1f} updates/s, "
+                  f"{rate * world_size * agent.batch_size:.0f} samples/s across {world_size} learners")
+            last_report = now
+
+    elapsed = time.perf_counter() - start
+    divergence = parameter_divergence(agent)
+    if rank == 0:
+        updates_per_second = config['updates'] / max(elapsed, 1e-9)
+        print(f"Ran {config['updates']} updates in {elapsed:.1f}s ({updates_per_second:.1f} updates/s, "
+              f"{updates_per_second * world_size * agent.batch_size:.0f} samples/s)")
+        print(f"Largest parameter difference between learners: {divergence:.3g}")
+        agent.save_model(0, 0.0, filepath=config['save'])
+    agent.close()
+    dist.destroy_process_group()
+
+
+def run_data_parallel(paths, learners=2, updates=10000, model=None, save=None, hidden_size=None,
+                      batch_size=64, buffer_size=1000000, threads=None, sync_interval=1000,
+                      report_every=1000, port=29500, seed=0):
+    """
+    Train a DDPGAgent offline with data-parallel learner processes on the CPU
+
+    Every learner holds a full copy of the networks and replays its own shard
+    of the telemetry files, so there must be at least one file per learner. Actor and critic gradients are averaged with gloo
+    all-reduce before each optimizer step, so all copies, target networks
+    included, take identical steps. Each update therefore learns from
+    learners * batch_size samples.
+
+    Args:
+        paths: Telemetry CSV files to replay.
+        learners: Number of learner processes.
+        updates: Gradient updates per learner.
+        model: Checkpoint to start from, loaded by every learner.
+        save: Where rank 0 saves the trained model.
+        hidden_size: Hidden layer width of the networks. Defaults to that of
+            model, or 128 without one.
+        batch_size: Batch size of each learner.
+        buffer_size: Replay capacity of each learner.
+        threads: Intra-op threads per learner. Defaults to an even share of the cores.
+        sync_interval: Broadcast rank 0's weights every this many updates; 0 disables it.
+        report_every: Print throughput every this many updates.
+        port: Local TCP port for the process group rendezvous.
+        seed: Seed for the shared initial weights.
+    """
+    paths = list(paths)
+    if len(paths) < learners:
+        raise ValueError(f"{learners} learners need at least {learners} telemetry files, got {len(paths)}")
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // learners)
+    if hidden_size is None:
+        hidden_size = (checkpoint_hidden_size(model) if model else None) or 128
+
+    config = {'paths': paths, 'updates': updates, 'model': model, 'save': save,
+              'hidden_size': hidden_size, 'batch_size': batch_size, 'buffer_size': buffer_size,
+              'threads': threads, 'sync_interval': sync_interval, 'report_every': report_every,
+              'seed': seed}
+    mp.spawn(_learner, args=(learners, port, config), nprocs=learners, join=True)
+
+
+def main():
+    """Data-parallel offline training from telemetry logs"""
+    parser = argparse.ArgumentParser(description='Data-parallel DDPG learners on the CPU (gloo)')
+    parser.add_argument('paths', nargs='*', help='Telemetry CSV files [logs/telemetry_*.csv]')
+    parser.add_argument('--learners', type=int, default=2, help='Number of learner processes')
+    parser.add_argument('--updates', type=int, default=10000, help='Gradient updates per learner')
+    parser.add_argument('--model', default=None, help='Checkpoint to start from')
+    parser.add_argument('--save', default=None, help='Where to save the trained model')
+    parser.add_argument('--hidden-size', type=int, default=None, help='Hidden layer width [that of --model, else 128]')
+    parser.add_argument('--batch-size', type=int, default=64, help='Batch size of each learner')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads per learner')
+    parser.add_argument('--sync-interval', type=int, default=1000, help='Weight broadcast interval (0 disables)')
+    parser.add_argument('--port', type=int, default=29500, help='Rendezvous port')
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join('logs', 'telemetry_*.csv')))
+    if not paths:
+        raise SystemExit("No telemetry files found.")
+
+    run_data_parallel(paths, learners=args.learners, updates=args.updates, model=args.model, save=args.save,
+                      hidden_size=args.hidden_size, batch_size=args.batch_size, threads=args.threads, sync_interval=args.sync_interval,
+                      port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,25 @@ import logging
 import os
 import datetime
 import math
+import time
 import numpy as np
-import learningAgent
 import gearControl
+from lazyImport import timed_import
 
 class Driver(object):
     '''
     A learning-based driver for the TORCS simulator that learns from experience
     '''
 
-    def __init__(self, stage):
-        '''Constructor'''
+    def __init__(self, stage, weights_channel=None):
+        '''Constructor
+
+        weights_channel names a shared memory channel a local learner publishes
+        actor weights to (DDPGAgent.share_weights); it defaults to the
+        TORCS_WEIGHTS_CHANNEL environment variable. The driver then acts with
+        the newest published weights instead of the saved model and leaves
+        training to the publisher.
+        '''
         self.WARM_UP = 0
         self.QUALIFYING = 1
         self.RACE = 2
@@ -33,11 +41,28 @@ class Driver(object):
         
         # Load existing model if available or create new one
         model_path = self._find_latest_model()
-        self.ai = learningAgent.RacingAI(load_model_path=model_path)
+        race_actor_path = os.path.join('models', 'race_actor.npz')
+        if weights_channel is None:
+            weights_channel = os.environ.get('TORCS_WEIGHTS_CHANNEL')
+        self.weights_channel = weights_channel
+        if self.stage == self.RACE and weights_channel is None and self._is_current(race_actor_path, model_path):
+            # Race mode only needs inference, which the exported actor serves without torch
+            self.ai = timed_import('racePolicy').RacePolicy(race_actor_path)
+            model_path = race_actor_path
+        else:
+            # Outside race mode a background learner trains while the car drives,
+            # unless the weights come from a learner in another process
+            self.ai = timed_import('learningAgent').RacingAI(
+                load_model_path=model_path,
+                async_learning=self.stage != self.RACE and weights_channel is None)
         
         # Set training mode based on stage
         self.ai.set_training_mode(self.stage != self.RACE)  # Train in non-race mode
         
+        if weights_channel is not None:
+            self.ai.subscribe_weights(weights_channel)
+            model_path = f"shared weights '{weights_channel}'"
+        
         # Initialize gear controller
         self.gear_controller = gearControl.GearController()
         
@@ -83,6 +108,12 @@ class Driver(object):
         
         return None  # No model found
     
+    def _is_current(self, path, model_path):
+        """Check that an exported file exists and is not older than the model it came from"""
+        if not os.path.exists(path):
+            return False
+        return model_path is None or os.path.getmtime(path) >= os.path.getmtime(model_path)
+    
     def setup_logging(self):
         '''Setup logging system for telemetry data'''
         # Create logs directory if it doesn't exist
@@ -195,6 +226,7 @@ class Driver(object):
         '''
         Main driving function called every update
         '''
+        tick_start = time.perf_counter()
         self.state.setFromMsg(msg)
         self.episode_step += 1
         
@@ -213,8 +245,12 @@ class Driver(object):
         if self.needs_recovery():
             return self.recovery_mode()
         
+        # Pick up weights published since the last tick; unchanged weights cost one read
+        if self.weights_channel is not None:
+            self.ai.refresh_weights()
+        
         # Get action from neural network
-        steering, accel, brake = self.ai.get_action(self.state)
+        steering, accel, brake = self.ai.get_action(self.state, tick_start=tick_start)
         
         # Apply the actions
         self.control.setSteer(steering)
@@ -286,10 +322,10 @@ class Driver(object):
         self.stuck_counter = 0
         self.prev_distance = 0
         
-        # Periodically save AI model
-        if self.ai.episode_count % 5 == 0:
-            # Save current model state
-            self.ai.agent.save_model(self.ai.episode_count, self.ai.episode_reward)
+        # Periodically save AI model (episodes are only counted while training)
+        if self.ai.training_mode and self.ai.episode_count % 5 == 0:
+            # Save current model state; episode_end already reset episode_reward
+            self.ai.agent.save_model(self.ai.episode_count, self.ai.agent.reward_history[-1])
     
     def _track_lap_performance(self):
         """Track lap times and performance metrics"""
@@ -410,6 +446,9 @@ class Driver(object):
             
             # Save results data
             self.ai.save_results()
+        
+        # Stop background workers
+        self.ai.close()
             
         print(f"Performance summary:")
         print(f"Episodes completed: {self.ai.episode_count}")
@@ -0,0 +1,350 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+CACHE_PATH = os.path.join('models', 'eval_cache.json')
+LEADERBOARD_PATH = os.path.join('models', 'leaderboard.csv')
+
+# Bump when the evaluation itself changes, so cached scores are not reused
+EVAL_VERSION = 1
+
+
+class ServerState(object):
+    """carState-style getters over the raw dict a TORCS server sends each step"""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def _get(self, key):
+        return self.raw.get(key)
+
+    def getSpeedX(self): return self._get('speedX')
+    def getSpeedY(self): return self._get('speedY')
+    def getSpeedZ(self): return self._get('speedZ')
+    def getAngle(self): return self._get('angle')
+    def getTrackPos(self): return self._get('trackPos')
+    def getRpm(self): return self._get('rpm')
+    def getDamage(self): return self._get('damage')
+    def getZ(self): return self._get('z')
+    def getWheelSpinVel(self): return self._get('wheelSpinVel')
+    def getTrack(self): return self._get('track')
+    def getOpponents(self): return self._get('opponents')
+    def getDistRaced(self): return self._get('distRaced')
+    def getDistFromStart(self): return self._get('distFromStart')
+    def getCurLapTime(self): return self._get('curLapTime')
+    def getLastLapTime(self): return self._get('lastLapTime')
+
+
+class TorcsEvaluationEnv(object):
+    """Headless torcs_env.TorcsEnv taking the agent's [steer, accel, brake] actions"""
+
+    def __init__(self, rank, laps):
+        from torcs_env import TorcsEnv
+        self.env = TorcsEnv(vision=False, throttle=True, gear_change=False, rendering=False,
+                            lap_limiter=laps + 1, rank=rank)
+
+    @property
+    def raw(self):
+        return self.env.client.S.d
+
+    def reset(self):
+        return self.env.reset(relaunch=True)
+
+    def step(self, action):
+        # The server takes one pedal; braking is negative acceleration
+        steer, accel, brake = action
+        return self.env.step(np.array([steer, accel - brake]))
+
+    def end(self):
+        self.env.end()
+
+
+def weights_hash(filepath, settings):
+    """
+    Content hash of a checkpoint's actor weights and the evaluation settings
+
+    Only the actor drives during evaluation, so renamed, copied or re-saved
+    checkpoints with the same actor share one cache entry.
+    """
+    import torch # type: ignore
+
+    actor_state = torch.load(filepath)['actor_state_dict']
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    for name in sorted(actor_state):
+        tensor = actor_state[name].detach().cpu().contiguous()
+        digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)}".encode())
+        digest.update(tensor.numpy().tobytes())
+    return digest.hexdigest()
+
+
+def training_reward(filepath):
+    """Average training reward recorded in a checkpoint name, or None"""
+    match = re.search(r'_r(-?\d+(?:\.\d+)?)\.pt$', os.path.basename(filepath))
+    return float(match.group(1)) if match else None
+
+
+def run_episode(agent, env, laps, max_steps):
+    """
+    Drive one evaluation episode without exploration noise
+
+    Returns:
+        Dict of completed lap times, damage taken, off-track excursions,
+        distance raced and steps driven.
+    """
+    from stateProcessor import StateProcessor
+
+    processor = StateProcessor()
+    env.reset()
+    raw = env.raw
+    start_damage = raw.get('damage', 0.0)
+    lap_times = []
+    off_track = 0
+    was_off = False
+    previous_lap_time = raw.get('curLapTime', 0.0)
+    steps = 0
+
+    for steps in range(1, max_steps + 1):
+        state = processor.process_state(ServerState(raw))
+        action = agent.get_action(state, add_noise=False)
+        _, _, done, _ = env.step(action)
+        raw = env.raw
+
+        # A lap ends where the lap clock falls back
+        cur_lap_time = raw.get('curLapTime', 0.0)
+        if cur_lap_time < previous_lap_time:
+            last_lap_time = raw.get('lastLapTime', 0.0)
+            lap_times.append(last_lap_time if last_lap_time > 0 else previous_lap_time)
+        previous_lap_time = cur_lap_time
+
+        # Count each time the car leaves the track, not every step it spends off it
+        is_off = abs(raw.get('trackPos', 0.0)) > 1.0
+        if is_off and not was_off:
+            off_track += 1
+        was_off = is_off
+
+        if done or len(lap_times) >= laps:
+            break
+
+    return {'lap_times': lap_times,
+            'damage': float(raw.get('damage', 0.0) - start_damage),
+            'off_track': off_track,
+            'distance': float(raw.get('distRaced', 0.0)),
+            'steps': steps}
+
+
+def _evaluate_checkpoint(filepath, key, env_name, laps, episodes, max_steps, seed, ranks):
+    """Evaluate one checkpoint on a free environment slot"""
+    import torch # type: ignore
+    torch.set_num_threads(1)
+    from learningAgent import DDPGAgent, checkpoint_hidden_size
+    from stateProcessor import StateProcessor
+
+    rank = ranks.get()
+    start = time.time()
+    env = None
+    agent = None
+    try:
+        agent = DDPGAgent(StateProcessor().get_state_dim(), 3, hidden_size=checkpoint_hidden_size(filepath),
+                          buffer_size=1)
+        agent.load_model(filepath)
+
+        if env_name == 'torcs':
+            env = TorcsEvaluationEnv(rank, laps)
+        else:
+            from apexDistributed import StandInEnv
+            env = StandInEnv(seed=seed, max_steps=max_steps)
+
+        runs = [run_episode(agent, env, laps, max_steps) for _ in range(episodes)]
+    finally:
+        if env is not None:
+            env.end()
+        if agent is not None:
+            agent.close()
+        ranks.put(rank)
+
+    lap_times = [t for run in runs for t in run['lap_times']]
+    return {
+        'key': key,
+        'checkpoint': filepath,
+        'laps_completed': len(lap_times),
+        'laps_attempted': laps * episodes,
+        'mean_lap': float(np.mean(lap_times)) if lap_times else float('nan'),
+        'best_lap': float(np.min(lap_times)) if lap_times else float('nan'),
+        'damage': sum(run['damage'] for run in runs),
+        'off_track': sum(run['off_track'] for run in runs),
+        'distance': sum(run['distance'] for run in runs),
+        'steps': sum(run['steps'] for run in runs),
+        'seconds': time.time() - start,
+    }
+
+
+def load_cache(path):
+    """Cached results keyed by weights hash"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_cache(cache, path):
+    """Write the cache through a temporary file so an interrupted run never corrupts it"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _rank_key(row):
+    """Most laps first, then fastest mean lap, least damage, fewest excursions"""
+    mean_lap = row['mean_lap'] if not math.isnan(row['mean_lap']) else math.inf
+    return (-row['laps_completed'], mean_lap, row['damage'], row['off_track'], -row['distance'])
+
+
+def write_leaderboard(rows, path):
+    """Write the leaderboard as CSV, best checkpoint first"""
+    rows = sorted(rows, key=_rank_key)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rank', 'checkpoint', 'laps', 'mean_lap', 'best_lap', 'damage', 'off_track',
+                         'distance', 'train_reward', 'hash'])
+        for i, row in enumerate(rows, 1):
+            reward = training_reward(row['checkpoint'])
+            writer.writerow([i, row['checkpoint'], f"{row['laps_completed']}/{row['laps_attempted']}",
+                             f"{row['mean_lap']:.2f}", f"{row['best_lap']:.2f}", f"{row['damage']:.0f}",
+                             row['off_track'], f"{row['distance']:.0f}",
+                             '' if reward is None else f"{reward:.1f}", row['key'][:12]])
+    return rows
+
+
+def evaluate_checkpoints(paths, env_name='standin', laps=2, episodes=1, max_steps=20000, workers=None,
+                         base_rank=0, cache_path=CACHE_PATH, leaderboard_path=LEADERBOARD_PATH, seed=0,
+                         force=False):
+    """
+    Score checkpoints over fixed evaluation laps in parallel and rank them
+
+    Each checkpoint drives its actor with exploration noise off in its own
+    process against its own headless environment. Results are cached under a
+    hash of the actor weights and the evaluation settings, so a re-run only
+    evaluates checkpoints it has not seen.
+
+    Args:
+        paths: Checkpoint files.
+        env_name: 'standin' for the loopback environment or 'torcs'.
+        laps: Laps per evaluation episode.
+        episodes: Evaluation episodes per checkpoint.
+        max_steps: Step limit of an episode.
+        workers: Checkpoints evaluated at once. Defaults to one per core.
+        base_rank: TORCS instance of the first worker; worker i uses port 3001 + base_rank + i.
+        cache_path: JSON cache of results.
+        leaderboard_path: Where the CSV leaderboard is written.
+        seed: Seed of the stand-in track.
+        force: Re-evaluate checkpoints that are already cached.
+
+    Returns:
+        Leaderboard rows, best first.
+    """
+    workers = workers or os.cpu_count() or 1
+    settings = {'env': env_name, 'laps': laps, 'episodes': episodes, 'max_steps': max_steps,
+                'seed': seed, 'version': EVAL_VERSION}
+
+    cache = load_cache(cache_path)
+    keys = {}
+    for path in paths:
+        # An unreadable checkpoint is reported and skipped like a failed evaluation
+        try:
+            keys[path] = weights_hash(path, settings)
+        except Exception as e:
+            print(f"Failed to read {path}: {e!r}")
+    pending = {}
+    for path, key in keys.items():
+        if force or key not in cache:
+            pending.setdefault(key, path)
+    print(f"{len(keys)} checkpoints, {len(keys) - len(pending)} cached, {len(pending)} to evaluate")
+
+    if pending:
+        context = multiprocessing.get_context('spawn')
+        with context.Manager() as manager:
+            # Free environment slots; a worker holds one for the length of an evaluation
+            ranks = manager.Queue()
+            for i in range(min(workers, len(pending))):
+                ranks.put(base_rank + i)
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context) as pool:
+                futures = {pool.submit(_evaluate_checkpoint, path, key, env_name, laps, episodes, max_steps,
+                                       seed, ranks): path
+                           for key, path in pending.items()}
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Failed to evaluate {futures[future]}: {e!r}")
+                        continue
+                    cache[result['key']] = result
+                    save_cache(cache, cache_path)
+                    print(f"Evaluated {result['checkpoint']}: {result['laps_completed']} laps, "
+                          f"mean {result['mean_lap']:.2f}s, damage {result['damage']:.0f}, "
+                          f"off track {result['off_track']} ({result['seconds']:.1f}s)")
+
+    # Cached results are reported under the checkpoint's current name
+    rows = [dict(cache[key], checkpoint=path) for path, key in keys.items() if key in cache]
+    return write_leaderboard(rows, leaderboard_path)
+
+
+def print_leaderboard(rows, top=None):
+    """Print the leaderboard"""
+    print(f"{'#':>3}  {'checkpoint':<44}{'laps':>7}{'mean lap':>10}{'best lap':>10}{'damage':>8}"
+          f"{'off':>5}{'train r':>9}")
+    for i, row in enumerate(rows[:top], 1):
+        reward = training_reward(row['checkpoint'])
+        print(f"{i:3d}  {os.path.basename(row['checkpoint']):<44}"
+              f"{row['laps_completed']:>3}/{row['laps_attempted']:<3}"
+              f"{row['mean_lap']:10.2f}{row['best_lap']:10.2f}{row['damage']:8.0f}{row['off_track']:5d}"
+              f"{'-' if reward is None else f'{reward:.1f}':>9}")
+
+
+def main():
+    """Evaluate saved checkpoints and print the leaderboard"""
+    parser = argparse.ArgumentParser(description='Parallel checkpoint evaluation with a cached leaderboard')
+    parser.add_argument('paths', nargs='*', help='Checkpoints [models/*.pt]')
+    parser.add_argument('--env', choices=['standin', 'torcs'], default='standin', help='Evaluation environment')
+    parser.add_argument('--laps', type=int, default=2, help='Laps per evaluation episode')
+    parser.add_argument('--episodes', type=int, default=1, help='Evaluation episodes per checkpoint')
+    parser.add_argument('--max-steps', type=int, default=20000, help='Step limit of an episode')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent evaluations [one per core]')
+    parser.add_argument('--base-rank', type=int, default=0, help='TORCS instance of the first worker')
+    parser.add_argument('--cache', default=CACHE_PATH, help='Results cache')
+    parser.add_argument('--out', default=LEADERBOARD_PATH, help='Leaderboard CSV')
+    parser.add_argument('--force', action='store_true', help='Ignore cached results')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the stand-in track')
+    parser.add_argument('--top', type=int, default=20, help='Rows to print')
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join('models', '*.pt')))
+    if not paths:
+        raise SystemExit("No checkpoints found.")
+
+    rows = evaluate_checkpoints(paths, env_name=args.env, laps=args.laps, episodes=args.episodes,
+                                max_steps=args.max_steps, workers=args.workers, base_rank=args.base_rank,
+                                cache_path=args.cache, leaderboard_path=args.out, seed=args.seed,
+                                force=args.force)
+    print_leaderboard(rows, args.top)
+    print(f"\nLeaderboard written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
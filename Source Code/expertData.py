@@ -0,0 +1,464 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import numpy as np
+
+from stateProcessor import StateProcessor
+
+EXPERT_DATA_PATH = os.path.join('data', 'expert.npz')
+BC_MODEL_PATH = os.path.join('models', 'bc_model.pt')
+PI = 3.14159265359
+
+
+def heuristic_control_batch(angle, track_pos, speed_x, wheel_spin_vel, accel, target_speed=300):
+    """
+    Launcher.heuristic_control for a batch of cars
+
+    Args:
+        angle, track_pos, speed_x: (N,) unscaled server values.
+        wheel_spin_vel: (N, 4) wheel spin velocities.
+        accel: (N,) throttle of the previous tick.
+
+    Returns:
+        (steer, accel), both (N,) and unclipped like the scalar version.
+    """
+    # Steer To Corner, Steer To Center
+    steer = angle * 10 / PI - track_pos * 0.10
+
+    # Throttle Control
+    accel = accel + np.where(speed_x < target_speed - steer * 50, 0.05, -0.01)
+    slow = speed_x < 10
+    accel = accel + np.where(slow, 1 / (np.where(slow, speed_x, 0.0) + 0.1), 0.0)
+
+    # Traction Control System
+    slip = (wheel_spin_vel[:, 2] + wheel_spin_vel[:, 3]) - (wheel_spin_vel[:, 0] + wheel_spin_vel[:, 1])
+    accel = accel - np.where(slip > 5, 0.2, 0.0)
+    return steer, accel
+
+
+class ExampleDriver(object):
+    """Launcher.drive_example for many cars at once, in the agent's action space.
+
+    Each car keeps its own throttle, stuck counter and recovery phase. As in
+    drive_example the heuristic steering and throttle are applied in every
+    tick, recovery included, and the recovery phases decide the brake. The
+    brake is released when a car returns to normal driving, which
+    drive_example never did. Reverse gear has no place in [steer, accel,
+    brake], so the reversing phase only releases the brake.
+    """
+
+    def __init__(self, num_cars, target_speed=300, stuck_speed=3, stuck_steps=100):
+        self.num_cars = num_cars
+        self.target_speed = target_speed
+        self.stuck_speed = stuck_speed
+        self.stuck_steps = stuck_steps
+        self.accel = np.zeros(num_cars, dtype=np.float32)
+        self.stuck_counter = np.zeros(num_cars, dtype=np.int64)
+        self.in_recovery = np.zeros(num_cars, dtype=bool)
+        self.recovery_steps = np.zeros(num_cars, dtype=np.int64)
+
+    def reset(self, mask=None):
+        """Forget the state of the cars in mask (all if None), e.g. when their episodes end"""
+        if mask is None:
+            mask = np.ones(self.num_cars, dtype=bool)
+        self.accel[mask] = 0.0
+        self.stuck_counter[mask] = 0
+        self.in_recovery[mask] = False
+        self.recovery_steps[mask] = 0
+
+    def __call__(self, raw):
+        """
+        Controls for this tick
+
+        Args:
+            raw: Dict of unscaled server values with one row per car, like SurrogateTorcs.raw.
+
+        Returns:
+            (num_cars, 3) float32 array of [steer, accel, brake].
+        """
+        speed_x = np.asarray(raw['speedX'], dtype=np.float32)
+
+        # Stuck detection
+        stuck = np.abs(speed_x) < self.stuck_speed
+        self.stuck_counter = np.where(stuck, self.stuck_counter + 1, 0)
+        self.in_recovery |= self.stuck_counter > self.stuck_steps
+        self.recovery_steps += self.in_recovery
+
+        # Recovery phases: stop, reverse, stop again, return to normal driving
+        steps = self.recovery_steps
+        stopping = self.in_recovery & ((steps < 50) | ((steps >= 100) & (steps < 120)))
+        finished = self.in_recovery & (steps >= 120)
+        self.in_recovery[finished] = False
+        self.stuck_counter[finished] = 0
+        self.recovery_steps[finished] = 0
+        brake = stopping.astype(np.float32)
+
+        steer, accel = heuristic_control_batch(np.asarray(raw['angle'], dtype=np.float32),
+                                               np.asarray(raw['trackPos'], dtype=np.float32), speed_x,
+                                               np.asarray(raw['wheelSpinVel'], dtype=np.float32),
+                                               self.accel, self.target_speed)
+        # The server clips the example driver's controls; keep the clipped throttle
+        self.accel = np.clip(accel, 0.0, 1.0).astype(np.float32)
+        return np.column_stack([np.clip(steer, -1.0, 1.0), self.accel, brake]).astype(np.float32)
+
+
+def ddpg_state_batch(raw):
+    """The 29-value states ddpg.playGame builds, from unscaled server values with one row per car"""
+    def column(name):
+        return np.asarray(raw[name], dtype=np.float32).reshape(-1, 1)
+
+    return np.hstack((column('angle') / 3.1416, np.asarray(raw['track'], dtype=np.float32) / 200.,
+                      column('trackPos'), column('speedX') / 300.0, column('speedY') / 300.0,
+                      column('speedZ') / 300.0, np.asarray(raw['wheelSpinVel'], dtype=np.float32) / 100.0,
+                      column('rpm') / 10000)).astype(np.float32)
+
+
+class EnvGroup(object):
+    """Single-car environments stepped together like one SurrogateTorcs.
+
+    Every env must expose its unscaled server values as raw, as StandInEnv
+    and evaluateCheckpoints.TorcsEvaluationEnv do. Each car has its own
+    StateProcessor, so agent_states must be called exactly once per step.
+    """
+
+    def __init__(self, envs):
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.processors = [StateProcessor() for _ in envs]
+        self.raw = None
+
+    def _stack(self):
+        raws = [env.raw for env in self.envs]
+        self.raw = {key: np.array([raw[key] for raw in raws], dtype=np.float32)
+                    for key in ('angle', 'track', 'trackPos', 'speedX', 'speedY', 'speedZ', 'rpm',
+                                'wheelSpinVel', 'distFromStart')}
+        self._raws = raws
+
+    def reset(self, mask=None):
+        for i, env in enumerate(self.envs):
+            if mask is None or mask[i]:
+                env.reset()
+                self.processors[i] = StateProcessor()
+        self._stack()
+
+    def step(self, actions):
+        """Step every car; like SurrogateTorcs, dones are terminations and info['truncated'] the step limits"""
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        for i, env in enumerate(self.envs):
+            _, rewards[i], done, info = env.step(actions[i])
+            truncated[i] = info.get('truncated', False)
+            dones[i] = done and not truncated[i]
+        self._stack()
+        return None, rewards, dones, {'truncated': truncated}
+
+    def agent_states(self):
+        from evaluateCheckpoints import ServerState
+        return np.stack([processor.process_state(ServerState(raw))
+                         for processor, raw in zip(self.processors, self._raws)]).astype(np.float32)
+
+    def end(self):
+        for env in self.envs:
+            env.end()
+
+
+def make_env(env_name, num_cars, seed, rank=0, max_steps=1000):
+    """A batch of num_cars cars: one SurrogateTorcs, StandInEnvs, or one TORCS server per worker"""
+    if env_name == 'surrogate':
+        from surrogateSim import SurrogateTorcs
+        return SurrogateTorcs(num_cars, seed=seed, max_steps=max_steps)
+    if env_name == 'standin':
+        from apexDistributed import StandInEnv
+        return EnvGroup([StandInEnv(seed=seed * num_cars + i, max_steps=max_steps) for i in range(num_cars)])
+    if env_name == 'torcs':
+        from evaluateCheckpoints import TorcsEvaluationEnv
+        return EnvGroup([TorcsEvaluationEnv(rank, laps=1000)])
+    raise ValueError(f"Unknown environment {env_name!r}")
+
+
+def collect(env, steps, driver=None):
+    """
+    Drive every car of env with the example driver and record what it does
+
+    Args:
+        env: SurrogateTorcs or EnvGroup.
+        steps: Batched steps; each records one transition per car.
+        driver: ExampleDriver for env's cars, a fresh one if None.
+
+    Returns:
+        Dict of arrays ordered car by car, so a car's next state is the next
+        row unless its episode terminated ('dones'), hit the step limit
+        ('truncated') or its stream ended ('stream_ends').
+    """
+    num_cars = env.num_envs
+    driver = driver or ExampleDriver(num_cars)
+    env.reset()
+    driver.reset()
+
+    state_dim = StateProcessor().get_state_dim()
+    states = np.empty((steps, num_cars, state_dim), dtype=np.float32)
+    ddpg_states = np.empty((steps, num_cars, 29), dtype=np.float32)
+    actions = np.empty((steps, num_cars, 3), dtype=np.float32)
+    rewards = np.empty((steps, num_cars), dtype=np.float32)
+    dones = np.empty((steps, num_cars), dtype=bool)
+    truncated = np.empty((steps, num_cars), dtype=bool)
+    dist_from_start = np.empty((steps, num_cars), dtype=np.float32)
+    recovering = np.empty((steps, num_cars), dtype=bool)
+
+    for t in range(steps):
+        raw = env.raw
+        states[t] = env.agent_states()
+        ddpg_states[t] = ddpg_state_batch(raw)
+        dist_from_start[t] = raw['distFromStart']
+        actions[t] = driver(raw)
+        recovering[t] = driver.in_recovery
+
+        _, rewards[t], dones[t], info = env.step(actions[t])
+        truncated[t] = info.get('truncated', False)
+        ended = dones[t] | truncated[t]
+        if ended.any():
+            env.reset(ended)
+            driver.reset(ended)
+
+    stream_ends = np.zeros((steps, num_cars), dtype=bool)
+    stream_ends[-1] = True
+
+    def car_major(a):
+        return np.ascontiguousarray(a.swapaxes(0, 1)).reshape((steps * num_cars,) + a.shape[2:])
+
+    return {'states': car_major(states), 'ddpg_states': car_major(ddpg_states), 'actions': car_major(actions),
+            'rewards': car_major(rewards), 'dones': car_major(dones), 'truncated': car_major(truncated),
+            'stream_ends': car_major(stream_ends),
+            'dist_from_start': car_major(dist_from_start), 'recovering': car_major(recovering)}
+
+
+def _collect_shard(env_name, num_cars, steps, seed, rank, max_steps, directory):
+    """Collect in a worker process and write the shard to disk, returning its path"""
+    env = make_env(env_name, num_cars, seed, rank=rank, max_steps=max_steps)
+    try:
+        data = collect(env, steps)
+    finally:
+        env.end()
+    path = os.path.join(directory, f'shard_{seed}.npz')
+    np.savez(path, **data)
+    return path
+
+
+def generate(env_name='surrogate', workers=1, cars=256, steps=2000, max_steps=1000, seed=0,
+             out=EXPERT_DATA_PATH):
+    """
+    Write an expert dataset collected by workers in parallel
+
+    Every worker drives its own cars (a TORCS worker drives one car on the
+    server of its rank) and writes a shard; the shards are then joined
+    into one .npz with the keys of collect().
+
+    Returns:
+        Number of recorded transitions.
+    """
+    directory = os.path.dirname(out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    start = time.time()
+    with tempfile.TemporaryDirectory(dir=directory or '.') as tmp:
+        if workers == 1:
+            shards = [_collect_shard(env_name, cars, steps, seed, 0, max_steps, tmp)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+                futures = [pool.submit(_collect_shard, env_name, cars, steps, seed + i, i, max_steps, tmp)
+                           for i in range(workers)]
+                shards = [future.result() for future in futures]
+
+        loaded = [dict(np.load(path)) for path in shards]
+        data = {key: np.concatenate([shard[key] for shard in loaded]) for key in loaded[0]}
+
+    tmp_path = out + '.tmp.npz'
+    np.savez(tmp_path, **data)
+    os.replace(tmp_path, out)
+
+    count = len(data['actions'])
+    print(f"Recorded {count} transitions in {time.time() - start:.1f}s "
+          f"({data['dones'].sum()} terminated and {data['truncated'].sum()} truncated episodes, "
+          f"{data['recovering'].mean():.1%} in recovery) to {out}")
+    return count
+
+
+def load_dataset(path=EXPERT_DATA_PATH):
+    """The arrays of an expert dataset written by generate()"""
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _has_next_state(data):
+    """Rows whose next state is the following row; datasets from before 'truncated' count no truncations"""
+    keep = ~data['stream_ends']
+    if 'truncated' in data:
+        keep &= ~data['truncated']
+    return keep
+
+
+def transitions(data, states_key='states'):
+    """
+    (state, action, reward, next_state, done) arrays of a dataset
+
+    Args:
+        states_key: 'states' for DDPGAgent, 'ddpg_states' for ddpg.py.
+
+    Returns:
+        Tuple of arrays without the rows whose next state was not recorded:
+        the last of each car's stream and those cut by the step limit. The
+        next state of a terminated episode is never used by the targets and
+        is left as the following row.
+    """
+    keep = _has_next_state(data)
+    states = data[states_key]
+    next_states = np.roll(states, -1, axis=0)
+    return (states[keep], data['actions'][keep], data['rewards'][keep], next_states[keep],
+            data['dones'][keep].astype(np.float32))
+
+
+def fill_replay(replay_buffer, data):
+    """Add a dataset to a DDPGAgent's learningAgent.ReplayBuffer; returns the number of transitions"""
+    states, actions, rewards, next_states, dones = transitions(data)
+    dist_from_start = data['dist_from_start'][_has_next_state(data)]
+    replay_buffer.add_batch(states, actions, rewards, next_states, dones, dist_from_start)
+    return len(states)
+
+
+def fill_ddpg_replay(buff, data):
+    """Add a dataset to ddpg.py's ReplayBuffer.ReplayBuffer; returns the number of transitions"""
+    count = 0
+    for s, a, r, s1, done in zip(*transitions(data, 'ddpg_states')):
+        buff.add(s, a, r, s1, bool(done))
+        count += 1
+    return count
+
+
+def _fit(model_step, inputs, targets, epochs, batch_size, seed):
+    """Shuffled minibatch passes over (inputs, targets), printing the mean loss per epoch"""
+    rng = np.random.default_rng(seed)
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        order = rng.permutation(len(inputs))
+        total_loss = 0.0
+        for first in range(0, len(order), batch_size):
+            indices = order[first:first + batch_size]
+            total_loss += model_step(inputs[indices], targets[indices])
+        batches = (len(order) + batch_size - 1) // batch_size
+        print(f"Epoch {epoch + 1}/{epochs}: loss {total_loss / batches:.6f} ({time.perf_counter() - start:.1f}s)")
+
+
+def clone_agent(data, hidden_size=128, epochs=10, batch_size=1024, lr=1e-3, seed=0, filepath=BC_MODEL_PATH):
+    """
+    Behaviour-clone the example driver into an ActorNetwork
+
+    The actor is fit to the recorded actions with MSE and saved as an
+    actor-only checkpoint, which DDPGAgent.load_model and RacingAI load
+    to start RL from a driver that already stays on the road.
+    """
+    import torch # type: ignore
+    import torch.nn.functional as F # type: ignore
+    from learningAgent import ActorNetwork, make_adam
+
+    torch.manual_seed(seed)
+    states, actions = data['states'], data['actions']
+    actor = ActorNetwork(states.shape[1], actions.shape[1], hidden_size)
+    optimizer = make_adam(actor.parameters(), lr)
+
+    def model_step(batch, targets):
+        loss = F.mse_loss(actor(torch.from_numpy(batch)), torch.from_numpy(targets))
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        return loss.item()
+
+    _fit(model_step, states, actions, epochs, batch_size, seed)
+
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    torch.save({'actor_state_dict': actor.state_dict(), 'hidden_size': hidden_size}, filepath)
+    print(f"Cloned actor saved to {filepath}")
+    return actor.eval()
+
+
+def clone_ddpg(data, config=None, epochs=10, batch_size=1024, lr=1e-3, seed=0):
+    """
+    Behaviour-clone the example driver into the Keras actor of ddpg.py
+
+    playGame divides the actor's steering by 4 before sending it, so the
+    actor learns four times the recorded steering. The weights are written
+    to actormodel.h5, with a fresh critic in criticmodel.h5 when there is
+    none yet so playGame's loader finds both.
+    """
+    import ddpg
+    from checkpointWriter import CheckpointWriter, KerasSnapshot, text_writer
+    from tensorflow.keras.optimizers import Adam # type: ignore
+
+    params = dict(ddpg.DEFAULT_HYPERPARAMETERS, **(config or {}))
+    states = data['ddpg_states']
+    targets = data['actions'].copy()
+    targets[:, 0] = np.clip(targets[:, 0] * 4, -1, 1)
+
+    actor = ddpg.create_actor_model(states.shape[1], params['hidden1_units'], params['hidden2_units'])
+    actor.compile(loss='mse', optimizer=Adam(learning_rate=lr))
+    _fit(lambda batch, batch_targets: float(actor.train_on_batch(batch, batch_targets)),
+         states, targets, epochs, batch_size, seed)
+
+    checkpoints = CheckpointWriter()
+    checkpoints.submit(KerasSnapshot(actor).writer(actor), "actormodel.h5", tmp_suffix='.tmp.weights.h5')
+    checkpoints.submit(text_writer(json.dumps(actor.to_json())), "actormodel.json")
+    if not os.path.exists("criticmodel.h5"):
+        critic = ddpg.create_critic_model(states.shape[1], 3, params['hidden1_units'], params['hidden2_units'])
+        checkpoints.submit(KerasSnapshot(critic).writer(critic), "criticmodel.h5", tmp_suffix='.tmp.weights.h5')
+        checkpoints.submit(text_writer(json.dumps(critic.to_json())), "criticmodel.json")
+    checkpoints.close()
+    print("Cloned actor saved to actormodel.h5")
+    return actor
+
+
+def main():
+    """Record the example driver, or behaviour-clone it into either stack"""
+    parser = argparse.ArgumentParser(description='Expert data from the example driver and behaviour cloning')
+    parser.add_argument('mode', choices=['generate', 'clone-agent', 'clone-ddpg'])
+    parser.add_argument('--env', choices=['surrogate', 'standin', 'torcs'], default='surrogate',
+                        help='Cars to drive; torcs drives one car per worker on the server of its rank')
+    parser.add_argument('--workers', type=int, default=1, help='Collector processes')
+    parser.add_argument('--cars', type=int, default=256, help='Cars per worker')
+    parser.add_argument('--steps', type=int, default=2000, help='Steps per car')
+    parser.add_argument('--max-steps', type=int, default=1000, help='Steps per episode')
+    parser.add_argument('--data', default=EXPERT_DATA_PATH, help='Dataset to write or clone from')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--hidden-size', type=int, default=128, help='Hidden units of the cloned ActorNetwork')
+    parser.add_argument('--config', default=None, help='JSON overrides of the ddpg.py hyperparameters')
+    parser.add_argument('--save', default=BC_MODEL_PATH, help='Where to save the cloned ActorNetwork')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode == 'generate':
+        cars = 1 if args.env == 'torcs' else args.cars
+        generate(args.env, args.workers, cars, args.steps, args.max_steps, args.seed, args.data)
+        return
+
+    data = load_dataset(args.data)
+    if args.mode == 'clone-agent':
+        clone_agent(data, args.hidden_size, args.epochs, args.batch_size, args.lr, args.seed, args.save)
+    else:
+        config = None
+        if args.config:
+            with open(args.config) as f:
+                config = json.load(f)
+        clone_ddpg(data, config, args.epochs, args.batch_size, args.lr, args.seed)
+
+
+if __name__ == "__main__":
+    main()
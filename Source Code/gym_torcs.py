@@ -7,6 +7,7 @@ import numpy as np
 import copy
 import collections as col
 import os
+import subprocess
 import time
 
 
@@ -17,23 +18,26 @@ class TorcsEnv:
 
     initial_reset = True
 
-    def __init__(self, vision=False, throttle=False, gear_change=False):
+    def __init__(self, vision=False, throttle=False, gear_change=False, port=3001, race_config=None):
+        """
+        Args:
+            port: UDP port of the scr_server the client talks to.
+            race_config: Race config XML to run TORCS headless with ('-r'). It
+                must use scr_server port - 3000, so several servers can run on
+                one host. Without it TORCS starts with its menus, which
+                autostart.sh clicks through, so only one such server fits a display.
+        """
         self.vision = vision
         self.throttle = throttle
         self.gear_change = gear_change
+        self.port = port
+        self.race_config = os.path.abspath(race_config) if race_config else None
+        self.torcs_process = None
 
         self.initial_run = True
 
         ##print("launch torcs")
-        os.system('pkill torcs')
-        time.sleep(0.5)
-        if self.vision is True:
-            os.system('torcs -nofuel -nodamage -nolaptime -vision &')
-        else:
-            os.system('torcs -nofuel -nolaptime &')
-        time.sleep(0.5)
-        os.system('sh autostart.sh')
-        time.sleep(0.5)
+        self.start_torcs()
 
         """
         # Modify here if you use multiple tracks in the environment
@@ -182,7 +186,7 @@ class TorcsEnv:
                 print("### TORCS is RELAUNCHED ###")
 
         # Modify here if you use multiple tracks in the environment
-        self.client = snakeoil3.Client(p=3001, vision=self.vision)  # Open new UDP in vtorcs
+        self.client = snakeoil3.Client(p=self.port, vision=self.vision)  # Open new UDP in vtorcs
         self.client.MAX_STEPS = np.inf
 
         client = self.client
@@ -197,22 +201,43 @@ class TorcsEnv:
         return self.get_obs()
 
     def end(self):
-        os.system('pkill torcs')
+        self.stop_torcs()
 
     def get_obs(self):
         return self.observation
 
     def reset_torcs(self):
        #print("relaunch torcs")
-        os.system('pkill torcs')
-        time.sleep(0.5)
+        self.stop_torcs()
+        self.start_torcs()
+
+    def start_torcs(self):
+        """Launch this env's own TORCS server"""
         if self.vision is True:
-            os.system('torcs -nofuel -nodamage -nolaptime -vision &')
+            args = ['torcs', '-nofuel', '-nodamage', '-nolaptime', '-vision']
         else:
-            os.system('torcs -nofuel -nolaptime &')
-        time.sleep(0.5)
-        os.system('sh autostart.sh')
+            args = ['torcs', '-nofuel', '-nolaptime']
+        if self.race_config is not None:
+            args += ['-r', self.race_config]
+        self.torcs_process = subprocess.Popen(args)
         time.sleep(0.5)
+        if self.race_config is None:
+            # The menus are clicked through from the script next to this file,
+            # whatever the working directory
+            subprocess.call(['sh', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autostart.sh')])
+            time.sleep(0.5)
+
+    def stop_torcs(self):
+        """Stop the server this env launched, by PID, leaving other TORCS instances alone"""
+        if self.torcs_process is None:
+            return
+        self.torcs_process.terminate()
+        try:
+            self.torcs_process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.torcs_process.kill()
+            self.torcs_process.wait()
+        self.torcs_process = None
 
     def agent_to_torcs(self, u):
         torcs_action = {'steer': u[0]}
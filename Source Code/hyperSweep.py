@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Search space used when none is given: a list is a choice, a dict names a distribution
+DEFAULT_SPACE = {
+    'lra': {'log_uniform': [1e-5, 1e-3]},
+    'lrc': {'log_uniform': [1e-4, 1e-2]},
+    'tau': [0.001, 0.005, 0.01],
+    'batch_size': [32, 64, 128],
+    'explore': [20000, 100000],
+}
+
+
+def sample_params(space, rng):
+    """Draw one configuration from a search space"""
+    params = {}
+    for name, spec in space.items():
+        if isinstance(spec, list):
+            params[name] = spec[rng.integers(len(spec))]
+        elif 'choice' in spec:
+            params[name] = spec['choice'][rng.integers(len(spec['choice']))]
+        elif 'uniform' in spec:
+            params[name] = float(rng.uniform(*spec['uniform']))
+        elif 'log_uniform' in spec:
+            low, high = spec['log_uniform']
+            params[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+        elif 'int_uniform' in spec:
+            low, high = spec['int_uniform']
+            params[name] = int(rng.integers(low, high + 1))
+        else:
+            raise ValueError(f"Unknown search space entry for {name}: {spec}")
+        # Keep numbers JSON- and CSV-friendly
+        if isinstance(params[name], np.generic):
+            params[name] = params[name].item()
+    return params
+
+
+def grid_params(space):
+    """Every combination of a space whose entries are all lists"""
+    names = list(space)
+    for spec in space.values():
+        if not isinstance(spec, list):
+            raise ValueError("A grid sweep needs a list of values for every hyperparameter")
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+class MedianStopping(object):
+    """Median stopping rule over streaming episode rewards.
+
+    Every trial publishes its episode rewards to a dict shared by the whole
+    sweep. After grace_episodes, a trial stops when the running mean of its
+    rewards is below the median of the running means other trials had
+    reached at the same episode, once at least min_trials have got that far.
+    """
+
+    def __init__(self, shared, trial_id, grace_episodes=20, min_trials=3):
+        self.shared = shared
+        self.trial_id = trial_id
+        self.grace_episodes = grace_episodes
+        self.min_trials = min_trials
+        self.rewards = []
+        self.stopped = False
+
+    def __call__(self, episode, total_reward):
+        self.rewards.append(float(total_reward))
+        # Manager dicts only see assignments, so publish a fresh list
+        self.shared[self.trial_id] = list(self.rewards)
+
+        n = len(self.rewards)
+        if n <= self.grace_episodes:
+            return True
+
+        others = [np.mean(rewards[:n]) for trial_id, rewards in self.shared.items()
+                  if trial_id != self.trial_id and len(rewards) >= n]
+        if len(others) >= self.min_trials and np.mean(self.rewards) < np.median(others):
+            self.stopped = True
+            return False
+        return True
+
+
+def _run_trial(trial_id, params, env_name, ports, race_config, trial_dir, shared, grace_episodes, min_trials,
+               threads):
+    """Run one trial on a port no other running trial holds, and hand the port back after"""
+    port = ports.get()
+    try:
+        return _train_trial(trial_id, params, env_name, port, race_config, trial_dir, shared,
+                            grace_episodes, min_trials, threads)
+    finally:
+        ports.put(port)
+
+
+def _train_trial(trial_id, params, env_name, port, race_config, trial_dir, shared, grace_episodes, min_trials,
+                 threads):
+    """Train one configuration with playGame in its own directory and environment"""
+    # Each trial gets its share of the cores; set before TensorFlow starts
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.makedirs(trial_dir, exist_ok=True)
+    os.chdir(trial_dir)
+    with open('params.json', 'w') as f:
+        json.dump(params, f, indent=2)
+
+    start = time.time()
+    stopper = MedianStopping(shared, trial_id, grace_episodes, min_trials)
+    status = 'completed'
+    error = ''
+    with open('train.log', 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+            import ddpg
+
+            if env_name == 'torcs':
+                # The trial's own headless server, which relaunches only kill by PID
+                from gym_torcs import TorcsEnv
+                env = TorcsEnv(vision=False, throttle=True, gear_change=False, port=port,
+                               race_config=race_config.format(port=port, server=port - 3000))
+            else:
+                from apexDistributed import StandInEnv
+                env = StandInEnv(seed=trial_id)
+            ddpg.playGame(train_indicator=1, config=params, env=env, episode_callback=stopper)
+            if stopper.stopped:
+                status = 'stopped'
+        except Exception as e:
+            status = 'failed'
+            error = repr(e)
+            traceback.print_exc(file=log)
+
+    rewards = stopper.rewards
+    return {
+        'trial': trial_id,
+        'status': status,
+        'episodes': len(rewards),
+        'score': float(np.mean(rewards[-10:])) if rewards else float('nan'),
+        'best_reward': float(np.max(rewards)) if rewards else float('nan'),
+        'seconds': time.time() - start,
+        'port': port,
+        'error': error,
+        'params': params,
+    }
+
+
+def write_results(results, path):
+    """Write the results table as CSV, best score first"""
+    names = sorted(set(name for result in results for name in result['params']))
+    rows = sorted(results, key=lambda r: math.inf if math.isnan(r['score']) else -r['score'])
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['trial', 'status', 'episodes', 'score', 'best_reward', 'seconds', 'port'] + names + ['error'])
+        for r in rows:
+            writer.writerow([r['trial'], r['status'], r['episodes'], f"{r['score']:.3f}", f"{r['best_reward']:.3f}",
+                             f"{r['seconds']:.1f}", r['port']] + [r['params'].get(name, '') for name in names] +
+                            [r['error']])
+    return rows
+
+
+def run_sweep(space, trials=16, workers=None, env_name='standin', base_port=3001, race_config=None,
+              out_dir='sweeps', grace_episodes=20, min_trials=3, episodes=None, max_steps=None, grid=False, seed=0):
+    """
+    Run a hyperparameter sweep of playGame in a process pool
+
+    Args:
+        space: Search space; lists are choices, dicts name a distribution
+            (uniform, log_uniform, int_uniform or choice).
+        trials: Configurations to sample (ignored for a grid).
+        workers: Trials run at once. Defaults to one per core.
+        env_name: 'standin' for the loopback environment or 'torcs'.
+        base_port: Running trials take the ports base_port to base_port + workers - 1.
+        race_config: Race config path for TORCS trials, formatted with the
+            trial's {port} and {server} (port - 3000, the scr_server it must use).
+            Each trial launches its own headless server from it.
+        out_dir: Directory for per-trial logs, weights and results.csv.
+        grace_episodes: Episodes every trial runs before it may be stopped.
+        min_trials: Trials that must have reached an episode before the
+            median rule is applied there.
+        episodes: Episodes per trial, overriding the space and default.
+        max_steps: Steps per episode, overriding the space and default.
+        grid: Run every combination instead of random samples.
+        seed: Seed for sampling configurations.
+
+    Returns:
+        Result rows, best score first.
+    """
+    workers = workers or os.cpu_count() or 1
+    if env_name == 'torcs':
+        if race_config is None:
+            raise ValueError("TORCS trials need a race_config per port, e.g. 'raceconfigs/scr_{server}.xml'")
+        # Trials change directory, so resolve the path first
+        race_config = os.path.abspath(race_config)
+    configs = grid_params(space) if grid else [sample_params(space, np.random.default_rng(seed + i))
+                                               for i in range(trials)]
+    for params in configs:
+        if episodes is not None:
+            params['episode_count'] = episodes
+        if max_steps is not None:
+            params['max_steps'] = max_steps
+
+    os.makedirs(out_dir, exist_ok=True)
+    out_dir = os.path.abspath(out_dir)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with context.Manager() as manager:
+        shared = manager.dict()
+        ports = manager.Queue()
+        for port in range(base_port, base_port + workers):
+            ports.put(port)
+        try:
+            # A fresh process per trial, so TensorFlow state never leaks between trials
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, max_tasks_per_child=1)
+        except TypeError:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        with pool:
+            futures = [pool.submit(_run_trial, i, params, env_name, ports, race_config,
+                                   os.path.join(out_dir, f"trial_{i:03d}"), shared, grace_episodes,
+                                   min_trials, threads)
+                       for i, params in enumerate(configs)]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"Trial {result['trial']:3d} {result['status']:<9} episodes {result['episodes']:4d} "
+                      f"score {result['score']:10.2f}  {json.dumps(result['params'])}")
+                # Keep the table current while the sweep runs
+                write_results(results, os.path.join(out_dir, 'results.csv'))
+
+    return write_results(results, os.path.join(out_dir, 'results.csv'))
+
+
+def main():
+    """Sweep playGame hyperparameters across all cores"""
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep for DDPG training')
+    parser.add_argument('--space', default=None, help='JSON search space [DEFAULT_SPACE]')
+    parser.add_argument('--trials', type=int, default=16, help='Sampled configurations')
+    parser.add_argument('--grid', action='store_true', help='Run every combination of list-valued entries')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent trials [one per core]')
+    parser.add_argument('--env', choices=['standin', 'torcs'], default='standin', help='Trial environment')
+    parser.add_argument('--base-port', type=int, default=3001, help='First TORCS port')
+    parser.add_argument('--race-config', default=None,
+                        help='TORCS race config, formatted with {port} and {server} (--env torcs)')
+    parser.add_argument('--episodes', type=int, default=None, help='Episodes per trial')
+    parser.add_argument('--max-steps', type=int, default=None, help='Steps per episode')
+    parser.add_argument('--grace-episodes', type=int, default=20, help='Episodes before early stopping applies')
+    parser.add_argument('--min-trials', type=int, default=3, help='Trials needed to compare against')
+    parser.add_argument('--out', default='sweeps', help='Output directory')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space is not None:
+        with open(args.space) as f:
+            space = json.load(f)
+
+    rows = run_sweep(space, trials=args.trials, workers=args.workers, env_name=args.env, base_port=args.base_port,
+                     race_config=args.race_config, out_dir=args.out, grace_episodes=args.grace_episodes, min_trials=args.min_trials,
+                     episodes=args.episodes, max_steps=args.max_steps, grid=args.grid, seed=args.seed)
+
+    print(f"\nResults written to {os.path.join(args.out, 'results.csv')}")
+    for r in rows[:5]:
+        print(f"  trial {r['trial']:3d}  score {r['score']:10.2f}  {r['status']:<9}  {json.dumps(r['params'])}")
+
+
+if __name__ == "__main__":
+    main()
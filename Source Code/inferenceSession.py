@@ -0,0 +1,168 @@
+import copy
+import threading
+import time
+
+import numpy as np
+import torch # type: ignore
+
+from Launcher import heuristic_control
+from quantizeActor import quantize_torch_actor
+
+
+class HeuristicFallback(object):
+    """Example-driver controls in the agent's action space, from a car state"""
+
+    def __init__(self, target_speed=300):
+        self.target_speed = target_speed
+        self.accel = 0.0
+
+    def __call__(self, car_state):
+        """Return a [steering, acceleration, brake] action for this tick"""
+        angle = car_state.getAngle() if car_state.getAngle() is not None else 0
+        track_pos = car_state.getTrackPos() if car_state.getTrackPos() is not None else 0
+        speed_x = car_state.getSpeedX() if car_state.getSpeedX() is not None else 0
+        wheel_spin_vel = car_state.getWheelSpinVel() or [0, 0, 0, 0]
+
+        steer, accel = heuristic_control(angle, track_pos, speed_x, wheel_spin_vel,
+                                         self.accel, self.target_speed)
+        # The server clips the example driver's controls; keep the clipped throttle
+        self.accel = float(np.clip(accel, 0.0, 1.0))
+        return np.array([np.clip(steer, -1.0, 1.0), self.accel, 0.0], dtype=np.float32)
+
+
+class InferenceSession(object):
+    """Per-tick actor inference with a latency budget.
+
+    The actor is copied, put in eval mode once, traced and frozen. Every call
+    writes the state into a preallocated input tensor and runs the frozen
+    graph under inference_mode. An exponentially weighted average of the
+    inference latency predicts the cost of the next call; when it no longer
+    fits in what is left of the tick budget, the fallback answers instead so
+    the server always gets a reply on time. load_async rebuilds the frozen
+    graph on a helper thread and swaps it in once it is ready.
+    """
+
+    def __init__(self, actor, state_size, budget=0.010, fallback=None, smoothing=0.1, quantize=False):
+        """
+        Args:
+            actor: ActorNetwork to serve. Its current weights are frozen in.
+            state_size: Length of a processed state vector.
+            budget: Seconds per tick available for the whole decision.
+            fallback: Called with the car state when the network would be late.
+            smoothing: Weight of the newest sample in the latency average.
+            quantize: Serve an int8 copy with per-channel weight scales.
+        """
+        self.state_size = state_size
+        self.budget = budget
+        self.fallback = fallback if fallback is not None else HeuristicFallback()
+        self.smoothing = smoothing
+        self.quantize = quantize
+
+        # The input tensor shares memory with a NumPy array, so a state is
+        # written in place without building a tensor
+        self._input_np = np.zeros((1, state_size), dtype=np.float32)
+        self._input = torch.from_numpy(self._input_np)
+        self.model = None
+        self._pending = None
+        self._builder = None
+        self._lock = threading.Lock()
+        self.load(actor)
+
+        # Statistics
+        self.latency = 0.0
+        self.calls = 0
+        self.fallbacks = 0
+        self.overruns = 0
+
+    def load(self, actor):
+        """Freeze a copy of the actor with its current weights"""
+        self.model = self._freeze(copy.deepcopy(actor))
+
+    def load_async(self, actor):
+        """
+        Freeze a copy of the actor on a helper thread and swap it in when ready
+
+        The caller only pays for copying the weights; act() keeps serving the
+        previous graph until the new one is built. Loads requested while one
+        is building are coalesced into the newest.
+        """
+        snapshot = copy.deepcopy(actor)
+        with self._lock:
+            self._pending = snapshot
+            if self._builder is not None:
+                return
+            self._builder = threading.Thread(target=self._build_pending, daemon=True)
+            self._builder.start()
+
+    def _build_pending(self):
+        """Helper thread body: freeze pending actors until none is left"""
+        while True:
+            with self._lock:
+                actor, self._pending = self._pending, None
+                if actor is None:
+                    self._builder = None
+                    return
+            # A single attribute store, so act() sees the old graph or the new one
+            self.model = self._freeze(actor)
+
+    def _freeze(self, actor):
+        """Traced, frozen and warmed-up eval copy of an actor the session owns"""
+        model = quantize_torch_actor(actor) if self.quantize else actor.eval()
+        # A private example input, as act() may be using the shared one meanwhile
+        example = torch.zeros((1, self.state_size), dtype=torch.float32)
+        with torch.inference_mode():
+            try:
+                traced = torch.jit.trace(model, example)
+                model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+            except Exception as e:
+                # Tracing is an optimization; the eval-mode copy gives the same answers
+                print(f"Actor tracing failed, serving it eagerly: {e}")
+
+            # Warm up so the first tick does not pay for lazy initialization
+            for _ in range(3):
+                model(example)
+        return model
+
+    def run(self, state):
+        """Run the frozen actor on one state and return the action, whatever the budget"""
+        np.copyto(self._input_np[0], state)
+        with torch.inference_mode():
+            return self.model(self._input)[0].numpy().copy()
+
+    def act(self, state, car_state=None, tick_start=None):
+        """
+        Return the action for this tick, or the fallback's when the budget is short
+
+        Args:
+            state: Processed state vector.
+            car_state: Raw car state, passed to the fallback.
+            tick_start: time.perf_counter() when the tick started. Defaults to now.
+        """
+        now = time.perf_counter()
+        if tick_start is None:
+            tick_start = now
+        self.calls += 1
+
+        # Skip the network when it is not expected to finish in time
+        remaining = self.budget - (now - tick_start)
+        if self.latency > remaining and car_state is not None:
+            self.fallbacks += 1
+            # Let the estimate decay so one slow call does not disable the network for good
+            self.latency *= 1.0 - self.smoothing
+            return self.fallback(car_state)
+
+        action = self.run(state)
+        elapsed = time.perf_counter() - now
+        self.latency += self.smoothing * (elapsed - self.latency)
+        if time.perf_counter() - tick_start > self.budget:
+            self.overruns += 1
+        return action
+
+    def stats(self):
+        """Latency and fallback statistics"""
+        return {
+            'latency_ms': self.latency * 1000.0,
+            'calls': self.calls,
+            'fallbacks': self.fallbacks,
+            'overruns': self.overruns,
+        }
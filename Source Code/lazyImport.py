@@ -0,0 +1,47 @@
+import importlib
+import sys
+import time
+
+# Frameworks worth calling out in the report when an import drags them in
+HEAVY_PACKAGES = ('torch', 'tensorflow', 'keras', 'gym', 'pandas', 'matplotlib', 'scipy', 'h5py')
+
+# (module name, seconds, heavy packages it loaded) in import order
+IMPORT_TIMES = []
+
+
+def timed_import(name):
+    """
+    Import a module on first use and record how long it took
+
+    Args:
+        name: Module name, as for importlib.import_module.
+
+    Returns:
+        The imported module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    before = set(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+
+    loaded = set(sys.modules) - before
+    heavy = [package for package in HEAVY_PACKAGES if package in loaded]
+    IMPORT_TIMES.append((name, elapsed, heavy))
+    return module
+
+
+def import_report():
+    """Return the import-time breakdown of every timed_import so far as text"""
+    lines = ["Import time breakdown:"]
+    total = 0.0
+    for name, elapsed, heavy in IMPORT_TIMES:
+        total += elapsed
+        pulled = f"  (loads {', '.join(heavy)})" if heavy else ""
+        lines.append(f"  {name:<20} {elapsed * 1000:8.1f} ms{pulled}")
+    lines.append(f"  {'total':<20} {total * 1000:8.1f} ms")
+    loaded = [package for package in HEAVY_PACKAGES if package in sys.modules]
+    lines.append(f"  Frameworks loaded: {', '.join(loaded) if loaded else 'none'}")
+    return '\n'.join(lines)
@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+class LearnerThread(object):
+    """Background learner for an actor/learner split.
+
+    The control loop only runs inference and pushes transitions; this thread
+    calls train_fn and publish_fn every publish_interval updates so the
+    control loop can pick up fresh actor weights without ever waiting on a
+    gradient step. Given a step_fn, the learner is paced like UpdateScheduler:
+    it runs at most updates_per_step updates per env step collected since it
+    started, and waits for new data once it is ahead.
+    """
+
+    def __init__(self, train_fn, publish_fn, publish_interval=100, ready_fn=None, lock=None,
+                 step_fn=None, updates_per_step=1.0):
+        """
+        Args:
+            train_fn: Runs one gradient update.
+            publish_fn: Hands the current actor weights to the control loop.
+            publish_interval: Number of updates between two publications.
+            ready_fn: Returns False while there is not enough data to train.
+            lock: Optional lock held around every update, so callers can
+                checkpoint the networks between two updates.
+            step_fn: Returns the number of env steps collected so far. None
+                trains back to back without pacing.
+            updates_per_step: Most updates per collected env step, may be fractional.
+        """
+        self.train_fn = train_fn
+        self.publish_fn = publish_fn
+        self.publish_interval = publish_interval
+        self.ready_fn = ready_fn
+        self.lock = lock if lock is not None else threading.Lock()
+        self.step_fn = step_fn
+        self.updates_per_step = updates_per_step
+        self._start_steps = 0
+
+        self.updates = 0
+        self.publications = 0
+        self.error = None
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='learner', daemon=True)
+
+    def start(self):
+        """Start training in the background"""
+        if self.step_fn is not None:
+            self._start_steps = self.step_fn()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                if self.ready_fn is not None and not self.ready_fn():
+                    self._stop.wait(0.01)
+                    continue
+
+                # Never run ahead of the data
+                if (self.step_fn is not None and
+                        self.updates >= self.updates_per_step * (self.step_fn() - self._start_steps)):
+                    self._stop.wait(0.001)
+                    continue
+
+                with self.lock:
+                    self.train_fn()
+                self.updates += 1
+
+                if self.updates % self.publish_interval == 0:
+                    self.publish_fn()
+                    self.publications += 1
+        except Exception as e:
+            # Keep the control loop alive; the error is reported on stop()
+            self.error = e
+            print(f"Learner thread stopped: {e}")
+
+    def updates_per_second(self, interval=1.0):
+        """Measure the current update rate over a short interval"""
+        start_updates = self.updates
+        time.sleep(interval)
+        return (self.updates - start_updates) / interval
+
+    def stop(self, publish=True):
+        """Stop the learner, optionally publishing the final weights"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if publish and self.error is None:
+            self.publish_fn()
+        if self.error is not None:
+            print(f"Learner thread failed after {self.updates} updates: {self.error}")
@@ -1,43 +1,394 @@
 import numpy as np
 import os
+import glob
+import re
 import pickle
+import argparse
 import datetime
+import time
 import torch # type: ignore
 import torch.nn as nn # type: ignore
 import torch.optim as optim # type: ignore
 import torch.nn.functional as F # type: ignore
-import random
+from torch.nn.utils import parameters_to_vector, vector_to_parameters # type: ignore
+import copy
+import queue
+import threading
 from collections import deque
 
+from checkpointWriter import CheckpointWriter, snapshot_state_dict
+from inferenceSession import InferenceSession
+from learnerThread import LearnerThread
+from numpyActor import NumpyActor
+from OU import make_noise
+from sharedWeights import WeightPublisher, WeightSubscriber
+from stateProcessor import StateProcessor
+
+class TrackSegmentIndex:
+    """Secondary replay index that buckets transitions by track segment
+    
+    Each replay slot lives in exactly one bucket, keyed by the distFromStart
+    segment it was recorded in. With a terminal window, the last steps before
+    an episode ended are moved to a separate set of buckets so the corners that
+    end episodes are sampled as often as any other part of the track.
+    
+    Batches are not importance-weighted, so small buckets are oversampled
+    and the training distribution shifts toward them. The index is only
+    built when a segment_length is given.
+    """
+    
+    def __init__(self, capacity, segment_length=50.0, max_segments=200, terminal_window=0):
+        self.segment_length = segment_length
+        self.max_segments = max_segments
+        self.terminal_window = terminal_window
+        
+        num_buckets = max_segments * (2 if terminal_window else 1)
+        self.buckets = [[] for _ in range(num_buckets)]
+        self.bucket_sizes = np.zeros(num_buckets, dtype=np.int64)
+        
+        # Where every slot currently sits, for O(1) removal on overwrite
+        self.slot_bucket = np.full(capacity, -1, dtype=np.int64)
+        self.slot_position = np.zeros(capacity, dtype=np.int64)
+        
+        # Slots of the current episode that may still turn out to be near its end
+        self.recent_slots = deque(maxlen=max(terminal_window, 1))
+    
+    def _segment(self, dist_from_start):
+        """Map a distance from the start line to a segment number"""
+        segment = int(max(0.0, dist_from_start or 0.0) // self.segment_length)
+        return min(segment, self.max_segments - 1)
+    
+    def _insert(self, slot, bucket):
+        self.slot_bucket[slot] = bucket
+        self.slot_position[slot] = len(self.buckets[bucket])
+        self.buckets[bucket].append(slot)
+        self.bucket_sizes[bucket] += 1
+    
+    def _remove(self, slot):
+        """Swap-remove a slot from its bucket"""
+        bucket = self.slot_bucket[slot]
+        if bucket < 0:
+            return
+        members = self.buckets[bucket]
+        position = self.slot_position[slot]
+        last = members.pop()
+        if last != slot:
+            members[position] = last
+            self.slot_position[last] = position
+        self.bucket_sizes[bucket] -= 1
+        self.slot_bucket[slot] = -1
+    
+    def add(self, slot, dist_from_start, done):
+        """Index a freshly written slot, retagging the episode tail on termination"""
+        self._remove(slot)
+        self._insert(slot, self._segment(dist_from_start))
+        
+        if not self.terminal_window:
+            return
+        
+        self.recent_slots.append(slot)
+        if done:
+            for recent in self.recent_slots:
+                bucket = self.slot_bucket[recent]
+                if 0 <= bucket < self.max_segments:
+                    self._remove(recent)
+                    self._insert(recent, bucket + self.max_segments)
+            self.recent_slots.clear()
+    
+    def sample(self, batch_size):
+        """Draw a batch spread evenly across non-empty buckets"""
+        nonempty = np.flatnonzero(self.bucket_sizes)
+        chosen = nonempty[np.random.randint(0, len(nonempty), size=batch_size)]
+        positions = np.random.randint(0, self.bucket_sizes[chosen])
+        buckets = self.buckets
+        return np.fromiter((buckets[b][p] for b, p in zip(chosen, positions)),
+                           dtype=np.int64, count=batch_size)
+    
+    def __len__(self):
+        return int(self.bucket_sizes.sum())
+
+
 class ReplayBuffer:
     """Experience replay buffer for storing and sampling experiences"""
     
-    def __init__(self, capacity=10000):
-        self.buffer = deque(maxlen=capacity)
+    def __init__(self, capacity=10000, segment_length=None, terminal_window=0):
+        self.capacity = capacity
+        self.position = 0
+        self.size = 0
+        self.episode = 0
+        self.lock = threading.Lock()
+        
+        # Optional stratified sampling by track segment
+        self.segment_index = None
+        if segment_length:
+            self.segment_index = TrackSegmentIndex(capacity, segment_length,
+                                                   terminal_window=terminal_window)
+        
+        # Ring storage is allocated on the first add, once dimensions are known
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.next_states = None
+        self.dones = None
+    
+    def _allocate(self, state, action):
+        """Allocate contiguous ring storage for every field"""
+        state_shape = np.shape(state)
+        action_shape = np.shape(action)
+        self.states = np.zeros((self.capacity,) + state_shape, dtype=np.float32)
+        self.actions = np.zeros((self.capacity,) + action_shape, dtype=np.float32)
+        self.rewards = np.zeros((self.capacity, 1), dtype=np.float32)
+        self.next_states = np.zeros((self.capacity,) + state_shape, dtype=np.float32)
+        self.dones = np.zeros((self.capacity, 1), dtype=np.float32)
+        self.episode_ids = np.full(self.capacity, -1, dtype=np.int64)
     
-    def add(self, state, action, reward, next_state, done):
+    def add(self, state, action, reward, next_state, done, dist_from_start=None):
         """Add experience to buffer"""
-        self.buffer.append((state, action, reward, next_state, done))
+        with self.lock:
+            if self.states is None:
+                self._allocate(state, action)
+            
+            i = self.position
+            self.states[i] = state
+            self.actions[i] = action
+            self.rewards[i] = reward
+            self.next_states[i] = next_state
+            self.dones[i] = done
+            self.episode_ids[i] = self.episode
+            if done:
+                self.episode += 1
+            
+            if self.segment_index is not None:
+                self.segment_index.add(i, dist_from_start, done)
+            
+            self.position = (self.position + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+    
+    def add_batch(self, states, actions, rewards, next_states, dones, dist_from_start=None):
+        """Add many experiences at once with vectorized ring writes"""
+        n = len(states)
+        if n == 0:
+            return
+        
+        with self.lock:
+            if self.states is None:
+                self._allocate(states[0], actions[0])
+            
+            # Only the newest capacity experiences survive a large import
+            if n > self.capacity:
+                skip = n - self.capacity
+                states, actions, rewards = states[skip:], actions[skip:], rewards[skip:]
+                next_states, dones = next_states[skip:], dones[skip:]
+                if dist_from_start is not None:
+                    dist_from_start = dist_from_start[skip:]
+                n = self.capacity
+            
+            slots = (self.position + np.arange(n)) % self.capacity
+            dones = np.asarray(dones, dtype=np.float32).reshape(n)
+            self.states[slots] = states
+            self.actions[slots] = actions
+            self.rewards[slots, 0] = np.asarray(rewards, dtype=np.float32).reshape(n)
+            self.next_states[slots] = next_states
+            self.dones[slots, 0] = dones
+            
+            # Episode ids advance after every terminal experience
+            ended_before = np.concatenate([[0], np.cumsum(dones[:-1] > 0)])
+            self.episode_ids[slots] = self.episode + ended_before
+            self.episode += int((dones > 0).sum())
+            
+            if self.segment_index is not None:
+                distances = dist_from_start if dist_from_start is not None else np.zeros(n)
+                for slot, dist, done in zip(slots, distances, dones):
+                    self.segment_index.add(slot, dist, done)
+            
+            self.position = int((self.position + n) % self.capacity)
+            self.size = min(self.size + n, self.capacity)
+    
+    def sample_indices(self, batch_size):
+        """Draw batch_size random slots from the filled part of the buffer"""
+        if self.segment_index is not None:
+            return self.segment_index.sample(batch_size)
+        return np.random.randint(0, self.size, size=batch_size)
+    
+    def sample_into(self, batch_size, out):
+        """Sample a batch straight into preallocated (states, actions, rewards, next_states, dones) arrays"""
+        with self.lock:
+            indices = self.sample_indices(batch_size)
+            np.take(self.states, indices, axis=0, out=out[0])
+            np.take(self.actions, indices, axis=0, out=out[1])
+            np.take(self.rewards, indices, axis=0, out=out[2])
+            np.take(self.next_states, indices, axis=0, out=out[3])
+            np.take(self.dones, indices, axis=0, out=out[4])
+        return out
     
     def sample(self, batch_size):
         """Sample a batch of experiences"""
-        if batch_size > len(self.buffer):
-            batch_size = len(self.buffer)
+        if batch_size > len(self):
+            batch_size = len(self)
         
-        # Random sample of experiences
-        experiences = random.sample(self.buffer, batch_size)
-        
-        # Convert to batch of tensors
-        states = torch.tensor(np.array([e[0] for e in experiences]), dtype=torch.float32)
-        actions = torch.tensor(np.array([e[1] for e in experiences]), dtype=torch.float32)
-        rewards = torch.tensor(np.array([e[2] for e in experiences]), dtype=torch.float32)
-        next_states = torch.tensor(np.array([e[3] for e in experiences]), dtype=torch.float32)
-        dones = torch.tensor(np.array([e[4] for e in experiences]), dtype=torch.float32)
+        with self.lock:
+            indices = self.sample_indices(batch_size)
+            
+            # Fancy indexing already yields fresh contiguous arrays
+            states = torch.from_numpy(self.states[indices])
+            actions = torch.from_numpy(self.actions[indices])
+            rewards = torch.from_numpy(self.rewards[indices])
+            next_states = torch.from_numpy(self.next_states[indices])
+            dones = torch.from_numpy(self.dones[indices])
         
         return states, actions, rewards, next_states, dones
     
+    def sequence_windows(self, seq_len):
+        """Return zero-copy (num_windows, seq_len, ...) views over the ring storage
+        
+        Window i covers slots i to i + seq_len - 1. Use valid_sequence_starts()
+        to know which windows stay inside one episode.
+        """
+        return tuple(
+            np.moveaxis(np.lib.stride_tricks.sliding_window_view(array, seq_len, axis=0), -1, 1)
+            for array in (self.states, self.actions, self.rewards, self.next_states, self.dones)
+        )
+    
+    def valid_sequence_starts(self, starts, seq_len):
+        """Mask of window starts that are contiguous in time and within one episode"""
+        ends = starts + seq_len - 1
+        valid = ends < self.size
+        ends = np.minimum(ends, self.size - 1)
+        
+        # The write head separates the newest slot from the oldest one
+        if self.size == self.capacity:
+            valid &= ~((starts < self.position) & (ends >= self.position))
+        
+        # Episode ids only grow along a contiguous stretch, so equal ends
+        # mean the whole window belongs to one episode
+        valid &= self.episode_ids[starts] == self.episode_ids[ends]
+        return valid
+    
+    def sample_sequences(self, batch_size, seq_len, max_tries=8):
+        """Sample contiguous windows that respect episode boundaries
+        
+        Returns states, actions, rewards, next_states and dones as
+        (batch, seq_len, ...) tensors gathered from the window views in one
+        indexing operation per field.
+        """
+        with self.lock:
+            num_windows = self.size - seq_len + 1
+            if num_windows <= 0:
+                raise ValueError("Not enough experiences to sample sequences of this length")
+            
+            # Rejection sampling keeps this O(batch) while most windows are valid
+            starts = np.empty(0, dtype=np.int64)
+            for _ in range(max_tries):
+                candidates = np.random.randint(0, num_windows, size=2 * batch_size)
+                starts = np.concatenate([starts, candidates[self.valid_sequence_starts(candidates, seq_len)]])
+                if len(starts) >= batch_size:
+                    break
+            else:
+                every_start = np.arange(num_windows)
+                valid_starts = every_start[self.valid_sequence_starts(every_start, seq_len)]
+                if len(valid_starts) == 0:
+                    raise ValueError("No episode is long enough to sample sequences of this length")
+                starts = np.random.choice(valid_starts, size=batch_size)
+            starts = starts[:batch_size]
+            
+            windows = self.sequence_windows(seq_len)
+            return tuple(torch.from_numpy(window[starts]) for window in windows)
+    
     def __len__(self):
-        return len(self.buffer)
+        return self.size
+
+
+class BatchPrefetcher:
+    """Background thread that keeps sampled batches ready as torch tensors
+    
+    Batches are written into a small pool of reused tensors. The consumer pops a
+    ready slot with get() and hands it back with release() once it is done with
+    the tensors, so batch assembly never runs on the caller's thread. If
+    sampling fails, the error is passed through the ready queue and raised
+    by get().
+    """
+    
+    def __init__(self, replay_buffer, batch_size, num_batches=2):
+        self.replay_buffer = replay_buffer
+        self.batch_size = batch_size
+        self.num_batches = num_batches
+        
+        self.slots = None
+        self.free_slots = queue.Queue()
+        self.ready_slots = queue.Queue()
+        for slot in range(num_batches):
+            self.free_slots.put(slot)
+        
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='batch-prefetcher', daemon=True)
+        self._thread.start()
+    
+    def _allocate(self):
+        """Allocate the reused tensor storage for every slot"""
+        buf = self.replay_buffer
+        self.slots = []
+        for _ in range(self.num_batches):
+            self.slots.append(tuple(
+                torch.empty((self.batch_size,) + array.shape[1:], dtype=torch.float32)
+                for array in (buf.states, buf.actions, buf.rewards, buf.next_states, buf.dones)
+            ))
+    
+    def _run(self):
+        """Fill free slots with fresh batches until stopped"""
+        try:
+            while not self._stop.is_set():
+                if len(self.replay_buffer) < self.batch_size:
+                    self._stop.wait(0.01)
+                    continue
+                
+                try:
+                    slot = self.free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                
+                if self.slots is None:
+                    self._allocate()
+                
+                # Share memory between the tensors and numpy so the gather writes in place
+                out = [tensor.numpy() for tensor in self.slots[slot]]
+                self.replay_buffer.sample_into(self.batch_size, out)
+                self.ready_slots.put(slot)
+        except Exception as e:
+            # Hand the error to the consumer instead of dying silently
+            self.ready_slots.put(e)
+    
+    def get(self, timeout=None, poll_interval=0.1):
+        """Pop the next ready batch, returning (slot, tensors)
+        
+        Re-raises an error of the prefetch thread, raises RuntimeError if the
+        thread is gone and queue.Empty once timeout seconds pass without a batch.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = poll_interval
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            try:
+                slot = self.ready_slots.get(timeout=wait)
+                break
+            except queue.Empty:
+                if not self._thread.is_alive():
+                    raise RuntimeError("Batch prefetcher thread is not running")
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+        
+        if isinstance(slot, Exception):
+            raise slot
+        return slot, self.slots[slot]
+    
+    def release(self, slot):
+        """Hand a consumed slot back to the prefetcher"""
+        self.free_slots.put(slot)
+    
+    def stop(self):
+        """Stop the prefetch thread"""
+        self._stop.set()
+        self._thread.join(timeout=1.0)
 
 
 class ActorNetwork(nn.Module):
@@ -74,6 +425,33 @@ class ActorNetwork(nn.Module):
         
         # Combine outputs
         return torch.cat([steering, accel_brake], dim=1)
+    
+    def to_numpy(self):
+        """Copy the network into a NumpyActor for torch-free inference"""
+        def dense(name, inputs, activation):
+            return {'class_name': 'Dense', 'name': name, 'config': {'name': name, 'activation': activation},
+                    'inbound_nodes': [[[inputs, 0, 0, {}]]]}
+        
+        state_size = self.fc1.in_features
+        config = {'layers': [
+            {'class_name': 'InputLayer', 'name': 'state', 'inbound_nodes': [],
+             'config': {'name': 'state', 'batch_input_shape': [None, state_size]}},
+            dense('fc1', 'state', 'relu'),
+            dense('fc2', 'fc1', 'relu'),
+            # fc3 split by output activation, as in forward()
+            dense('steering', 'fc2', 'tanh'),
+            dense('accel_brake', 'fc2', 'sigmoid'),
+            {'class_name': 'Concatenate', 'name': 'action', 'config': {'name': 'action'},
+             'inbound_nodes': [[['steering', 0, 0, {}], ['accel_brake', 0, 0, {}]]]},
+        ]}
+        
+        with torch.no_grad():
+            fc = {name: (layer.weight.t().cpu().numpy().copy(), layer.bias.cpu().numpy().copy())
+                  for name, layer in (('fc1', self.fc1), ('fc2', self.fc2), ('fc3', self.fc3))}
+        kernel, bias = fc.pop('fc3')
+        fc['steering'] = (kernel[:, :1], bias[:1])
+        fc['accel_brake'] = (kernel[:, 1:], bias[1:])
+        return NumpyActor(config, fc)
 
 
 class CriticNetwork(nn.Module):
@@ -95,13 +473,115 @@ class CriticNetwork(nn.Module):
         return self.fc3(x)
 
 
+class EnsembleCritic(nn.Module):
+    """num_critics CriticNetworks evaluated together in one batched op.
+
+    Every layer's weights are stacked along a leading member axis as
+    (num_critics, in, out), so each layer of all members is a single
+    baddbmm and the ensemble costs about as much as one wider critic.
+    """
+    
+    def __init__(self, state_size, action_size, hidden_size=64, num_critics=2):
+        super(EnsembleCritic, self).__init__()
+        self.num_critics = num_critics
+        
+        def layer(fan_in, fan_out):
+            # Same initialization as each member's nn.Linear
+            bound = 1.0 / np.sqrt(fan_in)
+            weight = nn.Parameter(torch.empty(num_critics, fan_in, fan_out).uniform_(-bound, bound))
+            bias = nn.Parameter(torch.empty(num_critics, 1, fan_out).uniform_(-bound, bound))
+            return weight, bias
+        
+        self.w1, self.b1 = layer(state_size, hidden_size)
+        self.w2, self.b2 = layer(hidden_size + action_size, hidden_size)
+        self.w3, self.b3 = layer(hidden_size, 1)
+    
+    def forward(self, state, action):
+        """Q-values of every member, shaped (num_critics, batch, 1)"""
+        # The batch is shared, so the first layer broadcasts instead of copying it per member
+        x = F.relu(torch.matmul(state, self.w1) + self.b1)
+        x = torch.cat([x, action.unsqueeze(0).expand(self.num_critics, -1, -1)], dim=2)
+        x = F.relu(torch.baddbmm(self.b2, x, self.w2))
+        return torch.baddbmm(self.b3, x, self.w3)
+
+
+def _critic_members(state_dict):
+    """CriticNetwork state dicts of the members of a critic or critic ensemble"""
+    if 'w1' not in state_dict:
+        return [state_dict]
+    return [{'fc1.weight': state_dict['w1'][i].t(), 'fc1.bias': state_dict['b1'][i, 0],
+             'fc2.weight': state_dict['w2'][i].t(), 'fc2.bias': state_dict['b2'][i, 0],
+             'fc3.weight': state_dict['w3'][i].t(), 'fc3.bias': state_dict['b3'][i, 0]}
+            for i in range(state_dict['w1'].shape[0])]
+
+
+def convert_critic_state(state_dict, num_critics, fresh=None):
+    """
+    Critic weights of a checkpoint for a critic with num_critics members
+
+    Args:
+        state_dict: critic_state_dict of a CriticNetwork or an EnsembleCritic.
+        num_critics: 1 for a CriticNetwork, more for an EnsembleCritic.
+        fresh: State dict of the num_critics-member critic being loaded
+            into, whose members fill the slots the checkpoint has none for.
+
+    Returns:
+        The state dict unchanged if it already fits. Otherwise an ensemble
+        is cut down to its first members, and a single critic becomes
+        member 0. Members the checkpoint lacks keep their fresh
+        initialization, so the ensemble does not start as identical copies
+        whose min and mean are no better than one critic; without fresh,
+        the checkpoint's members are repeated.
+    """
+    members = _critic_members(state_dict)
+    if len(members) == num_critics:
+        return state_dict
+    
+    if num_critics == 1:
+        return {name: value.contiguous() for name, value in members[0].items()}
+    if fresh is not None:
+        members = members[:num_critics] + _critic_members(fresh)[len(members):num_critics]
+    else:
+        members = [members[i % len(members)] for i in range(num_critics)]
+    
+    def stack(name):
+        return torch.stack([member[name] for member in members])
+    
+    return {'w1': stack('fc1.weight').transpose(1, 2).contiguous(), 'b1': stack('fc1.bias').unsqueeze(1),
+            'w2': stack('fc2.weight').transpose(1, 2).contiguous(), 'b2': stack('fc2.bias').unsqueeze(1),
+            'w3': stack('fc3.weight').transpose(1, 2).contiguous(), 'b3': stack('fc3.bias').unsqueeze(1)}
+
+
+def make_adam(params, lr):
+    """Adam with the fused kernel where this torch build has one, else the multi-tensor one"""
+    params = list(params)
+    try:
+        return optim.Adam(params, lr=lr, fused=True)
+    except (TypeError, RuntimeError):
+        return optim.Adam(params, lr=lr, foreach=True)
+
+
 class DDPGAgent:
     """Deep Deterministic Policy Gradient agent for continuous control in racing"""
     
     def __init__(self, state_size, action_size, hidden_size=64, lr_actor=1e-4, 
                  lr_critic=1e-3, gamma=0.99, tau=1e-3, batch_size=64,
-                 epsilon=1.0, epsilon_decay=0.9995, epsilon_min=0.01):
-        """Initialize the DDPG agent"""
+                 epsilon=1.0, epsilon_decay=0.9995, epsilon_min=0.01,
+                 prefetch_batches=0, segment_length=None, terminal_window=0,
+                 buffer_size=10000, keep_checkpoints=5, compile_mode=None,
+                 loss_flush_interval=1000, noise='gaussian', num_critics=1, critic_reduction='min'):
+        """Initialize the DDPG agent
+
+        compile_mode: None runs the update eagerly, 'compile' wraps the loss
+        computations in torch.compile and 'script' runs them through
+        TorchScript copies of the networks that share their parameters.
+        Losses stay on device and reach loss_history every
+        loss_flush_interval updates, or whenever loss_history is read.
+        noise picks the exploration process ('gaussian', 'ou' or 'pink')
+        that epsilon scales. num_critics > 1 trains an EnsembleCritic whose
+        TD target takes the min or mean (critic_reduction) over its members;
+        the actor maximizes their mean.
+        """
         self.state_size = state_size
         self.action_size = action_size
         self.gamma = gamma  # discount factor
@@ -112,24 +592,66 @@ class DDPGAgent:
         self.epsilon = epsilon
         self.epsilon_decay = epsilon_decay
         self.epsilon_min = epsilon_min
+        self.noise_type = noise
+        self.noise = make_noise(noise, 1, action_size)
         
         # Create actor network and target
         self.actor = ActorNetwork(state_size, action_size, hidden_size)
         self.actor_target = ActorNetwork(state_size, action_size, hidden_size)
-        self.actor_optimizer = optim.Adam(self.actor.parameters(), lr=lr_actor)
+        self.actor_optimizer = make_adam(self.actor.parameters(), lr_actor)
         
         # Create critic network and target
-        self.critic = CriticNetwork(state_size, action_size, hidden_size)
-        self.critic_target = CriticNetwork(state_size, action_size, hidden_size)
-        self.critic_optimizer = optim.Adam(self.critic.parameters(), lr=lr_critic)
+        if critic_reduction not in ('min', 'mean'):
+            raise ValueError(f"Unknown critic_reduction: {critic_reduction}")
+        self.num_critics = num_critics
+        self.critic_reduction = critic_reduction
+        if num_critics > 1:
+            self.critic = EnsembleCritic(state_size, action_size, hidden_size, num_critics)
+            self.critic_target = EnsembleCritic(state_size, action_size, hidden_size, num_critics)
+        else:
+            self.critic = CriticNetwork(state_size, action_size, hidden_size)
+            self.critic_target = CriticNetwork(state_size, action_size, hidden_size)
+        self.critic_optimizer = make_adam(self.critic.parameters(), lr_critic)
+        
+        self._actor_params = list(self.actor.parameters())
+        self._critic_params = list(self.critic.parameters())
+        
+        # Flat parameter lists for the multi-tensor Polyak update
+        self._target_params = list(self.actor_target.parameters()) + list(self.critic_target.parameters())
+        self._source_params = list(self.actor.parameters()) + list(self.critic.parameters())
         
         # Set target weights equal to model weights initially
         self._update_target_networks(tau=1.0)
         
+        # Loss functions used by the update, optionally compiled
+        self._set_compile_mode(compile_mode)
+        
+        # Called with a parameter list once its gradients are ready and before
+        # the optimizer step, e.g. to all-reduce them across learners
+        self.gradient_hook = None
+        
         # Experience replay buffer
-        self.replay_buffer = ReplayBuffer()
+        self.replay_buffer = ReplayBuffer(capacity=buffer_size,
+                                          segment_length=segment_length,
+                                          terminal_window=terminal_window)
+        
+        # Optional background batch assembly
+        self.prefetcher = None
+        if prefetch_batches > 0:
+            self.prefetcher = BatchPrefetcher(self.replay_buffer, batch_size, prefetch_batches)
+        
+        # The control loop acts with policy_actor; it only becomes a separate
+        # copy once a background learner owns the actor being trained
+        self.policy_actor = self.actor
+        self.policy_lock = threading.Lock()
+        self.train_lock = threading.Lock()
+        self.learner = None
+        self.weight_publisher = None
         
         # Training metrics
+        self.loss_flush_interval = loss_flush_interval
+        self._pending_losses = []
+        self._loss_lock = threading.Lock()
         self.loss_history = []
         self.reward_history = []
         self.total_steps = 0
@@ -138,6 +660,12 @@ class DDPGAgent:
         self.best_reward = float('-inf')
         self.models_dir = 'models'
         os.makedirs(self.models_dir, exist_ok=True)
+        
+        # Checkpoints are serialized in the background from in-memory snapshots;
+        # rolling ones from earlier runs are pruned along with this run's
+        self.checkpoint_writer = CheckpointWriter(keep_last=keep_checkpoints)
+        self.checkpoint_writer.adopt(glob.glob(os.path.join(self.models_dir, 'model_*.pt')),
+                                     score_fn=checkpoint_reward)
     
     def get_action(self, state, add_noise=True):
         """Get action from actor network with optional exploration noise"""
@@ -145,16 +673,16 @@ class DDPGAgent:
         state_tensor = torch.tensor(state, dtype=torch.float32).unsqueeze(0)
         
         # Set network to evaluation mode
-        self.actor.eval()
-        with torch.no_grad():
-            action = self.actor(state_tensor).squeeze().numpy()
-        self.actor.train()
+        with self.policy_lock:
+            self.policy_actor.eval()
+            with torch.no_grad():
+                action = self.policy_actor(state_tensor).squeeze().numpy()
+            self.policy_actor.train()
         
         # Add exploration noise if training
         if add_noise and self.epsilon > self.epsilon_min:
             # Add noise scaled by epsilon
-            noise = np.random.normal(0, self.epsilon, size=self.action_size)
-            action += noise
+            action += self.epsilon * self.noise.sample()[0]
             
             # Ensure actions are within valid ranges
             # Steering: [-1, 1]
@@ -166,10 +694,19 @@ class DDPGAgent:
         
         return action
     
-    def remember(self, state, action, reward, next_state, done):
+    def remember(self, state, action, reward, next_state, done, dist_from_start=None):
         """Add experience to replay buffer"""
-        self.replay_buffer.add(state, action, reward, next_state, done)
+        self.replay_buffer.add(state, action, reward, next_state, done, dist_from_start)
         self.total_steps += 1
+        self.decay_epsilon()
+    
+    def decay_epsilon(self):
+        """Decay the exploration rate by one env step
+        
+        Exploration follows collected experience, not gradient updates, so a
+        background learner cannot wear it down faster than the car drives.
+        """
+        self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
     
     def train(self):
         """Train the agent from sampled experiences"""
@@ -177,90 +714,268 @@ class DDPGAgent:
         if len(self.replay_buffer) < self.batch_size:
             return
         
-        # Sample experiences
-        states, actions, rewards, next_states, dones = self.replay_buffer.sample(self.batch_size)
+        # Sample experiences, or pop a batch the prefetcher already assembled
+        if self.prefetcher is not None:
+            slot, batch = self.prefetcher.get()
+            try:
+                return self._train_on_batch(*batch)
+            finally:
+                self.prefetcher.release(slot)
         
-        # Update critic
+        return self._train_on_batch(*self.replay_buffer.sample(self.batch_size))
+    
+    def _set_compile_mode(self, compile_mode):
+        """Pick eager, torch.compile or TorchScript loss computations"""
+        self.compile_mode = compile_mode
+        nets = (self.actor, self.critic, self.actor_target, self.critic_target)
+        
+        if compile_mode == 'script':
+            # Scripted modules share parameter tensors with the originals
+            nets = tuple(torch.jit.script(net) for net in nets)
+        elif compile_mode not in (None, 'compile'):
+            raise ValueError(f"Unknown compile_mode: {compile_mode}")
+        
+        self._actor_net, self._critic_net, self._actor_target_net, self._critic_target_net = nets
+        self._critic_loss = self._compute_critic_loss
+        self._actor_loss = self._compute_actor_loss
+        if compile_mode == 'compile':
+            self._critic_loss = torch.compile(self._compute_critic_loss)
+            self._actor_loss = torch.compile(self._compute_actor_loss)
+    
+    def _compute_critic_loss(self, states, actions, rewards, next_states, dones):
+        """TD error of the critic against the target networks"""
         with torch.no_grad():
-            next_actions = self.actor_target(next_states)
-            target_q = self.critic_target(next_states, next_actions)
+            next_actions = self._actor_target_net(next_states)
+            target_q = self._critic_target_net(next_states, next_actions)
+            if self.num_critics > 1:
+                # One target shared by every member
+                if self.critic_reduction == 'min':
+                    target_q = target_q.min(dim=0)[0]
+                else:
+                    target_q = target_q.mean(dim=0)
             target_value = rewards + (1 - dones) * self.gamma * target_q
         
-        # Current Q-values
-        current_q = self.critic(states, actions)
-        
-        # Compute critic loss
-        critic_loss = F.mse_loss(current_q, target_value)
+        current_q = self._critic_net(states, actions)
+        return F.mse_loss(current_q, target_value.expand_as(current_q))
+    
+    def _compute_actor_loss(self, states):
+        """Negative Q-value of the actor's actions, averaged over ensemble members"""
+        return -self._critic_net(states, self._actor_net(states)).mean()
+    
+    def _train_on_batch(self, states, actions, rewards, next_states, dones):
+        """Run one critic and actor update on a sampled batch
         
+        Returns the (critic, actor) losses as a detached tensor, so an update
+        never waits on a host copy.
+        """
         # Update critic
+        critic_loss = self._critic_loss(states, actions, rewards, next_states, dones)
+        
         self.critic_optimizer.zero_grad()
         critic_loss.backward()
+        if self.gradient_hook is not None:
+            self.gradient_hook(self._critic_params)
         self.critic_optimizer.step()
         
-        # Update actor
-        predicted_actions = self.actor(states)
-        actor_loss = -self.critic(states, predicted_actions).mean()
+        # Update actor; only its own gradients are needed, so the critic's
+        # weight gradients are never computed
+        actor_loss = self._actor_loss(states)
         
-        self.actor_optimizer.zero_grad()
-        actor_loss.backward()
+        actor_grads = torch.autograd.grad(actor_loss, self._actor_params)
+        for param, grad in zip(self._actor_params, actor_grads):
+            param.grad = grad
+        if self.gradient_hook is not None:
+            self.gradient_hook(self._actor_params)
         self.actor_optimizer.step()
         
         # Soft update target networks
         self._update_target_networks(self.tau)
         
-        # Decay exploration rate
-        self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
+        # Store losses on device; they are copied out in bulk
+        losses = torch.stack((critic_loss.detach(), actor_loss.detach()))
+        with self._loss_lock:
+            self._pending_losses.append(losses)
+            flush = len(self._pending_losses) >= self.loss_flush_interval
+        if flush:
+            self._flush_losses()
         
-        # Store losses
-        self.loss_history.append((critic_loss.item(), actor_loss.item()))
+        return losses
+    
+    def _flush_losses(self):
+        """Copy pending on-device losses into loss_history with one host sync"""
+        with self._loss_lock:
+            pending, self._pending_losses = self._pending_losses, []
+        if pending:
+            self._loss_history.extend(tuple(pair) for pair in torch.stack(pending).tolist())
+    
+    @property
+    def loss_history(self):
+        """(critic_loss, actor_loss) per update"""
+        self._flush_losses()
+        return self._loss_history
+    
+    @loss_history.setter
+    def loss_history(self, history):
+        with self._loss_lock:
+            self._pending_losses = []
+        self._loss_history = list(history)
+    
+    def start_learner(self, publish_interval=100, updates_per_step=1.0):
+        """Train in a background thread instead of inside the control loop
+        
+        The learner runs at most updates_per_step updates per remembered
+        transition, like the synchronous loop with an UpdateScheduler.
+        """
+        if self.learner is not None:
+            return self.learner
+        
+        with self.policy_lock:
+            self.policy_actor = copy.deepcopy(self.actor)
+        
+        self.learner = LearnerThread(
+            train_fn=self.train,
+            publish_fn=self.publish_policy,
+            publish_interval=publish_interval,
+            ready_fn=lambda: len(self.replay_buffer) >= self.batch_size,
+            lock=self.train_lock,
+            step_fn=lambda: self.total_steps,
+            updates_per_step=updates_per_step
+        ).start()
+        return self.learner
+    
+    def publish_policy(self):
+        """Copy the trained actor weights into the actor used for control"""
+        if self.weight_publisher is not None:
+            with torch.no_grad():
+                self.weight_publisher.publish(parameters_to_vector(self.actor.parameters()).numpy())
         
-        return critic_loss.item(), actor_loss.item()
+        if self.policy_actor is self.actor:
+            return
+        
+        with self.policy_lock, torch.no_grad():
+            for policy_param, param in zip(self.policy_actor.parameters(), self.actor.parameters()):
+                policy_param.copy_(param)
+    
+    def share_weights(self, name=None):
+        """Also publish the actor weights into a shared memory channel for local collectors
+
+        The channel is updated whenever publish_policy runs.
+
+        Returns:
+            The channel name, for WeightSubscriber in the other processes.
+        """
+        if self.weight_publisher is None:
+            size = sum(p.numel() for p in self.actor.parameters())
+            self.weight_publisher = WeightPublisher(size, name)
+            self.publish_policy()
+        return self.weight_publisher.name
+    
+    def close(self):
+        """Stop background workers owned by the agent"""
+        # The learner consumes the prefetcher, so it has to stop first
+        if self.learner is not None:
+            self.learner.stop()
+            self.learner = None
+        
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        
+        if self.weight_publisher is not None:
+            self.weight_publisher.close()
+            self.weight_publisher = None
+        
+        # Finish writing queued checkpoints
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+            self.checkpoint_writer = None
     
     def _update_target_networks(self, tau):
         """Soft update of target network parameters"""
-        def update_params(target, source, tau):
-            for target_param, param in zip(target.parameters(), source.parameters()):
-                target_param.data.copy_(
-                    tau * param.data + (1.0 - tau) * target_param.data
-                )
-        
-        update_params(self.actor_target, self.actor, tau)
-        update_params(self.critic_target, self.critic, tau)
+        # target += tau * (source - target) for every tensor in one fused call
+        with torch.no_grad():
+            torch._foreach_lerp_(self._target_params, self._source_params, tau)
     
     def save_model(self, episode, avg_reward, filepath=None):
-        """Save the model"""
+        """Save the model
+
+        The state is snapshotted in memory and written by the checkpoint
+        writer thread, so this returns before anything touches the disk.
+        Timestamped checkpoints roll: only the last few and the best are kept.
+        """
+        group = None
         if filepath is None:
             # Create a filename with timestamp
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             filepath = os.path.join(self.models_dir, f'model_{timestamp}_ep{episode}_r{avg_reward:.1f}.pt')
+            group = filepath
         
-        torch.save({
-            'actor_state_dict': self.actor.state_dict(),
-            'critic_state_dict': self.critic.state_dict(),
-            'actor_target_state_dict': self.actor_target.state_dict(),
-            'critic_target_state_dict': self.critic_target.state_dict(),
-            'actor_optimizer_state_dict': self.actor_optimizer.state_dict(),
-            'critic_optimizer_state_dict': self.critic_optimizer.state_dict(),
-            'epsilon': self.epsilon,
-            'total_steps': self.total_steps,
-            'loss_history': self.loss_history,
-            'reward_history': self.reward_history
-        }, filepath)
+        # Never snapshot halfway through a background update
+        with self.train_lock:
+            state = self._snapshot_state()
         
-        print(f"Model saved to {filepath}")
+        self.checkpoint_writer.submit(lambda tmp_path: torch.save(state, tmp_path),
+                                      filepath, score=avg_reward, group=group)
         return filepath
     
+    def _snapshot_state(self):
+        """Copy networks, optimizers and training metrics into a checkpoint dict"""
+        return {
+            'actor_state_dict': snapshot_state_dict(self.actor.state_dict()),
+            'critic_state_dict': snapshot_state_dict(self.critic.state_dict()),
+            'actor_target_state_dict': snapshot_state_dict(self.actor_target.state_dict()),
+            'critic_target_state_dict': snapshot_state_dict(self.critic_target.state_dict()),
+            'actor_optimizer_state_dict': snapshot_state_dict(self.actor_optimizer.state_dict()),
+            'critic_optimizer_state_dict': snapshot_state_dict(self.critic_optimizer.state_dict()),
+            'epsilon': self.epsilon,
+            'total_steps': self.total_steps,
+            'loss_history': list(self.loss_history),
+            'reward_history': list(self.reward_history)
+        }
+    
     def load_model(self, filepath):
-        """Load a saved model"""
+        """Load a saved model
+
+        Actor-only checkpoints, such as distilled students, load the actor
+        and its target and leave the critic and training state as they are.
+        A critic saved with another num_critics is converted to this one:
+        its members replace this critic's first ones, the others keep their
+        current weights, and its optimizer state is left out.
+        
+        Checkpoints built for another state size cannot be loaded. Those
+        saved before get_state_dim counted all 12 basic features take
+        51-value states instead of 53 and must be retrained.
+        """
         if os.path.exists(filepath):
             checkpoint = torch.load(filepath)
             
-            self.actor.load_state_dict(checkpoint['actor_state_dict'])
-            self.critic.load_state_dict(checkpoint['critic_state_dict'])
-            self.actor_target.load_state_dict(checkpoint['actor_target_state_dict'])
-            self.critic_target.load_state_dict(checkpoint['critic_target_state_dict'])
-            self.actor_optimizer.load_state_dict(checkpoint['actor_optimizer_state_dict'])
-            self.critic_optimizer.load_state_dict(checkpoint['critic_optimizer_state_dict'])
+            input_size = checkpoint['actor_state_dict']['fc1.weight'].shape[1]
+            if input_size != self.state_size:
+                raise ValueError(f"{filepath} takes {input_size}-value states, this agent {self.state_size}; "
+                                 "checkpoints from before the 53-value state must be retrained")
+            
+            if 'critic_state_dict' not in checkpoint:
+                with self.train_lock:
+                    self.actor.load_state_dict(checkpoint['actor_state_dict'])
+                    self.actor_target.load_state_dict(checkpoint['actor_state_dict'])
+                self.publish_policy()
+                print(f"Actor loaded from {filepath}")
+                return True
+            
+            # Members the checkpoint lacks keep this agent's initialization
+            with self.train_lock:
+                critic_state = convert_critic_state(checkpoint['critic_state_dict'], self.num_critics,
+                                                    fresh=self.critic.state_dict())
+                critic_target_state = convert_critic_state(checkpoint['critic_target_state_dict'],
+                                                           self.num_critics, fresh=self.critic_target.state_dict())
+                self.actor.load_state_dict(checkpoint['actor_state_dict'])
+                self.critic.load_state_dict(critic_state)
+                self.actor_target.load_state_dict(checkpoint['actor_target_state_dict'])
+                self.critic_target.load_state_dict(critic_target_state)
+                self.actor_optimizer.load_state_dict(checkpoint['actor_optimizer_state_dict'])
+                if critic_state is checkpoint['critic_state_dict']:
+                    self.critic_optimizer.load_state_dict(checkpoint['critic_optimizer_state_dict'])
+            self.publish_policy()
             
             self.epsilon = checkpoint['epsilon']
             self.total_steps = checkpoint['total_steps']
@@ -279,198 +994,70 @@ class DDPGAgent:
             self.best_reward = avg_reward
             filepath = os.path.join(self.models_dir, 'best_model.pt')
             self.save_model(episode, avg_reward, filepath)
+            self.export_actor(os.path.join(self.models_dir, 'race_actor.npz'))
             return True
         return False
+    
+    def export_actor(self, filepath):
+        """Save the actor alone as a NumpyActor .npz that race mode loads without torch"""
+        with self.train_lock:
+            engine = self.actor.to_numpy()
+        self.checkpoint_writer.submit(engine.save_npz, filepath, tmp_suffix='.tmp.npz')
+        return filepath
 
 
-class StateProcessor:
-    """Process raw state information from TORCS into suitable inputs for the RL agent"""
-    
-    def __init__(self, num_track_sensors=19, num_opponent_sensors=36, history_len=5):
-        """Initialize the state processor"""
-        self.num_track_sensors = num_track_sensors
-        self.num_opponent_sensors = num_opponent_sensors
-        self.history_len = history_len
-        
-        # Initialize history buffers
-        self.speed_history = deque(maxlen=history_len)
-        self.angle_history = deque(maxlen=history_len)
-        self.trackPos_history = deque(maxlen=history_len)
-        self.steering_history = deque(maxlen=history_len)
-        
-        # Fill histories with zeros
-        for _ in range(history_len):
-            self.speed_history.append(0.0)
-            self.angle_history.append(0.0)
-            self.trackPos_history.append(0.0)
-            self.steering_history.append(0.0)
-    
-    def get_state_dim(self):
-        """Return the dimension of the processed state vector"""
-        # Core features
-        basic_features = 10  # speed, angle, trackPos, rpm, damage, 4 wheel speeds, z
-        
-        # Track and opponent sensors (possibly downsampled)
-        track_features = self.num_track_sensors
-        opponent_features = min(10, self.num_opponent_sensors)  # We'll downsample opponents
-        
-        # Historical features
-        history_features = 3 * (self.history_len - 1)  # speed, angle, trackPos histories
-        
-        # Total features
-        return basic_features + track_features + opponent_features + history_features
-    
-    def process_state(self, car_state):
-        """Convert car state to neural network input"""
-        if not car_state:
-            # Return zero vector if no state is provided
-            return np.zeros(self.get_state_dim())
-        
-        # Extract basic features
-        speed_x = car_state.getSpeedX() if car_state.getSpeedX() is not None else 0.0
-        speed_y = car_state.getSpeedY() if car_state.getSpeedY() is not None else 0.0
-        speed_z = car_state.getSpeedZ() if car_state.getSpeedZ() is not None else 0.0
-        total_speed = np.sqrt(speed_x**2 + speed_y**2 + speed_z**2)
-        
-        angle = car_state.getAngle() if car_state.getAngle() is not None else 0.0
-        track_pos = car_state.getTrackPos() if car_state.getTrackPos() is not None else 0.0
-        rpm = car_state.getRpm() / 10000.0 if car_state.getRpm() is not None else 0.0  # Normalize RPM
-        damage = car_state.getDamage() / 10000.0 if car_state.getDamage() is not None else 0.0  # Normalize damage
-        z = car_state.getZ() / 10.0 if car_state.getZ() is not None else 0.0  # Normalize height
-        
-        # Get wheel spin velocities
-        wheel_speeds = car_state.getWheelSpinVel() if car_state.getWheelSpinVel() else [0.0, 0.0, 0.0, 0.0]
-        wheel_speeds = [w / 100.0 for w in wheel_speeds]  # Normalize wheel speeds
-        
-        # Process track sensors
-        track_sensors = car_state.getTrack() if car_state.getTrack() else [0.0] * self.num_track_sensors
-        track_sensors = [min(1.0, s / 200.0) for s in track_sensors]  # Normalize to [0,1] with max at 200m
-        
-        # Process opponent sensors (downsample to 10)
-        opponents = car_state.getOpponents() if car_state.getOpponents() else [200.0] * self.num_opponent_sensors
-        # Take a subset of opponent sensors (e.g., every 36/10 = ~4 sensors)
-        step = max(1, self.num_opponent_sensors // 10)
-        opponent_sample = [opponents[i] for i in range(0, self.num_opponent_sensors, step)][:10]
-        opponent_sample = [min(1.0, o / 200.0) for o in opponent_sample]  # Normalize to [0,1]
-        
-        # Update histories
-        self.speed_history.append(total_speed / 300.0)  # Normalize to [0,1] with max at 300 m/s
-        self.angle_history.append(angle / 3.14159)  # Normalize angle to [-1,1]
-        self.trackPos_history.append(track_pos)  # Already in [-1,1]
-        
-        # Calculate historical features (deltas)
-        speed_history = list(self.speed_history)[:-1]  # All but current
-        angle_history = list(self.angle_history)[:-1]  # All but current
-        trackPos_history = list(self.trackPos_history)[:-1]  # All but current
-        
-        # Combine all features
-        state = [
-            speed_x / 300.0,  # Normalize to approximately [-1,1]
-            speed_y / 300.0,
-            total_speed / 300.0,
-            angle / 3.14159,  # Normalize angle to [-1,1]
-            track_pos,  # Already in [-1,1]
-            rpm,
-            damage,
-            z
-        ]
-        
-        # Add wheel speeds
-        state.extend(wheel_speeds)
-        
-        # Add track sensors
-        state.extend(track_sensors)
-        
-        # Add opponent samples
-        state.extend(opponent_sample)
-        
-        # Add historical features
-        state.extend(speed_history)
-        state.extend(angle_history)
-        state.extend(trackPos_history)
-        
-        return np.array(state, dtype=np.float32)
-    
-    def process_action(self, action):
-        """Convert neural network output to car control values"""
-        # Neural network outputs: [steering, acceleration, brake]
-        steering = float(action[0])  # Already in [-1, 1]
-        accel = float(action[1])     # Already in [0, 1]
-        brake = float(action[2])     # Already in [0, 1]
-        
-        return steering, accel, brake
-    
-    def calculate_reward(self, car_state, previous_state=None, action=None):
-        """Calculate reward based on car state and action"""
-        if car_state is None:
-            return -10.0  # Large negative reward for invalid state
-        
-        # Extract relevant state information
-        speed_x = car_state.getSpeedX() if car_state.getSpeedX() is not None else 0.0
-        track_pos = car_state.getTrackPos() if car_state.getTrackPos() is not None else 0.0
-        angle = car_state.getAngle() if car_state.getAngle() is not None else 0.0
-        damage = car_state.getDamage() if car_state.getDamage() is not None else 0.0
-        track = car_state.getTrack() if car_state.getTrack() else None
-        
-        # Previous damage for comparison
-        prev_damage = 0.0
-        if previous_state and hasattr(previous_state, 'getDamage'):
-            prev_damage = previous_state.getDamage() if previous_state.getDamage() is not None else 0.0
-        
-        # Basic reward components
-        
-        # 1. Speed reward - encourage high speed in the forward direction
-        speed_reward = speed_x / 300.0  # Normalize to approximately [0, 1]
-        
-        # 2. Track position penalty - encourage staying near center of track
-        position_penalty = -abs(track_pos) * 2.0  # Higher penalty for being off-center
-        
-        # 3. Angle penalty - encourage car to face forward
-        angle_penalty = -abs(angle) * 2.0
-        
-        # 4. Damage penalty - high penalty for taking damage
-        damage_penalty = -max(0, (damage - prev_damage) / 100.0) * 10.0
-        
-        # 5. Off-track penalty
-        off_track_penalty = 0.0
-        if abs(track_pos) >= 1.0:
-            off_track_penalty = -10.0
-        
-        # 6. Track sensor penalty - discourage getting too close to track edges
-        track_penalty = 0.0
-        if track:
-            # Minimum distance from any track edge
-            min_track_dist = min([s for s in track if s > 0.0], default=100.0)
-            if min_track_dist < 5.0:
-                track_penalty = -((5.0 - min_track_dist) / 5.0) * 2.0
-        
-        # 7. Progress reward - encourage making forward progress
-        progress_reward = 0.0
-        if previous_state and hasattr(previous_state, 'getDistRaced'):
-            prev_dist = previous_state.getDistRaced() if previous_state.getDistRaced() is not None else 0.0
-            curr_dist = car_state.getDistRaced() if car_state.getDistRaced() is not None else 0.0
-            progress_reward = (curr_dist - prev_dist) * 10.0  # Scale up progress reward
-        
-        # Combine rewards with weights
-        total_reward = (
-            speed_reward * 1.0 +           # Weight for speed
-            position_penalty * 0.5 +       # Weight for track position
-            angle_penalty * 0.2 +          # Weight for angle
-            damage_penalty * 2.0 +         # Weight for damage
-            off_track_penalty +            # Off-track is a hard penalty
-            track_penalty * 0.3 +          # Weight for track sensors
-            progress_reward * 2.0          # Weight for progress
-        )
-        
-        return total_reward
+# DDPGAgent settings RacingAI trains with; agent_config overrides any of them
+DEFAULT_AGENT_CONFIG = {
+    'hidden_size': 128,
+    'lr_actor': 1e-4,
+    'lr_critic': 1e-3,
+    'gamma': 0.99,
+    'tau': 1e-3,
+    'batch_size': 64,
+    'epsilon': 1.0,
+    'epsilon_decay': 0.9995,
+    'epsilon_min': 0.01,
+    'prefetch_batches': 2,
+    'segment_length': None,
+    'terminal_window': 0,
+    'noise': 'gaussian',
+    'num_critics': 1,
+    'critic_reduction': 'min',
+}
+
+
+def checkpoint_reward(filepath):
+    """Average reward in the name of a rolling checkpoint written by save_model, or None"""
+    match = re.search(r'_r(-?\d+(?:\.\d+)?)\.pt$', filepath)
+    return float(match.group(1)) if match else None
+
+
+def checkpoint_hidden_size(filepath):
+    """Hidden layer width of the actor in a saved checkpoint, or None if there is none"""
+    if not os.path.exists(filepath):
+        return None
+    checkpoint = torch.load(filepath)
+    return checkpoint['actor_state_dict']['fc1.weight'].shape[0]
 
 
 # Create a simple helper class to manage the ML pipeline
 class RacingAI:
     """Main class for managing the TORCS racing AI"""
     
-    def __init__(self, load_model_path=None):
-        """Initialize the racing AI"""
+    def __init__(self, load_model_path=None, buffer_size=10000, async_learning=False,
+                 publish_interval=100, inference_budget=0.010, quantize_inference=False,
+                 agent_config=None, updates_per_step=1.0):
+        """Initialize the racing AI
+
+        With async_learning the agent trains in a background thread and the
+        control loop only runs inference and stores transitions. Updated actor
+        weights reach the control loop every publish_interval updates, and
+        the learner runs at most updates_per_step updates per stored step.
+        Outside training, actions come from an InferenceSession that answers
+        with a heuristic when the network would exceed inference_budget
+        seconds of the tick; quantize_inference serves an int8 copy of the actor.
+        agent_config overrides entries of DEFAULT_AGENT_CONFIG.
+        """
         # Create state processor
         self.state_processor = StateProcessor()
         
@@ -480,25 +1067,33 @@ class RacingAI:
         # Define action dimension (steering, acceleration, brake)
         action_dim = 3
         
+        unknown = set(agent_config or {}) - set(DEFAULT_AGENT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown agent settings: {', '.join(sorted(unknown))}")
+        config = dict(DEFAULT_AGENT_CONFIG, **(agent_config or {}))
+        
+        # Size the networks after the checkpoint, which may be a distilled student
+        hidden_size = checkpoint_hidden_size(load_model_path) if load_model_path else None
+        if hidden_size:
+            config['hidden_size'] = hidden_size
+        
         # Create DDPG agent
         self.agent = DDPGAgent(
             state_size=state_dim,
             action_size=action_dim,
-            hidden_size=128,
-            lr_actor=1e-4,
-            lr_critic=1e-3,
-            gamma=0.99,
-            tau=1e-3,
-            batch_size=64,
-            epsilon=1.0,
-            epsilon_decay=0.9995,
-            epsilon_min=0.01
+            buffer_size=buffer_size,
+            **config
         )
         
         # Load a pre-trained model if provided
         if load_model_path:
             self.agent.load_model(load_model_path)
         
+        # Decoupled learner
+        self.async_learning = async_learning
+        if async_learning:
+            self.agent.start_learner(publish_interval=publish_interval, updates_per_step=updates_per_step)
+        
         # Training parameters
         self.episode_count = 0
         self.step_count = 0
@@ -506,18 +1101,25 @@ class RacingAI:
         self.prev_action = None
         self.episode_reward = 0.0
         self.training_mode = True  # Set to False for deployment/evaluation
+        self.inference_budget = inference_budget
+        self.quantize_inference = quantize_inference
+        self.inference_session = None
+        self.weight_subscriber = None
         
         # Create directories for saving results
         self.results_dir = 'results'
         os.makedirs(self.results_dir, exist_ok=True)
     
-    def get_action(self, car_state):
+    def get_action(self, car_state, tick_start=None):
         """Get action from agent based on current state"""
         # Process state for the agent
         state = self.state_processor.process_state(car_state)
         
         # Get action from agent (with noise in training mode)
-        action = self.agent.get_action(state, add_noise=self.training_mode)
+        if self.inference_session is not None:
+            action = self.inference_session.act(state, car_state, tick_start)
+        else:
+            action = self.agent.get_action(state, add_noise=self.training_mode)
         
         # Process action for car control
         steering, accel, brake = self.state_processor.process_action(action)
@@ -544,10 +1146,12 @@ class RacingAI:
         self.episode_reward += reward
         
         # Add experience to memory
-        self.agent.remember(prev_state_vec, self.prev_action, reward, current_state, done)
+        self.agent.remember(prev_state_vec, self.prev_action, reward, current_state, done,
+                            dist_from_start=car_state.getDistFromStart())
         
-        # Train the agent
-        if len(self.agent.replay_buffer) > self.agent.batch_size:
+        # Train the agent, unless a background learner or the weights publisher does
+        if (not self.async_learning and self.weight_subscriber is None
+                and len(self.agent.replay_buffer) > self.agent.batch_size):
             self.agent.train()
         
         # Update step count
@@ -564,12 +1168,20 @@ class RacingAI:
         print(f"Episode {self.episode_count}: Reward = {self.episode_reward:.2f}, "
               f"Steps = {self.step_count}, Epsilon = {self.agent.epsilon:.4f}")
         
+        # Local collectors get the weights of every finished episode
+        if self.agent.weight_publisher is not None:
+            self.agent.publish_policy()
+        
         # Save model periodically
         if self.episode_count % 10 == 0:
             # Calculate average reward over last 10 episodes
             avg_reward = np.mean(self.agent.reward_history[-10:])
             self.agent.save_checkpoint(self.episode_count, avg_reward)
         
+        # Exploration noise and state histories restart with the episode
+        self.agent.noise.reset()
+        self.state_processor.reset()
+        
         # Reset episode counters
         self.step_count = 0
         self.episode_reward = 0.0
@@ -580,6 +1192,47 @@ class RacingAI:
         """Set whether the agent is training or evaluating"""
         self.training_mode = mode
         print(f"Training mode: {mode}")
+        
+        # Serve evaluation ticks from a frozen copy of the actor
+        self.inference_session = None
+        if not mode:
+            self.inference_session = InferenceSession(self.agent.actor, self.state_processor.get_state_dim(),
+                                                      budget=self.inference_budget,
+                                                      quantize=self.quantize_inference)
+    
+    def subscribe_weights(self, name):
+        """Act with actor weights published by another process through share_weights
+
+        The publishing process owns training, so this agent stops training
+        its own actor. It cannot be combined with async_learning, whose
+        learner would overwrite the subscribed weights.
+        """
+        if self.async_learning:
+            raise ValueError("Weights from a shared channel cannot be combined with async_learning")
+        self.weight_subscriber = WeightSubscriber(name)
+        self.refresh_weights()
+    
+    def refresh_weights(self):
+        """Load newly published weights into the actor used for control, if there are any
+
+        The inference session freezes the new weights on a helper thread and
+        keeps serving the previous ones until that is done.
+        """
+        flat = self.weight_subscriber.poll()
+        if flat is None:
+            return False
+        
+        with self.agent.policy_lock, torch.no_grad():
+            vector_to_parameters(torch.from_numpy(flat), self.agent.policy_actor.parameters())
+        if self.inference_session is not None:
+            self.inference_session.load_async(self.agent.policy_actor)
+        return True
+    
+    def close(self):
+        """Stop background workers and finish pending saves"""
+        if self.weight_subscriber is not None:
+            self.weight_subscriber.close()
+        self.agent.close()
     
     def save_results(self):
         """Save training results to file"""
@@ -596,4 +1249,72 @@ class RacingAI:
         with open(results_file, 'wb') as f:
             pickle.dump(results, f)
         
-        print(f"Results saved to {results_file}")
\ No newline at end of file
+        print(f"Results saved to {results_file}")
+
+
+def benchmark_train_step(batch_sizes=(64, 256, 1024), n_steps=200, state_size=53, action_size=3,
+                         hidden_size=128, compile_mode=None, num_critics=1):
+    """Compare updates per second of the fused train step against the old eager update"""
+    def legacy_step(agent, states, actions, rewards, next_states, dones):
+        # The update as DDPGAgent used to run it
+        with torch.no_grad():
+            target_q = agent.critic_target(next_states, agent.actor_target(next_states))
+            target_value = rewards + (1 - dones) * agent.gamma * target_q
+        critic_loss = F.mse_loss(agent.critic(states, actions), target_value)
+        agent.critic_optimizer.zero_grad()
+        critic_loss.backward()
+        agent.critic_optimizer.step()
+        actor_loss = -agent.critic(states, agent.actor(states)).mean()
+        agent.actor_optimizer.zero_grad()
+        actor_loss.backward()
+        agent.actor_optimizer.step()
+        for target, source in ((agent.actor_target, agent.actor), (agent.critic_target, agent.critic)):
+            for target_param, param in zip(target.parameters(), source.parameters()):
+                target_param.data.copy_(agent.tau * param.data + (1.0 - agent.tau) * target_param.data)
+        return critic_loss.item(), actor_loss.item()
+    
+    results = {}
+    for batch_size in batch_sizes:
+        batch = (torch.rand(batch_size, state_size), torch.rand(batch_size, action_size),
+                 torch.rand(batch_size, 1), torch.rand(batch_size, state_size),
+                 (torch.rand(batch_size, 1) < 0.01).float())
+        
+        legacy_agent = DDPGAgent(state_size, action_size, hidden_size, batch_size=batch_size)
+        fused_agent = DDPGAgent(state_size, action_size, hidden_size, batch_size=batch_size,
+                                compile_mode=compile_mode, num_critics=num_critics)
+        # Match the optimizers the old update used
+        legacy_agent.actor_optimizer = optim.Adam(legacy_agent.actor.parameters(), lr=1e-4)
+        legacy_agent.critic_optimizer = optim.Adam(legacy_agent.critic.parameters(), lr=1e-3)
+        
+        for name, step_fn in (("eager", lambda: legacy_step(legacy_agent, *batch)),
+                              ("fused", lambda: fused_agent._train_on_batch(*batch))):
+            for _ in range(10):
+                step_fn()  # warm up / compile
+            start = time.perf_counter()
+            for _ in range(n_steps):
+                step_fn()
+            fused_agent.loss_history  # include the deferred host copies
+            elapsed = time.perf_counter() - start
+            results[(batch_size, name)] = n_steps / elapsed
+        
+        for agent in (legacy_agent, fused_agent):
+            agent.close()
+        
+        speedup = results[(batch_size, "fused")] / results[(batch_size, "eager")]
+        print(f"batch {batch_size:5d}: eager {results[(batch_size, 'eager')]:8.1f} updates/s, "
+              f"fused {results[(batch_size, 'fused')]:8.1f} updates/s ({speedup:.2f}x)")
+    
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the DDPGAgent train step')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--steps', type=int, default=200, help='Updates per measurement')
+    parser.add_argument('--compile', choices=['none', 'compile', 'script'], default='none',
+                        help='Compile mode of the fused step')
+    parser.add_argument('--num-critics', type=int, default=1, help='Critic ensemble size of the fused step')
+    args = parser.parse_args()
+    benchmark_train_step(args.batch_sizes, args.steps,
+                         compile_mode=None if args.compile == 'none' else args.compile,
+                         num_critics=args.num_critics)
@@ -0,0 +1,245 @@
+import argparse
+import json
+
+import numpy as np
+
+
+def _sigmoid(x):
+    """In-place logistic function"""
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1.0
+    np.reciprocal(x, out=x)
+
+
+ACTIVATIONS = {
+    'linear': None,
+    'relu': lambda x: np.maximum(x, 0.0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'sigmoid': _sigmoid,
+}
+
+
+def _inbound_names(layer_config):
+    """Names of the layers feeding a layer, for Keras 2 and Keras 3 model configs"""
+    names = []
+
+    def visit(node):
+        if isinstance(node, dict):
+            history = node.get('config', {}).get('keras_history') if node.get('class_name') == '__keras_tensor__' else None
+            if history:
+                names.append(history[0])
+                return
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, (list, tuple)):
+            # Keras 2 stores inbound tensors as [layer_name, node_index, tensor_index, kwargs]
+            if len(node) >= 3 and isinstance(node[0], str) and isinstance(node[1], int):
+                names.append(node[0])
+                return
+            for value in node:
+                visit(value)
+
+    visit(layer_config.get('inbound_nodes', []))
+    return names
+
+
+class NumpyActor(object):
+    """Pure-NumPy inference engine for the Keras actor.
+
+    Runs the Dense/concatenate graph of a functional Keras model with float32
+    weights and preallocated activation buffers, so a single-row prediction
+    costs a handful of small matmuls instead of a Keras predict() dispatch.
+    TensorFlow is never imported.
+    """
+
+    def __init__(self, config, weights):
+        """
+        Args:
+            config: Functional model config, as found in actormodel.json.
+            weights: Dict mapping Dense layer names to (kernel, bias) arrays.
+        """
+        self.layers = []
+        for layer in config['layers']:
+            kind = layer['class_name']
+            name = layer.get('name', layer['config'].get('name'))
+            spec = {'name': name, 'kind': kind, 'inputs': _inbound_names(layer)}
+
+            if kind == 'InputLayer':
+                shape = layer['config'].get('batch_input_shape') or layer['config'].get('batch_shape')
+                spec['units'] = shape[-1]
+            elif kind == 'Dense':
+                kernel, bias = weights[name]
+                spec['kernel'] = np.ascontiguousarray(kernel, dtype=np.float32)
+                spec['bias'] = np.ascontiguousarray(bias, dtype=np.float32)
+                spec['units'] = spec['kernel'].shape[1]
+                spec['activation'] = ACTIVATIONS[layer['config'].get('activation', 'linear')]
+            elif kind == 'Concatenate':
+                spec['units'] = None  # resolved below
+            else:
+                raise ValueError(f"Unsupported layer type for NumPy inference: {kind}")
+            self.layers.append(spec)
+
+        by_name = {layer['name']: layer for layer in self.layers}
+        for layer in self.layers:
+            if layer['kind'] == 'Concatenate':
+                layer['units'] = sum(by_name[name]['units'] for name in layer['inputs'])
+
+        self.input_name = self.layers[0]['name']
+        self.output_name = self.layers[-1]['name']
+        self.state_dim = by_name[self.input_name]['units']
+        self.action_dim = by_name[self.output_name]['units']
+
+        self._batch_size = 0
+        self._buffers = {}
+        self._allocate(1)
+
+    @classmethod
+    def from_files(cls, json_path='actormodel.json', weights_path='actormodel.h5'):
+        """Load the architecture from the model JSON and weights from a Keras HDF5 weight file"""
+        import h5py
+
+        with open(json_path) as f:
+            model_json = json.load(f)
+        # playGame json.dumps the string returned by to_json(), so it is encoded twice
+        if isinstance(model_json, str):
+            model_json = json.loads(model_json)
+        config = model_json['config']
+
+        weights = {}
+        with h5py.File(weights_path, 'r') as f:
+            root = f['model_weights'] if 'model_weights' in f else f
+            for layer in config['layers']:
+                if layer['class_name'] != 'Dense':
+                    continue
+                group = root[layer['config']['name']]
+                names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs['weight_names']]
+                kernel = next(group[n][()] for n in names if 'kernel' in n)
+                bias = next(group[n][()] for n in names if 'bias' in n)
+                weights[layer['config']['name']] = (kernel, bias)
+
+        return cls(config, weights)
+
+    @classmethod
+    def from_model(cls, model):
+        """Build an engine from a live Keras model"""
+        config = json.loads(model.to_json())['config']
+        weights = {layer.name: tuple(layer.get_weights()) for layer in model.layers if layer.get_weights()}
+        return cls(config, weights)
+
+    @classmethod
+    def from_npz(cls, path):
+        """Load an engine written by save_npz"""
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data['config']))
+            weights = {name: (data[name + '/kernel'], data[name + '/bias'])
+                       for name in config['dense_layers']}
+        return cls(config, weights)
+
+    def save_npz(self, path):
+        """Write the config and float32 weights to a lightweight .npz file"""
+        config = {'layers': [], 'dense_layers': []}
+        arrays = {}
+        for layer in self.layers:
+            entry = {'class_name': layer['kind'], 'name': layer['name'], 'config': {'name': layer['name']},
+                     'inbound_nodes': [[[name, 0, 0, {}] for name in layer['inputs']]] if layer['inputs'] else []}
+            if layer['kind'] == 'InputLayer':
+                entry['config']['batch_input_shape'] = [None, layer['units']]
+            elif layer['kind'] == 'Dense':
+                entry['config']['activation'] = next(k for k, v in ACTIVATIONS.items() if v is layer['activation'])
+                config['dense_layers'].append(layer['name'])
+                arrays[layer['name'] + '/kernel'] = layer['kernel']
+                arrays[layer['name'] + '/bias'] = layer['bias']
+            config['layers'].append(entry)
+        np.savez(path, config=json.dumps(config), **arrays)
+
+    def load_weights_from_model(self, model):
+        """Copy the current weights of a live Keras model into the engine in place
+
+        Dense layers are matched in order, so any model built by the same
+        constructor works even when Keras gave its layers other names.
+        """
+        self.set_weights(model.get_weights())
+
+    def set_weights(self, weights):
+        """Copy a flat [kernel, bias, kernel, bias, ...] list, as returned by Keras get_weights(), in place"""
+        dense_layers = [layer for layer in self.layers if layer['kind'] == 'Dense']
+        for index, layer in enumerate(dense_layers):
+            np.copyto(layer['kernel'], weights[2 * index])
+            np.copyto(layer['bias'], weights[2 * index + 1])
+
+    def _allocate(self, batch_size):
+        """(Re)allocate activation buffers for a batch size"""
+        self._batch_size = batch_size
+        self._buffers = {layer['name']: np.empty((batch_size, layer['units']), dtype=np.float32)
+                         for layer in self.layers}
+
+    def predict(self, states):
+        """Run the actor on a (batch, state_dim) or (state_dim,) input.
+
+        The returned array is an internal buffer that the next call overwrites.
+        """
+        states = np.asarray(states, dtype=np.float32)
+        if states.ndim == 1:
+            states = states.reshape(1, -1)
+        if states.shape[0] != self._batch_size:
+            self._allocate(states.shape[0])
+
+        buffers = self._buffers
+        for layer in self.layers:
+            out = buffers[layer['name']]
+            kind = layer['kind']
+            if kind == 'InputLayer':
+                np.copyto(out, states)
+            elif kind == 'Dense':
+                np.matmul(buffers[layer['inputs'][0]], layer['kernel'], out=out)
+                out += layer['bias']
+                if layer['activation'] is not None:
+                    layer['activation'](out)
+            else:
+                np.concatenate([buffers[name] for name in layer['inputs']], axis=1, out=out)
+
+        return buffers[self.output_name]
+
+
+def race(episodes=1, max_steps=100000, json_path='actormodel.json', weights_path='actormodel.h5',
+         tflite_path=None):
+    """Drive the trained actor in TORCS without importing TensorFlow
+
+    With tflite_path, the int8 actor written by quantizeActor.py drives instead.
+    """
+    from gym_torcs import TorcsEnv
+
+    if tflite_path is not None:
+        from quantizeActor import TFLiteActor
+        actor = TFLiteActor(model_path=tflite_path)
+    else:
+        actor = NumpyActor.from_files(json_path, weights_path)
+    env = TorcsEnv(vision=False, throttle=True, gear_change=False)
+
+    for i in range(episodes):
+        ob = env.reset(relaunch=(i == 0))
+        total_reward = 0.
+        for j in range(max_steps):
+            s_t = np.hstack((ob.angle, ob.track, ob.trackPos, ob.speedX, ob.speedY, ob.speedZ, ob.wheelSpinVel/100.0, ob.rpm))
+            a_t = actor.predict(s_t)[0].copy()
+            a_t[0] = a_t[0] / 4  # same steering scale playGame applies
+            ob, r_t, done, info = env.step(a_t)
+            total_reward += r_t
+            if done:
+                break
+        print("TOTAL REWARD @ " + str(i) + "-th Episode  : Reward " + str(total_reward))
+
+    env.end()
+    print("Finish.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Race the Keras actor with NumPy inference')
+    parser.add_argument('--episodes', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=100000)
+    parser.add_argument('--json', default='actormodel.json')
+    parser.add_argument('--weights', default='actormodel.h5')
+    parser.add_argument('--tflite', default=None, help='int8 actor from quantizeActor.py')
+    args = parser.parse_args()
+    race(args.episodes, args.steps, args.json, args.weights, args.tflite)
@@ -4,7 +4,8 @@ import sys
 import getopt
 import os
 import time
-from ddpg import playGame
+
+from lazyImport import timed_import, import_report
 
 # Initialize help messages
 ophelp = 'Options:\n'
@@ -17,7 +18,10 @@ ophelp += ' --track, -t <track>  Your name for this track. Used for learning. [u
 ophelp += ' --stage, -s <#>      0=warm up, 1=qualifying, 2=race, 3=unknown. [3]\n'
 ophelp += ' --debug, -d          Output full telemetry.\n'
 ophelp += ' --train              Enable training mode.\n'
+ophelp += ' --race               Race the saved actor with NumPy inference (no TensorFlow).\n'
+ophelp += ' --inference <name>   Actor inference engine for playGame: keras or numpy. [keras]\n'
 ophelp += ' --timeout <#>        Socket timeout. [1.0]\n'
+ophelp += ' --import-report      Print how long framework imports took at startup.\n'
 ophelp += ' --help, -h           Show this help.\n'
 ophelp += ' --version, -v        Show current version.'
 usage = 'Usage: %s [ophelp [optargs]] \n' % sys.argv[0]
@@ -35,13 +39,17 @@ def main():
     stage = 3
     debug = False
     train = True
+    race = False
+    inference = 'keras'
     timeout = 1.0
+    show_imports = False
     
     try:
         opts, args = getopt.getopt(sys.argv[1:], 'H:p:i:m:e:t:s:dhv',
                                   ['host=', 'port=', 'id=', 'steps=',
                                    'episodes=', 'maxEpisodes=', 'track=', 'stage=',
-                                   'debug', 'train', 'timeout=', 'help', 'version'])
+                                   'debug', 'train', 'race', 'inference=', 'timeout=', 'import-report',
+                                   'help', 'version'])
     except getopt.error as why:
         print('getopt error: %s\n%s' % (why, usage))
         sys.exit(-1)
@@ -68,8 +76,15 @@ def main():
             max_steps = int(arg)
         if opt == '--train':
             train = True
+        if opt == '--race':
+            race = True
+            train = False
+        if opt == '--inference':
+            inference = arg
         if opt == '--timeout':
             timeout = float(arg)
+        if opt == '--import-report':
+            show_imports = True
         if opt == '-v' or opt == '--version':
             print('%s %s' % (sys.argv[0], version))
             sys.exit(0)
@@ -84,11 +99,23 @@ def main():
     print(f"  Stage: {stage}")
     print(f"  Debug: {debug}")
     print(f"  Training: {train}")
+    print(f"  Race only: {race}")
     print(f"  Timeout: {timeout}s\n")
     
+    # Race-only mode never imports TensorFlow
+    if race:
+        race_actor = timed_import('numpyActor').race
+        if show_imports:
+            print(import_report())
+        race_actor(episodes=max_episodes, max_steps=max_steps)
+        return 0
+
     # Run the game
+    playGame = timed_import('ddpg').playGame
+    if show_imports:
+        print(import_report())
     train_indicator = 1 if train else 0
-    playGame(train_indicator=train_indicator)
+    playGame(train_indicator=train_indicator, inference=inference)
     
     return 0
 
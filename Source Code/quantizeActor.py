@@ -0,0 +1,273 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+
+def quantize_torch_actor(actor):
+    """
+    Post-training int8 quantization of an ActorNetwork
+
+    Linear weights are stored as int8 with one scale per output channel;
+    activations are quantized on the fly at inference time.
+
+    Returns:
+        A quantized copy in eval mode. The original actor is left untouched.
+    """
+    import copy
+    import torch # type: ignore
+    from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic # type: ignore
+
+    model = copy.deepcopy(actor).eval()
+    return quantize_dynamic(model, {torch.nn.Linear: per_channel_dynamic_qconfig}, dtype=torch.qint8)
+
+
+def save_torch_quantized(quantized_actor, path, state_size):
+    """Trace a quantized actor and save it as TorchScript, loadable with torch.jit.load"""
+    import torch # type: ignore
+
+    with torch.inference_mode():
+        traced = torch.jit.trace(quantized_actor, torch.zeros(1, state_size))
+    torch.jit.save(traced, path)
+    return path
+
+
+def quantize_keras_actor(model):
+    """
+    Post-training int8 quantization of the Keras actor as a TFLite flatbuffer
+
+    Uses dynamic-range quantization: Dense kernels become int8 with
+    per-channel scales, activations stay float at the model boundary.
+
+    Returns:
+        The flatbuffer as bytes.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    return converter.convert()
+
+
+def keras_model_from_engine(engine):
+    """Rebuild a Keras model from a NumpyActor graph
+
+    Works for actor files written by any Keras version, since only the layer
+    graph and float weights are carried over.
+    """
+    from tensorflow.keras.layers import Dense, Input, concatenate
+    from tensorflow.keras.models import Model
+    from numpyActor import ACTIVATIONS
+
+    tensors = {}
+    dense_weights = []
+    for layer in engine.layers:
+        if layer['kind'] == 'InputLayer':
+            tensors[layer['name']] = Input(shape=[layer['units']])
+        elif layer['kind'] == 'Dense':
+            activation = next(k for k, v in ACTIVATIONS.items() if v is layer['activation'])
+            tensors[layer['name']] = Dense(layer['units'], activation=activation)(tensors[layer['inputs'][0]])
+            dense_weights += [layer['kernel'], layer['bias']]
+        else:
+            tensors[layer['name']] = concatenate([tensors[name] for name in layer['inputs']])
+
+    model = Model(inputs=tensors[engine.input_name], outputs=tensors[engine.output_name])
+    model.set_weights(dense_weights)
+    return model
+
+
+class TFLiteActor(object):
+    """Runs a quantized actor flatbuffer with the TFLite interpreter"""
+
+    def __init__(self, model_content=None, model_path=None):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_content=model_content, model_path=model_path)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.state_dim = int(self.interpreter.get_input_details()[0]['shape'][-1])
+        self._batch_size = 1
+
+    def predict(self, states):
+        """Run the actor on a (batch, state_dim) or (state_dim,) input"""
+        states = np.asarray(states, dtype=np.float32)
+        if states.ndim == 1:
+            states = states.reshape(1, -1)
+        if states.shape[0] != self._batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, states.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = states.shape[0]
+
+        self.interpreter.set_tensor(self.input_index, states)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+
+def keras_states_from_columns(columns):
+    """
+    Rebuild playGame's 29-dim observations from telemetry columns
+
+    Applies the same scaling as gym_torcs.make_observaton followed by the
+    hstack in ddpg.playGame.
+    """
+    return np.column_stack([
+        columns['angle'] / 3.1416,
+        columns['track'] / 200.0,
+        columns['trackPos'],
+        columns['speedX'] / 300.0,
+        columns['speedY'] / 300.0,
+        columns['speedZ'] / 300.0,
+        columns['wheelSpinVel'] / 100.0,
+        columns['rpm'] / 10000.0,
+    ]).astype(np.float32)
+
+
+def _time_per_call(predict, states, calls):
+    """Median seconds per single-row prediction"""
+    samples = []
+    for i in range(calls):
+        state = states[i % len(states)]
+        start = time.perf_counter()
+        predict(state)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def validate(float_predict, quant_predict, states, calls=2000, batch_size=256):
+    """
+    Replay states through a float and a quantized actor and compare them
+
+    Args:
+        float_predict: Maps a (state_dim,) or (batch, state_dim) array to actions.
+        quant_predict: Same, for the quantized actor.
+        states: (N, state_dim) array of recorded states.
+        calls: Number of single-row calls timed per actor.
+        batch_size: Rows per call when comparing actions.
+
+    Returns:
+        Dict with per-action mean/max absolute error, latencies and speedup.
+    """
+    errors = []
+    for start in range(0, len(states), batch_size):
+        batch = states[start:start + batch_size]
+        errors.append(np.abs(np.array(float_predict(batch)) - np.array(quant_predict(batch))))
+    errors = np.concatenate(errors)
+
+    # Warm up both before timing
+    _time_per_call(float_predict, states, 50)
+    _time_per_call(quant_predict, states, 50)
+    float_time = _time_per_call(float_predict, states, calls)
+    quant_time = _time_per_call(quant_predict, states, calls)
+
+    return {
+        'states': len(states),
+        'mean_abs_error': errors.mean(axis=0),
+        'max_abs_error': errors.max(axis=0),
+        'float_us': float_time * 1e6,
+        'quant_us': quant_time * 1e6,
+        'speedup': float_time / quant_time,
+    }
+
+
+def print_report(report, float_size=None, quant_size=None):
+    """Print a validation report"""
+    names = ['steering', 'acceleration', 'brake']
+    print(f"Replayed {report['states']} states")
+    for i, name in enumerate(names[:len(report['mean_abs_error'])]):
+        print(f"  {name:<13} mean |error| {report['mean_abs_error'][i]:.5f}   "
+              f"max |error| {report['max_abs_error'][i]:.5f}")
+    print(f"  float latency {report['float_us']:8.1f} us/call")
+    print(f"  int8 latency  {report['quant_us']:8.1f} us/call   ({report['speedup']:.2f}x)")
+    if float_size and quant_size:
+        print(f"  weights       {float_size / 1024:8.1f} KiB -> {quant_size / 1024:.1f} KiB")
+
+
+def _load_states(paths, keras):
+    """Recorded states from telemetry logs, in the layout the chosen actor expects"""
+    from telemetryImporter import episode_boundaries, load_telemetry_arrays
+
+    columns = load_telemetry_arrays(paths)
+    if columns is None:
+        raise SystemExit("No telemetry files found.")
+    if keras:
+        return keras_states_from_columns(columns)
+
+    from stateProcessor import StateProcessor
+    return StateProcessor().process_batch(columns, episode_starts=episode_boundaries(columns))
+
+
+def main():
+    """Quantize a trained actor and validate it against the float one on recorded states"""
+    parser = argparse.ArgumentParser(description='int8 post-training quantization of the actor')
+    parser.add_argument('stack', choices=['torch', 'keras'], help='Which actor to quantize')
+    parser.add_argument('--model', default=os.path.join('models', 'best_model.pt'), help='DDPGAgent checkpoint (torch)')
+    parser.add_argument('--json', default='actormodel.json', help='Actor architecture (keras)')
+    parser.add_argument('--weights', default='actormodel.h5', help='Actor weights (keras)')
+    parser.add_argument('--telemetry', nargs='*', default=None, help='Telemetry CSV files [logs/telemetry_*.csv]')
+    parser.add_argument('--out', default=None, help='Where to write the quantized actor')
+    parser.add_argument('--calls', type=int, default=2000, help='Timed single-row calls per actor')
+    args = parser.parse_args()
+
+    paths = args.telemetry or sorted(glob.glob(os.path.join('logs', 'telemetry_*.csv')))
+    states = _load_states(paths, keras=args.stack == 'keras')
+
+    if args.stack == 'torch':
+        import torch # type: ignore
+        from inferenceSession import InferenceSession
+        from learningAgent import ActorNetwork
+
+        actor_state = torch.load(args.model)['actor_state_dict']
+        hidden_size, state_size = actor_state['fc1.weight'].shape
+        actor = ActorNetwork(state_size, actor_state['fc3.weight'].shape[0], hidden_size)
+        actor.load_state_dict(actor_state)
+
+        # Compare the serving paths race mode would actually use
+        float_session = InferenceSession(actor, state_size)
+        quant_session = InferenceSession(actor, state_size, quantize=True)
+
+        def batch_predict(session):
+            def predict(states):
+                with torch.inference_mode():
+                    return session.model(torch.as_tensor(np.atleast_2d(states), dtype=torch.float32)).numpy()
+            return predict
+
+        report = validate(batch_predict(float_session), batch_predict(quant_session), states, args.calls)
+        float_size = sum(p.numel() * 4 for p in actor.parameters())
+        quant_size = sum(p.numel() + 4 * p.shape[0] for name, p in actor.named_parameters() if 'weight' in name) + \
+            sum(p.numel() * 4 for name, p in actor.named_parameters() if 'bias' in name)
+        print_report(report, float_size, quant_size)
+
+        # Not a .pt, so the *.pt globs over training checkpoints never pick it up
+        out = args.out or os.path.join('models', 'race_actor_int8.torchscript')
+        save_torch_quantized(quantize_torch_actor(actor), out, state_size)
+    else:
+        from numpyActor import NumpyActor
+
+        # NumpyActor is the float engine race mode runs
+        float_actor = NumpyActor.from_files(args.json, args.weights)
+        model = keras_model_from_engine(float_actor)
+
+        flatbuffer = quantize_keras_actor(model)
+        quant_actor = TFLiteActor(model_content=flatbuffer)
+
+        report = validate(lambda s: float_actor.predict(s).copy(), lambda s: quant_actor.predict(s).copy(),
+                          states, args.calls)
+        float_size = sum(w.size * 4 for w in model.get_weights())
+        print_report(report, float_size, len(flatbuffer))
+
+        out = args.out or 'actormodel_int8.tflite'
+        with open(out, 'wb') as f:
+            f.write(flatbuffer)
+
+    print(f"Quantized actor written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+
+from numpyActor import NumpyActor
+from stateProcessor import StateProcessor
+
+RACE_ACTOR_PATH = os.path.join('models', 'race_actor.npz')
+
+
+class RacePolicy(object):
+    """Race-mode stand-in for RacingAI that never imports torch.
+
+    Loads the actor exported by DDPGAgent.export_actor and maps car states
+    to controls with NumpyActor. It exposes the parts of the RacingAI
+    interface the driver uses outside training.
+    """
+
+    def __init__(self, actor_path=RACE_ACTOR_PATH):
+        self.state_processor = StateProcessor()
+        self.actor = NumpyActor.from_npz(actor_path)
+
+        self.episode_count = 0
+        self.episode_reward = 0.0
+        self.training_mode = False
+
+        print(f"Race policy loaded from {actor_path}")
+
+    def get_action(self, car_state, tick_start=None):
+        """Get the noise-free action for the current state
+
+        NumPy inference takes microseconds, so no tick budget is enforced.
+        """
+        state = self.state_processor.process_state(car_state)
+        action = self.actor.predict(state)[0]
+        return self.state_processor.process_action(action)
+
+    def learn(self, car_state, done=False):
+        """Race mode does not learn"""
+        return
+
+    def episode_end(self):
+        """Handle end of episode"""
+        self.episode_count += 1
+        self.episode_reward = 0.0
+        self.state_processor.reset()
+
+    def set_training_mode(self, mode):
+        """Only evaluation is supported without torch"""
+        if mode:
+            raise ValueError("RacePolicy cannot train; use learningAgent.RacingAI")
+        print("Training mode: False")
+
+    def close(self):
+        """Nothing runs in the background"""
+        return
+
+
+def export_race_actor(model_path, actor_path=RACE_ACTOR_PATH):
+    """Convert a DDPGAgent checkpoint into the race actor file"""
+    import torch
+    from learningAgent import ActorNetwork
+
+    checkpoint = torch.load(model_path)
+    actor_state = checkpoint['actor_state_dict']
+    hidden_size, state_size = actor_state['fc1.weight'].shape
+    action_size = actor_state['fc3.weight'].shape[0]
+
+    actor = ActorNetwork(state_size, action_size, hidden_size)
+    actor.load_state_dict(actor_state)
+    actor.to_numpy().save_npz(actor_path)
+    print(f"Race actor written to {actor_path}")
+    return actor_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export a DDPGAgent checkpoint for torch-free racing')
+    parser.add_argument('model', help='Checkpoint written by DDPGAgent.save_model')
+    parser.add_argument('--out', default=RACE_ACTOR_PATH, help='Race actor .npz path')
+    args = parser.parse_args()
+    export_race_actor(args.model, args.out)
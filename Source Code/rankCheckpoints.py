@@ -0,0 +1,234 @@
+import argparse
+import csv
+import glob
+import os
+import time
+
+import numpy as np
+import torch # type: ignore
+
+from distillActor import load_corpus
+from learningAgent import convert_critic_state
+
+RANKING_PATH = os.path.join('models', 'offline_ranking.csv')
+
+
+class StackedActors(object):
+    """K ActorNetworks of the same shape evaluated together.
+
+    The weights of every actor are stacked along a leading K axis so one
+    batched matrix multiply per layer runs all of them over the same states,
+    instead of K separate forward passes.
+    """
+
+    def __init__(self, actor_states):
+        """
+        Args:
+            actor_states: actor_state_dicts of identically shaped ActorNetworks.
+        """
+        def stack(name):
+            return torch.stack([state[name].detach().float() for state in actor_states])
+
+        # Stored as (K, in, out) so layers are x @ W + b
+        self.w1 = stack('fc1.weight').transpose(1, 2).contiguous()
+        self.b1 = stack('fc1.bias').unsqueeze(1)
+        self.w2 = stack('fc2.weight').transpose(1, 2).contiguous()
+        self.b2 = stack('fc2.bias').unsqueeze(1)
+        self.w3 = stack('fc3.weight').transpose(1, 2).contiguous()
+        self.b3 = stack('fc3.bias').unsqueeze(1)
+
+    def __len__(self):
+        return self.w1.shape[0]
+
+    @property
+    def state_size(self):
+        return self.w1.shape[1]
+
+    def __call__(self, states):
+        """Actions of every actor for a (N, state_size) batch, shaped (K, N, action_size)"""
+        # The states are shared, so the first layer broadcasts instead of copying them K times
+        x = torch.relu(torch.matmul(states, self.w1) + self.b1)
+        x = torch.relu(torch.baddbmm(self.b2, x, self.w2))
+        x = torch.baddbmm(self.b3, x, self.w3)
+        # Same output activations as ActorNetwork.forward
+        return torch.cat([torch.tanh(x[..., :1]), torch.sigmoid(x[..., 1:])], dim=-1)
+
+
+class ReferenceCritic(object):
+    """A checkpoint's critic, split so its state features are computed once for all actors"""
+
+    def __init__(self, critic_state):
+        self.w1 = critic_state['fc1.weight'].detach().float()
+        self.b1 = critic_state['fc1.bias'].detach().float()
+        hidden_size = self.w1.shape[0]
+        fc2 = critic_state['fc2.weight'].detach().float()
+        self.w2_state = fc2[:, :hidden_size].t().contiguous()
+        self.w2_action = fc2[:, hidden_size:].t().contiguous()
+        self.b2 = critic_state['fc2.bias'].detach().float()
+        self.w3 = critic_state['fc3.weight'].detach().float().t().contiguous()
+        self.b3 = critic_state['fc3.bias'].detach().float()
+
+    def __call__(self, states, actions):
+        """Q-values of (K, N, action_size) actions in (N, state_size) states, shaped (K, N)"""
+        # fc2 of CriticNetwork sees cat([relu(fc1(s)), a]); its state half is shared by every actor
+        shared = torch.relu(states @ self.w1.t() + self.b1) @ self.w2_state + self.b2
+        x = torch.relu(shared + torch.matmul(actions, self.w2_action))
+        return (torch.matmul(x, self.w3) + self.b3).squeeze(-1)
+
+
+def load_checkpoints(paths):
+    """
+    Group checkpoints into StackedActors by network shape
+
+    Returns:
+        List of (paths, StackedActors), one per distinct actor shape.
+        Unreadable checkpoints are reported and left out.
+    """
+    groups = {}
+    for path in paths:
+        try:
+            actor_state = torch.load(path)['actor_state_dict']
+        except Exception as e:
+            print(f"Failed to read {path}: {e!r}")
+            continue
+        shape = tuple(tuple(actor_state[name].shape) for name in ('fc1.weight', 'fc2.weight', 'fc3.weight'))
+        groups.setdefault(shape, ([], []))
+        groups[shape][0].append(path)
+        groups[shape][1].append(actor_state)
+    return [(group_paths, StackedActors(states)) for group_paths, states in groups.values()]
+
+
+def load_reference(path):
+    """Reference critic and actor of a checkpoint
+
+    The critic is None for actor-only checkpoints, and the first member of a critic ensemble.
+    """
+    checkpoint = torch.load(path)
+    critic = None
+    if 'critic_state_dict' in checkpoint:
+        critic = ReferenceCritic(convert_critic_state(checkpoint['critic_state_dict'], 1))
+    return critic, StackedActors([checkpoint['actor_state_dict']])
+
+
+def score_checkpoints(paths, states, critic=None, reference_actor=None, chunk_size=8192):
+    """
+    Score checkpoints offline over a corpus of recorded states
+
+    Args:
+        paths: Checkpoint files.
+        states: (N, state_size) processed states.
+        critic: ReferenceCritic valuing each actor's actions.
+        reference_actor: Single StackedActors whose actions the others are compared with.
+        chunk_size: States evaluated at once; bounds memory at K * chunk_size * hidden_size.
+
+    Returns:
+        One dict per checkpoint with the mean reference Q-value and/or the
+        mean squared difference from the reference actions.
+    """
+    states = torch.from_numpy(np.ascontiguousarray(states, dtype=np.float32))
+    rows = []
+    for group_paths, actors in load_checkpoints(paths):
+        if actors.state_size != states.shape[1]:
+            print(f"Skipping {len(actors)} checkpoints with state size {actors.state_size}, "
+                  f"the corpus has {states.shape[1]}")
+            continue
+
+        q_total = torch.zeros(len(actors), dtype=torch.float64)
+        error_total = torch.zeros(len(actors), dtype=torch.float64)
+        with torch.no_grad():
+            for first in range(0, len(states), chunk_size):
+                batch = states[first:first + chunk_size]
+                actions = actors(batch)
+                if critic is not None:
+                    q_total += critic(batch, actions).sum(dim=1, dtype=torch.float64)
+                if reference_actor is not None:
+                    error = (actions - reference_actor(batch)).pow(2).mean(dim=2)
+                    error_total += error.sum(dim=1, dtype=torch.float64)
+
+        for i, path in enumerate(group_paths):
+            rows.append({'checkpoint': path,
+                         'q': q_total[i].item() / len(states) if critic is not None else float('nan'),
+                         'action_mse': error_total[i].item() / len(states) if reference_actor is not None
+                         else float('nan')})
+    return rows
+
+
+def rank_rows(rows, by='q'):
+    """Best first: highest reference Q-value, or smallest distance from the reference actions"""
+    if by == 'q':
+        return sorted(rows, key=lambda r: -r['q'])
+    return sorted(rows, key=lambda r: r['action_mse'])
+
+
+def write_ranking(rows, path):
+    """Write the ranking as CSV"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rank', 'checkpoint', 'q', 'action_mse'])
+        for i, row in enumerate(rows, 1):
+            writer.writerow([i, row['checkpoint'], f"{row['q']:.5f}", f"{row['action_mse']:.6f}"])
+
+
+def main():
+    """Rank checkpoints offline and optionally send the best to track evaluation"""
+    parser = argparse.ArgumentParser(description='Simulator-free checkpoint ranking with batched actors')
+    parser.add_argument('paths', nargs='*', help='Checkpoints [models/*.pt]')
+    parser.add_argument('--reference', default=os.path.join('models', 'best_model.pt'),
+                        help='Checkpoint whose critic and actor are the reference')
+    parser.add_argument('--by', choices=['q', 'actions'], default='q',
+                        help='Rank by reference Q-value or by distance from the reference actions')
+    parser.add_argument('--telemetry', nargs='*', default=None, help='Telemetry CSV files [logs/telemetry_*.csv]')
+    parser.add_argument('--states', default=None, help='.npy/.npz of processed states, e.g. a replay dump')
+    parser.add_argument('--max-states', type=int, default=20000, help='States sampled from the corpus')
+    parser.add_argument('--chunk-size', type=int, default=8192, help='States per batched forward pass')
+    parser.add_argument('--threads', type=int, default=None, help='Torch intra-op threads')
+    parser.add_argument('--out', default=RANKING_PATH, help='Ranking CSV')
+    parser.add_argument('--top', type=int, default=5, help='Checkpoints to print and evaluate')
+    parser.add_argument('--evaluate', action='store_true',
+                        help='Evaluate the top checkpoints on track with evaluateCheckpoints')
+    parser.add_argument('--env', choices=['standin', 'torcs'], default='standin', help='Evaluation environment')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the state sample and the stand-in track')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    paths = args.paths or sorted(glob.glob(os.path.join('models', '*.pt')))
+    if not paths:
+        raise SystemExit("No checkpoints found.")
+
+    telemetry = args.telemetry
+    if telemetry is None and args.states is None:
+        telemetry = sorted(glob.glob(os.path.join('logs', 'telemetry_*.csv')))
+    states = load_corpus(telemetry, args.states)
+    if len(states) > args.max_states:
+        states = states[np.random.default_rng(args.seed).choice(len(states), args.max_states, replace=False)]
+
+    critic, reference_actor = load_reference(args.reference)
+    if args.by == 'q' and critic is None:
+        raise SystemExit(f"{args.reference} has no critic; use --by actions")
+
+    start = time.perf_counter()
+    rows = score_checkpoints(paths, states, critic=critic, reference_actor=reference_actor,
+                             chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    rows = rank_rows(rows, args.by)
+    write_ranking(rows, args.out)
+
+    print(f"Scored {len(rows)} checkpoints on {len(states)} states in {elapsed:.2f}s")
+    print(f"{'#':>3}  {'checkpoint':<44}{'q':>12}{'action mse':>12}")
+    for i, row in enumerate(rows[:args.top], 1):
+        print(f"{i:3d}  {os.path.basename(row['checkpoint']):<44}{row['q']:12.4f}{row['action_mse']:12.6f}")
+    print(f"\nRanking written to {args.out}")
+
+    if args.evaluate:
+        from evaluateCheckpoints import evaluate_checkpoints, print_leaderboard
+        print_leaderboard(evaluate_checkpoints([row['checkpoint'] for row in rows[:args.top]], env_name=args.env,
+                                               seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
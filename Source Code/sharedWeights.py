@@ -0,0 +1,288 @@
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Header words: sequence counter (odd while a write is in progress),
+# weights version, number of float32 parameters
+HEADER_WORDS = 3
+HEADER_BYTES = HEADER_WORDS * 8
+
+# Blocks created by this process; its tracker must keep them registered
+_CREATED = set()
+
+
+def flatten_arrays(arrays, out=None):
+    """Concatenate arrays into one float32 vector, written into out when given"""
+    total = sum(np.size(a) for a in arrays)
+    if out is None:
+        out = np.empty(total, dtype=np.float32)
+    offset = 0
+    for a in arrays:
+        n = np.size(a)
+        out[offset:offset + n] = np.ravel(a)
+        offset += n
+    return out
+
+
+def unflatten_arrays(flat, shapes):
+    """Split a flat vector into views with the given shapes"""
+    arrays = []
+    offset = 0
+    for shape in shapes:
+        n = int(np.prod(shape))
+        arrays.append(flat[offset:offset + n].reshape(shape))
+        offset += n
+    return arrays
+
+
+def _attach(name):
+    """Attach to an existing block without letting this process's resource tracker unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        import multiprocessing
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        # Children started by multiprocessing share the creator's tracker,
+        # which still has to clean the block up
+        if multiprocessing.parent_process() is None and name not in _CREATED:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class WeightPublisher(object):
+    """Single writer of a flat float32 parameter vector in shared memory.
+
+    A publication bumps the sequence counter to an odd value, copies the
+    vector in place, advances the version and bumps the counter back to even.
+    Readers in other processes use the counter to detect torn reads and the
+    version to skip reading weights they already have.
+    """
+
+    def __init__(self, size, name=None):
+        """
+        Args:
+            size: Number of float32 parameters in the vector.
+            name: Shared memory block name. A unique one is chosen if None.
+        """
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_BYTES + 4 * size)
+        self.name = self.shm.name
+        self.size = size
+        _CREATED.add(self.name)
+        self._header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self.shm.buf)
+        self._data = np.ndarray((size,), dtype=np.float32, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self._header[:] = (0, 0, size)
+
+    @property
+    def version(self):
+        return int(self._header[1])
+
+    def publish(self, flat):
+        """Copy a flat parameter vector into the channel and return the new version"""
+        header = self._header
+        header[0] += 1
+        np.copyto(self._data, flat, casting='same_kind')
+        header[1] += 1
+        header[0] += 1
+        return int(header[1])
+
+    def publish_arrays(self, arrays):
+        """Publish a list of arrays, e.g. Keras get_weights(), as one vector"""
+        header = self._header
+        header[0] += 1
+        flatten_arrays(arrays, out=self._data)
+        header[1] += 1
+        header[0] += 1
+        return int(header[1])
+
+    def close(self, unlink=True):
+        """Detach from the block and, by default, remove it"""
+        self._header = None
+        self._data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class WeightSubscriber(object):
+    """Reader of a WeightPublisher channel, usually in another process.
+
+    poll() costs one integer read while the version is unchanged; when it
+    moves, the vector is copied out and the copy is retried if a
+    publication overlapped it.
+    """
+
+    def __init__(self, name):
+        self.shm = _attach(name)
+        self.name = name
+        self._header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self.shm.buf)
+        self.size = int(self._header[2])
+        self._data = np.ndarray((self.size,), dtype=np.float32, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self._data.flags.writeable = False
+        self._buffer = np.empty(self.size, dtype=np.float32)
+        self.version = 0
+        self.retries = 0
+
+    def published_version(self):
+        """Version most recently published, without reading the weights"""
+        return int(self._header[1])
+
+    def _retry_deadline(self, deadline, timeout):
+        """Start the retry deadline on the first retry; raise once it has passed"""
+        now = time.perf_counter()
+        if deadline is None:
+            return now + timeout
+        if now > deadline:
+            raise TimeoutError(f"No consistent read of '{self.name}' within {timeout}s; "
+                               "the publisher may have died during a write")
+        return deadline
+
+    def read(self, out=None, timeout=1.0):
+        """Consistent copy of the current vector; returns (version, vector)
+
+        Raises TimeoutError when no publication-free copy could be taken for
+        timeout seconds, as when the writer died with the counter odd.
+        """
+        if out is None:
+            out = self._buffer
+        header = self._header
+        deadline = None
+        while True:
+            seq = int(header[0])
+            if not seq & 1:
+                version = int(header[1])
+                np.copyto(out, self._data)
+                if int(header[0]) == seq:
+                    return version, out
+            self.retries += 1
+            deadline = self._retry_deadline(deadline, timeout)
+
+    def poll(self, out=None, timeout=1.0):
+        """Copy of the vector if a newer version was published since the last read, else None"""
+        if int(self._header[1]) == self.version:
+            return None
+        self.version, flat = self.read(out, timeout)
+        return flat
+
+    def view(self, timeout=1.0):
+        """Read-only view of the shared vector and the sequence it was taken at
+
+        Nothing is copied. Pass the sequence to still_valid() once done with
+        the view to learn whether a publication overlapped its use. Raises
+        TimeoutError like read().
+        """
+        deadline = None
+        while True:
+            seq = int(self._header[0])
+            if not seq & 1:
+                return self._data, seq
+            deadline = self._retry_deadline(deadline, timeout)
+
+    def still_valid(self, seq):
+        """True when no publication started since view() returned seq"""
+        return int(self._header[0]) == seq
+
+    def close(self):
+        self._header = None
+        self._data = None
+        self.shm.close()
+
+
+def _benchmark_reader(name, versions, poll_interval, ready, latencies):
+    """Reader process for benchmark(): record when each version it sees arrived"""
+    subscriber = WeightSubscriber(name)
+    ready.release()
+    while subscriber.version < versions:
+        if subscriber.poll() is not None:
+            latencies.put((subscriber.version, time.perf_counter()))
+        else:
+            time.sleep(poll_interval)
+    latencies.put(None)
+    subscriber.close()
+
+
+def benchmark(size=24000, readers=4, versions=200, poll_interval=0.0005):
+    """
+    Compare publishing through shared memory with a file round trip
+
+    Args:
+        size: Parameters in the vector (the 128-wide actor has about 24k).
+        readers: Reader processes polling the channel.
+        versions: Number of publications.
+        poll_interval: Seconds a reader sleeps between polls, like a collector between ticks.
+
+    Returns:
+        Dict with publish cost and publish-to-reader latency for both channels, in microseconds.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    publisher = WeightPublisher(size)
+    ready = context.Semaphore(0)
+    latencies = context.Queue()
+    processes = [context.Process(target=_benchmark_reader,
+                                 args=(publisher.name, versions, poll_interval, ready, latencies))
+                 for _ in range(readers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.acquire()
+
+    weights = np.random.randn(size).astype(np.float32)
+    publish_times, published_at = [], {}
+    for version in range(1, versions + 1):
+        start = time.perf_counter()
+        publisher.publish(weights)
+        publish_times.append(time.perf_counter() - start)
+        published_at[version] = start
+        time.sleep(0.005)
+
+    # Readers may skip versions that were superseded before they polled
+    shm_latency = []
+    finished = 0
+    while finished < readers:
+        arrival = latencies.get()
+        if arrival is None:
+            finished += 1
+        else:
+            shm_latency.append(arrival[1] - published_at[arrival[0]])
+    for process in processes:
+        process.join()
+    publisher.close()
+
+    # The same vector through a file: write, atomic rename, read back
+    path = os.path.join(tempfile.mkdtemp(), 'weights.npy')
+    file_times = []
+    for _ in range(min(versions, 50)):
+        start = time.perf_counter()
+        np.save(path + '.tmp.npy', weights)
+        os.replace(path + '.tmp.npy', path)
+        for _ in range(readers):
+            np.load(path)
+        file_times.append(time.perf_counter() - start)
+    os.remove(path)
+
+    return {
+        'publish_us': float(np.median(publish_times)) * 1e6,
+        'shm_latency_us': float(np.median(shm_latency)) * 1e6,
+        'file_round_trip_us': float(np.median(file_times)) * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the shared-memory weight channel')
+    parser.add_argument('--size', type=int, default=24000, help='Parameters in the vector')
+    parser.add_argument('--readers', type=int, default=4, help='Reader processes')
+    parser.add_argument('--versions', type=int, default=200, help='Publications')
+    parser.add_argument('--poll-interval', type=float, default=0.0005, help='Reader sleep between polls (s)')
+    args = parser.parse_args()
+
+    result = benchmark(args.size, args.readers, args.versions, args.poll_interval)
+    print(f"Publish into shared memory:      {result['publish_us']:10.1f} us")
+    print(f"Publish to reader copy (median): {result['shm_latency_us']:10.1f} us")
+    print(f"File write and {args.readers} reads:       {result['file_round_trip_us']:10.1f} us")
@@ -0,0 +1,244 @@
+import numpy as np
+from collections import deque
+
+
+class StateProcessor:
+    """Process raw state information from TORCS into suitable inputs for the RL agent"""
+    
+    def __init__(self, num_track_sensors=19, num_opponent_sensors=36, history_len=5):
+        """Initialize the state processor"""
+        self.num_track_sensors = num_track_sensors
+        self.num_opponent_sensors = num_opponent_sensors
+        self.history_len = history_len
+        
+        # Initialize history buffers
+        self.speed_history = deque(maxlen=history_len)
+        self.angle_history = deque(maxlen=history_len)
+        self.trackPos_history = deque(maxlen=history_len)
+        self.steering_history = deque(maxlen=history_len)
+        self.reset()
+    
+    def reset(self):
+        """Zero the histories at the start of an episode, as process_batch does"""
+        for history in (self.speed_history, self.angle_history, self.trackPos_history, self.steering_history):
+            history.clear()
+            history.extend([0.0] * self.history_len)
+    
+    def get_state_dim(self):
+        """Return the dimension of the processed state vector"""
+        # Core features
+        basic_features = 12  # 3 speeds, angle, trackPos, rpm, damage, z, 4 wheel speeds
+        
+        # Track and opponent sensors (possibly downsampled)
+        track_features = self.num_track_sensors
+        opponent_features = min(10, self.num_opponent_sensors)  # We'll downsample opponents
+        
+        # Historical features
+        history_features = 3 * (self.history_len - 1)  # speed, angle, trackPos histories
+        
+        # Total features
+        return basic_features + track_features + opponent_features + history_features
+    
+    def process_state(self, car_state):
+        """Convert car state to neural network input"""
+        if not car_state:
+            # Return zero vector if no state is provided
+            return np.zeros(self.get_state_dim())
+        
+        # Extract basic features
+        speed_x = car_state.getSpeedX() if car_state.getSpeedX() is not None else 0.0
+        speed_y = car_state.getSpeedY() if car_state.getSpeedY() is not None else 0.0
+        speed_z = car_state.getSpeedZ() if car_state.getSpeedZ() is not None else 0.0
+        total_speed = np.sqrt(speed_x**2 + speed_y**2 + speed_z**2)
+        
+        angle = car_state.getAngle() if car_state.getAngle() is not None else 0.0
+        track_pos = car_state.getTrackPos() if car_state.getTrackPos() is not None else 0.0
+        rpm = car_state.getRpm() / 10000.0 if car_state.getRpm() is not None else 0.0  # Normalize RPM
+        damage = car_state.getDamage() / 10000.0 if car_state.getDamage() is not None else 0.0  # Normalize damage
+        z = car_state.getZ() / 10.0 if car_state.getZ() is not None else 0.0  # Normalize height
+        
+        # Get wheel spin velocities
+        wheel_speeds = car_state.getWheelSpinVel() if car_state.getWheelSpinVel() else [0.0, 0.0, 0.0, 0.0]
+        wheel_speeds = [w / 100.0 for w in wheel_speeds]  # Normalize wheel speeds
+        
+        # Process track sensors
+        track_sensors = car_state.getTrack() if car_state.getTrack() else [0.0] * self.num_track_sensors
+        track_sensors = [min(1.0, s / 200.0) for s in track_sensors]  # Normalize to [0,1] with max at 200m
+        
+        # Process opponent sensors (downsample to 10)
+        opponents = car_state.getOpponents() if car_state.getOpponents() else [200.0] * self.num_opponent_sensors
+        # Take a subset of opponent sensors (e.g., every 36/10 = ~4 sensors)
+        step = max(1, self.num_opponent_sensors // 10)
+        opponent_sample = [opponents[i] for i in range(0, self.num_opponent_sensors, step)][:10]
+        opponent_sample = [min(1.0, o / 200.0) for o in opponent_sample]  # Normalize to [0,1]
+        
+        # Update histories
+        self.speed_history.append(total_speed / 300.0)  # Normalize to [0,1] with max at 300 m/s
+        self.angle_history.append(angle / 3.14159)  # Normalize angle to [-1,1]
+        self.trackPos_history.append(track_pos)  # Already in [-1,1]
+        
+        # Calculate historical features (deltas)
+        speed_history = list(self.speed_history)[:-1]  # All but current
+        angle_history = list(self.angle_history)[:-1]  # All but current
+        trackPos_history = list(self.trackPos_history)[:-1]  # All but current
+        
+        # Combine all features
+        state = [
+            speed_x / 300.0,  # Normalize to approximately [-1,1]
+            speed_y / 300.0,
+            total_speed / 300.0,
+            angle / 3.14159,  # Normalize angle to [-1,1]
+            track_pos,  # Already in [-1,1]
+            rpm,
+            damage,
+            z
+        ]
+        
+        # Add wheel speeds
+        state.extend(wheel_speeds)
+        
+        # Add track sensors
+        state.extend(track_sensors)
+        
+        # Add opponent samples
+        state.extend(opponent_sample)
+        
+        # Add historical features
+        state.extend(speed_history)
+        state.extend(angle_history)
+        state.extend(trackPos_history)
+        
+        return np.array(state, dtype=np.float32)
+    
+    def process_batch(self, columns, episode_starts=None):
+        """Vectorized process_state over many recorded steps at once
+        
+        Args:
+            columns: Dict of raw sensor arrays with the telemetry column names:
+                speedX, speedY, speedZ, angle, trackPos, rpm, damage, z (N,),
+                wheelSpinVel (N, 4), track (N, num_track_sensors) and
+                opponents (N, num_opponent_sensors).
+            episode_starts: Boolean (N,) array marking the first step of each
+                episode. Histories are zero-padded at these steps.
+        """
+        speed_x = np.asarray(columns['speedX'], dtype=np.float32)
+        speed_y = np.asarray(columns['speedY'], dtype=np.float32)
+        speed_z = np.asarray(columns['speedZ'], dtype=np.float32)
+        total_speed = np.sqrt(speed_x**2 + speed_y**2 + speed_z**2)
+        angle = np.asarray(columns['angle'], dtype=np.float32)
+        track_pos = np.asarray(columns['trackPos'], dtype=np.float32)
+        n = len(speed_x)
+        
+        step = max(1, self.num_opponent_sensors // 10)
+        opponents = np.asarray(columns['opponents'], dtype=np.float32)[:, 0:self.num_opponent_sensors:step][:, :10]
+        
+        state = np.empty((n, self.get_state_dim()), dtype=np.float32)
+        state[:, 0] = speed_x / 300.0
+        state[:, 1] = speed_y / 300.0
+        state[:, 2] = total_speed / 300.0
+        state[:, 3] = angle / 3.14159
+        state[:, 4] = track_pos
+        state[:, 5] = np.asarray(columns['rpm'], dtype=np.float32) / 10000.0
+        state[:, 6] = np.asarray(columns['damage'], dtype=np.float32) / 10000.0
+        state[:, 7] = np.asarray(columns['z'], dtype=np.float32) / 10.0
+        col = 8
+        state[:, col:col + 4] = np.asarray(columns['wheelSpinVel'], dtype=np.float32) / 100.0
+        col += 4
+        state[:, col:col + self.num_track_sensors] = np.minimum(
+            1.0, np.asarray(columns['track'], dtype=np.float32) / 200.0)
+        col += self.num_track_sensors
+        state[:, col:col + opponents.shape[1]] = np.minimum(1.0, opponents / 200.0)
+        col += opponents.shape[1]
+        
+        # Step index within the episode, used to zero-pad histories
+        if episode_starts is None:
+            episode_starts = np.zeros(n, dtype=bool)
+            episode_starts[:1] = True
+        start_index = np.maximum.accumulate(np.where(episode_starts, np.arange(n), 0))
+        step_in_episode = np.arange(n) - start_index
+        
+        # History features hold the previous history_len - 1 values, oldest first
+        lags = self.history_len - 1
+        for values in (total_speed / 300.0, angle / 3.14159, track_pos):
+            for k in range(lags):
+                lag = lags - k
+                shifted = np.zeros(n, dtype=np.float32)
+                shifted[lag:] = values[:-lag]
+                shifted[step_in_episode < lag] = 0.0
+                state[:, col] = shifted
+                col += 1
+        
+        return state
+    
+    def process_action(self, action):
+        """Convert neural network output to car control values"""
+        # Neural network outputs: [steering, acceleration, brake]
+        steering = float(action[0])  # Already in [-1, 1]
+        accel = float(action[1])     # Already in [0, 1]
+        brake = float(action[2])     # Already in [0, 1]
+        
+        return steering, accel, brake
+    
+    def calculate_reward(self, car_state, previous_state=None, action=None):
+        """Calculate reward based on car state and action"""
+        if car_state is None:
+            return -10.0  # Large negative reward for invalid state
+        
+        # Extract relevant state information
+        speed_x = car_state.getSpeedX() if car_state.getSpeedX() is not None else 0.0
+        track_pos = car_state.getTrackPos() if car_state.getTrackPos() is not None else 0.0
+        angle = car_state.getAngle() if car_state.getAngle() is not None else 0.0
+        damage = car_state.getDamage() if car_state.getDamage() is not None else 0.0
+        track = car_state.getTrack() if car_state.getTrack() else None
+        
+        # Previous damage for comparison
+        prev_damage = 0.0
+        if previous_state and hasattr(previous_state, 'getDamage'):
+            prev_damage = previous_state.getDamage() if previous_state.getDamage() is not None else 0.0
+        
+        # Basic reward components
+        
+        # 1. Speed reward - encourage high speed in the forward direction
+        speed_reward = speed_x / 300.0  # Normalize to approximately [0, 1]
+        
+        # 2. Track position penalty - encourage staying near center of track
+        position_penalty = -abs(track_pos) * 2.0  # Higher penalty for being off-center
+        
+        # 3. Angle penalty - encourage car to face forward
+        angle_penalty = -abs(angle) * 2.0
+        
+        # 4. Damage penalty - high penalty for taking damage
+        damage_penalty = -max(0, (damage - prev_damage) / 100.0) * 10.0
+        
+        # 5. Off-track penalty
+        off_track_penalty = 0.0
+        if abs(track_pos) >= 1.0:
+            off_track_penalty = -10.0
+        
+        # 6. Track sensor penalty - discourage getting too close to track edges
+        track_penalty = 0.0
+        if track:
+            # Minimum distance from any track edge
+            min_track_dist = min([s for s in track if s > 0.0], default=100.0)
+            if min_track_dist < 5.0:
+                track_penalty = -((5.0 - min_track_dist) / 5.0) * 2.0
+        
+        # 7. Progress reward - encourage making forward progress
+        progress_reward = 0.0
+        if previous_state and hasattr(previous_state, 'getDistRaced'):
+            prev_dist = previous_state.getDistRaced() if previous_state.getDistRaced() is not None else 0.0
+            curr_dist = car_state.getDistRaced() if car_state.getDistRaced() is not None else 0.0
+            progress_reward = (curr_dist - prev_dist) * 10.0  # Scale up progress reward
+        
+        # Combine rewards with weights
+        total_reward = (
+            speed_reward * 1.0 +           # Weight for speed
+            position_penalty * 0.5 +       # Weight for track position
+            angle_penalty * 0.2 +          # Weight for angle
+            damage_penalty * 2.0 +         # Weight for damage
+            off_track_penalty +            # Off-track is a hard penalty
+            track_penalty * 0.3 +          # Weight for track sensors
+            progress_reward * 2.0          # Weight for progress
+        )
+        
+        return total_reward
@@ -0,0 +1,570 @@
+import argparse
+import collections as col
+import json
+import time
+
+import numpy as np
+
+from OU import PlayGameNoise, make_noise
+from stateProcessor import StateProcessor
+
+# Rangefinder angles sent by Launcher.Client at init, degrees clockwise from the car axis
+TRACK_ANGLES = np.radians([-45, -19, -12, -7, -4, -2.5, -1.7, -1, -.5, 0,
+                           .5, 1, 1.7, 2.5, 4, 7, 12, 19, 45]).astype(np.float32)
+FOCUS_ANGLES = np.radians([-2, -1, 0, 1, 2]).astype(np.float32)
+
+# Gear changes of the automatic gearbox in TorcsEnv.step, km/h
+GEAR_SPEEDS = np.array([0, 50, 80, 110, 140, 170], dtype=np.float32)
+
+Observation = col.namedtuple('Observaion', ['focus', 'speedX', 'speedY', 'speedZ', 'angle', 'damage',
+                                            'opponents', 'rpm', 'track', 'trackPos', 'wheelSpinVel'])
+
+
+class Track(object):
+    """Closed track centerline sampled every metre.
+
+    Holds positions, unit tangents and signed curvature (positive turning
+    left) of the centerline, plus the track width. Tracks come from a
+    parametric generator or from a recorded centerline.
+    """
+
+    def __init__(self, x, y, width=12.0):
+        """
+        Args:
+            x, y: Centerline points in metres, in driving order, first point not repeated.
+            width: Track width in metres.
+        """
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+
+        # Resample the closed polyline to 1 m spacing
+        closed_x, closed_y = np.append(x, x[0]), np.append(y, y[0])
+        arc = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(closed_x), np.diff(closed_y)))])
+        self.length = int(arc[-1])
+        s = np.arange(self.length) * arc[-1] / self.length
+        self.x = np.interp(s, arc, closed_x)
+        self.y = np.interp(s, arc, closed_y)
+        self.width = float(width)
+
+        dx = (np.roll(self.x, -1) - np.roll(self.x, 1)) / 2
+        dy = (np.roll(self.y, -1) - np.roll(self.y, 1)) / 2
+        norm = np.hypot(dx, dy)
+        self.tx, self.ty = dx / norm, dy / norm
+
+        # Heading change per sample, wrapped to [-pi, pi), over the sample spacing
+        heading = np.arctan2(self.ty, self.tx)
+        turn = (np.roll(heading, -1) - heading + np.pi) % (2 * np.pi) - np.pi
+        spacing = arc[-1] / self.length
+        self.curvature = (turn + np.roll(turn, 1)) / (2 * spacing)
+
+    @classmethod
+    def parametric(cls, seed=None, length=3000.0, width=12.0, harmonics=5, roughness=0.3):
+        """
+        Random closed track of about the given length
+
+        The centerline is a loop whose radius varies with a few random
+        harmonics of the polar angle, so it always closes on itself and
+        never crosses itself; roughness sets how far corners pull the
+        radius in and out.
+        """
+        rng = np.random.default_rng(seed)
+        theta = np.linspace(0, 2 * np.pi, 8 * int(length), endpoint=False)
+        radius = np.ones_like(theta)
+        for k in range(2, harmonics + 2):
+            radius += rng.uniform(0, roughness / k) * np.cos(k * theta + rng.uniform(0, 2 * np.pi))
+        x, y = radius * np.cos(theta), radius * np.sin(theta)
+        scale = length / np.hypot(np.diff(np.append(x, x[0])), np.diff(np.append(y, y[0]))).sum()
+        return cls(scale * x, scale * y, width)
+
+    @classmethod
+    def load(cls, path, width=12.0):
+        """Track from a recorded centerline: an (N, 2) .npy array or a CSV with x,y columns"""
+        if path.endswith('.npy'):
+            points = np.load(path)
+        else:
+            points = np.genfromtxt(path, delimiter=',', names=True)
+            points = np.column_stack([points['x'], points['y']])
+        return cls(points[:, 0], points[:, 1], width)
+
+
+class SurrogateTorcs(object):
+    """Batched kinematic bicycle cars standing in for TorcsEnv.
+
+    Every car drives its own copy of one of the given tracks, and one step
+    advances all of them with array operations. Observations use the field
+    names and scaling of TorcsEnv.make_observaton, the rangefinders use the
+    Client angles, and the reward is the TorcsEnv progress term with -1 for
+    a collision. Cars are only reset when asked, so the caller sees every
+    terminal transition. Running backward terminates an episode; reaching
+    max_steps only truncates it, which step reports as info['truncated']
+    so the last state can still be bootstrapped from.
+    """
+
+    WHEELBASE = 2.6       # m
+    REAR_AXLE = 1.3       # m from the centre of mass
+    STEER_LOCK = 0.366    # rad at steer = 1
+    MAX_ACCEL = 9.0       # m/s^2 from the engine at low speed
+    POWER = 320.0         # m^2/s^3, engine power per unit mass
+    MAX_BRAKE = 14.0      # m/s^2
+    DRAG = 4e-4           # 1/m
+    ROLLING = 0.1         # m/s^2
+    GRIP = 15.0           # m/s^2 of lateral acceleration before the car understeers
+    GRASS_DRAG = 4.0      # m/s^2 extra off the tarmac
+    RUNOFF = 3.0          # m of grass between the track edge and the wall
+    WHEEL_RADIUS = 0.33   # m
+
+    def __init__(self, num_envs=1024, tracks=None, seed=None, max_steps=1000, dt=0.2, substeps=4,
+                 random_start=True, ray_samples=24):
+        """
+        Args:
+            num_envs: Cars stepped together.
+            tracks: Tracks to spread the cars over. Defaults to one parametric track per 64 cars.
+            seed: Seed for tracks, starts and noise.
+            max_steps: Steps before a car's episode ends.
+            dt: Seconds per step.
+            substeps: Integration steps per step.
+            random_start: Start each episode at a random point of the lap instead of the start line.
+            ray_samples: Points sampled along each rangefinder ray.
+        """
+        self.rng = np.random.default_rng(seed)
+        if tracks is None:
+            tracks = [Track.parametric(seed=self.rng.integers(2 ** 31)) for _ in range(max(1, num_envs // 64))]
+        self.tracks = tracks
+        self.num_envs = num_envs
+        self.max_steps = max_steps
+        self.dt = dt
+        self.substeps = substeps
+        self.random_start = random_start
+
+        # All tracks in one set of arrays, each with its first sample repeated at the end
+        offsets = np.cumsum([0] + [t.length + 1 for t in tracks])[:-1]
+        def joined(name):
+            return np.concatenate([np.append(getattr(t, name), getattr(t, name)[0]) for t in tracks]).astype(np.float32)
+        self._x, self._y = joined('x'), joined('y')
+        self._tx, self._ty = joined('tx'), joined('ty')
+        self._curvature = joined('curvature')
+
+        self.track_id = np.arange(num_envs) % len(tracks)
+        self._offset = offsets[self.track_id]
+        self.lap_length = np.array([t.length for t in tracks], dtype=np.float32)[self.track_id]
+        self.half_width = np.array([t.width / 2 for t in tracks], dtype=np.float32)[self.track_id]
+
+        # Rays sampled more densely near the car, out to the 200 m sensor range
+        self._ray_range = np.geomspace(0.5, 200.0, ray_samples).astype(np.float32)
+
+        n = num_envs
+        self.s = np.zeros(n, dtype=np.float32)          # m along the centerline
+        self.n = np.zeros(n, dtype=np.float32)          # m left of the centerline
+        self.psi = np.zeros(n, dtype=np.float32)        # rad, heading left of the track direction
+        self.v = np.zeros(n, dtype=np.float32)          # m/s
+        self.beta = np.zeros(n, dtype=np.float32)       # rad, slip angle at the centre of mass
+        self.damage = np.zeros(n, dtype=np.float32)
+        self.dist_raced = np.zeros(n, dtype=np.float32)
+        self.time_step = np.zeros(n, dtype=np.int64)
+        self.accel = np.zeros(n, dtype=np.float32)
+        # Previous speed, angle and trackPos for the StateProcessor history features
+        self._history = np.zeros((3, n, StateProcessor().history_len - 1), dtype=np.float32)
+        self.processor = StateProcessor()
+        self.raw = None
+
+    def _lookup(self, s, *arrays):
+        """Linear interpolation of per-metre track arrays at arc length s of each car's track"""
+        shape = np.shape(s)
+        length = self.lap_length.reshape((-1,) + (1,) * (len(shape) - 1))
+        offset = self._offset.reshape(length.shape)
+        s = np.mod(s, length)
+        # float32 rounding can land s on the lap length itself
+        base = np.minimum(np.floor(s), length - 1).astype(np.int64)
+        frac = (s - base).astype(np.float32)
+        index = base + offset
+        return [a[index] + frac * (a[index + 1] - a[index]) for a in arrays]
+
+    def _rangefinders(self, angles):
+        """Distance to the track edge along rays at the given clockwise angles, -1 off the track"""
+        x, y, tx, ty = self._lookup(self.s, self._x, self._y, self._tx, self._ty)
+        car_x, car_y = x - self.n * ty, y + self.n * tx
+        heading = np.arctan2(ty, tx) + self.psi
+
+        direction = heading[:, None] - angles[None, :]                     # (N, R)
+        r = self._ray_range[None, None, :]                                 # (1, 1, M)
+        px = car_x[:, None, None] + np.cos(direction)[..., None] * r
+        py = car_y[:, None, None] + np.sin(direction)[..., None] * r
+
+        # Offset of each sample from the centerline near a guess of its arc length,
+        # corrected to second order for the curvature between the guess and the sample
+        s0 = self.s[:, None, None] + np.cos(self.psi[:, None] - angles[None, :])[..., None] * r
+        x0, y0, tx0, ty0, k0 = self._lookup(s0, self._x, self._y, self._tx, self._ty, self._curvature)
+        dx, dy = px - x0, py - y0
+        along = dx * tx0 + dy * ty0
+        lateral = np.abs(dy * tx0 - dx * ty0 - 0.5 * k0 * along ** 2)
+
+        half_width = self.half_width[:, None, None]
+        outside = lateral > half_width
+        first = np.argmax(outside, axis=2)
+        hit = outside.any(axis=2)
+
+        # Interpolate where the edge falls between the last sample inside and the first outside
+        before = np.maximum(first - 1, 0)
+        r_in = np.where(first > 0, self._ray_range[before], 0.0)
+        lateral_in = np.where(first > 0, np.take_along_axis(lateral, before[..., None], 2)[..., 0],
+                              np.abs(self.n)[:, None])
+        lateral_out = np.take_along_axis(lateral, first[..., None], 2)[..., 0]
+        r_out = self._ray_range[first]
+        fraction = np.clip((half_width[..., 0] - lateral_in) / np.maximum(lateral_out - lateral_in, 1e-6), 0, 1)
+        distance = np.where(hit, r_in + fraction * (r_out - r_in), 200.0)
+
+        off_track = np.abs(self.n) > self.half_width
+        return np.where(off_track[:, None], -1.0, distance).astype(np.float32)
+
+    def _observe(self):
+        speed_x = self.v * np.cos(self.beta) * 3.6
+        speed_y = self.v * np.sin(self.beta) * 3.6
+        gear = np.clip(np.searchsorted(GEAR_SPEEDS, speed_x, side='right'), 1, len(GEAR_SPEEDS))
+        gear_low = GEAR_SPEEDS[gear - 1]
+        gear_high = np.append(GEAR_SPEEDS[1:], 300.0)[gear - 1]
+        rpm = 2500.0 + 6500.0 * np.clip((speed_x - gear_low) / (gear_high - gear_low), 0, 1)
+
+        wheel = self.v / self.WHEEL_RADIUS
+        wheel_spin = np.stack([wheel, wheel, wheel * (1 + 0.1 * self.accel), wheel * (1 + 0.1 * self.accel)], axis=1)
+
+        # TORCS reports the track direction relative to the car
+        angle = -self.psi
+        self.raw = {
+            'angle': angle,
+            'track': self._rangefinders(TRACK_ANGLES),
+            'focus': self._rangefinders(FOCUS_ANGLES),
+            'trackPos': self.n / self.half_width,
+            'speedX': speed_x,
+            'speedY': speed_y,
+            'speedZ': np.zeros(self.num_envs, dtype=np.float32),
+            'rpm': rpm.astype(np.float32),
+            'damage': self.damage.copy(),
+            'z': np.full(self.num_envs, 0.35, dtype=np.float32),
+            'wheelSpinVel': wheel_spin.astype(np.float32),
+            'opponents': np.full((self.num_envs, 36), 200.0, dtype=np.float32),
+            'distRaced': self.dist_raced.copy(),
+            'distFromStart': np.mod(self.s, self.lap_length),
+        }
+        raw = self.raw
+        return Observation(focus=raw['focus'] / 200.,
+                           speedX=raw['speedX'] / 300.0,
+                           speedY=raw['speedY'] / 300.0,
+                           speedZ=raw['speedZ'] / 300.0,
+                           angle=raw['angle'] / 3.1416,
+                           damage=raw['damage'],
+                           opponents=raw['opponents'] / 200.,
+                           rpm=raw['rpm'] / 10000,
+                           track=raw['track'] / 200.,
+                           trackPos=raw['trackPos'],
+                           wheelSpinVel=raw['wheelSpinVel'])
+
+    def reset(self, mask=None):
+        """Start new episodes for the cars in mask (all cars if None) and return the observation"""
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        self.s[mask] = self.rng.uniform(0, self.lap_length[mask]) if self.random_start else 0.0
+        self.n[mask] = 0.0
+        self.psi[mask] = 0.0
+        self.v[mask] = 0.0
+        self.beta[mask] = 0.0
+        self.accel[mask] = 0.0
+        self.damage[mask] = 0.0
+        self.dist_raced[mask] = 0.0
+        self.time_step[mask] = 0
+        self._history[:, mask] = 0.0
+        return self._observe()
+
+    def step(self, actions):
+        """
+        Advance every car by one step
+
+        Args:
+            actions: (num_envs, 3) of [steer, accel, brake], as TorcsEnv takes them.
+
+        Returns:
+            (observation, rewards, dones, info) with one entry per car.
+        """
+        actions = np.asarray(actions, dtype=np.float32)
+        steer = np.clip(actions[:, 0], -1, 1)
+        self.accel = accel = np.clip(actions[:, 1], 0, 1)
+        brake = np.clip(actions[:, 2], 0, 1)
+
+        # Histories hold the values seen before this step
+        previous = self.raw
+        if previous is not None:
+            speed = np.sqrt(previous['speedX'] ** 2 + previous['speedY'] ** 2) / 300.0
+            for history, value in zip(self._history, (speed, previous['angle'] / 3.14159, previous['trackPos'])):
+                history[:, :-1] = history[:, 1:]
+                history[:, -1] = value
+
+        # Kinematic bicycle model in track coordinates
+        delta = steer * self.STEER_LOCK
+        self.beta = np.arctan(self.REAR_AXLE / self.WHEELBASE * np.tan(delta)).astype(np.float32)
+        h = self.dt / self.substeps
+        damage_before = self.damage.copy()
+        for _ in range(self.substeps):
+            v = self.v
+            yaw_rate = v / self.REAR_AXLE * np.sin(self.beta)
+            grip_limit = self.GRIP / np.maximum(v, 1.0)
+            yaw_rate = np.clip(yaw_rate, -grip_limit, grip_limit)
+
+            (curvature,) = self._lookup(self.s, self._curvature)
+            ds = v * np.cos(self.psi + self.beta) / np.maximum(1.0 - self.n * curvature, 0.1)
+            self.n += h * v * np.sin(self.psi + self.beta)
+            self.psi += h * (yaw_rate - curvature * ds)
+            self.s += h * ds
+            self.dist_raced += h * ds
+
+            on_grass = np.abs(self.n) > self.half_width
+            drive = accel * np.minimum(self.MAX_ACCEL, self.POWER / np.maximum(v, 1.0))
+            resistance = self.DRAG * v ** 2 + self.ROLLING + self.GRASS_DRAG * on_grass
+            self.v = np.maximum(0.0, v + h * (drive - self.MAX_BRAKE * brake - resistance)).astype(np.float32)
+
+            # Hitting the wall costs speed and damage and straightens the car
+            wall = self.half_width + self.RUNOFF
+            crashed = np.abs(self.n) > wall
+            if crashed.any():
+                self.damage[crashed] += 10.0 * self.v[crashed]
+                self.n[crashed] = np.clip(self.n[crashed], -wall[crashed], wall[crashed])
+                self.v[crashed] *= 0.3
+                self.psi[crashed] *= 0.5
+
+        self.psi = (self.psi + np.pi) % (2 * np.pi) - np.pi
+        self.s = np.mod(self.s, self.lap_length)
+        self.time_step += 1
+
+        ob = self._observe()
+        raw = self.raw
+        sp = raw['speedX']
+        rewards = sp * np.cos(raw['angle']) - np.abs(sp * np.sin(raw['angle'])) - sp * np.abs(raw['trackPos'])
+        collided = self.damage > damage_before
+        rewards = np.where(collided, -1.0, rewards).astype(np.float32)
+
+        # TorcsEnv ends an episode when the car runs backward; the step limit is a time limit
+        dones = np.cos(raw['angle']) < 0
+        truncated = (self.time_step >= self.max_steps) & ~dones
+        return ob, rewards, dones, {'collided': collided, 'truncated': truncated}
+
+    def ddpg_states(self, ob):
+        """The 29-value states ddpg.playGame builds from an observation, one row per car"""
+        return np.hstack((ob.angle[:, None], ob.track, ob.trackPos[:, None], ob.speedX[:, None],
+                          ob.speedY[:, None], ob.speedZ[:, None], ob.wheelSpinVel / 100.0,
+                          ob.rpm[:, None])).astype(np.float32)
+
+    def agent_states(self):
+        """StateProcessor states of the current step for DDPGAgent, one row per car"""
+        states = self.processor.process_batch(self.raw, episode_starts=np.ones(self.num_envs, dtype=bool))
+        lags = self._history.shape[2]
+        states[:, -3 * lags:] = self._history.transpose(1, 0, 2).reshape(self.num_envs, 3 * lags)
+        return states
+
+    def end(self):
+        return
+
+
+def pretrain_ddpg(sim, total_steps=1000000, config=None, updates_per_step=4, report_every=50):
+    """
+    Pretrain the Keras actor and critic of ddpg.py on the surrogate
+
+    Actions, exploration noise and replay follow playGame, with every car's
+    transition stored each step. The weights are written as actormodel.h5
+    and criticmodel.h5, where playGame loads them to fine-tune in TORCS.
+
+    Args:
+        sim: SurrogateTorcs to drive.
+        total_steps: Car steps to collect, summed over cars.
+        config: Overrides of ddpg.DEFAULT_HYPERPARAMETERS.
+        updates_per_step: Gradient updates per batched step of all cars.
+        report_every: Batched steps between progress lines.
+    """
+    import ddpg
+    from checkpointWriter import CheckpointWriter, KerasSnapshot, text_writer
+    from learningAgent import ReplayBuffer
+
+    params = dict(ddpg.DEFAULT_HYPERPARAMETERS, **(config or {}))
+    state_dim, action_dim = 29, 3
+    actor = ddpg.create_actor_model(state_dim, params['hidden1_units'], params['hidden2_units'])
+    critic = ddpg.create_critic_model(state_dim, action_dim, params['hidden1_units'], params['hidden2_units'])
+    actor_target = ddpg.create_actor_model(state_dim, params['hidden1_units'], params['hidden2_units'])
+    critic_target = ddpg.create_critic_model(state_dim, action_dim, params['hidden1_units'], params['hidden2_units'])
+    actor_target.set_weights(actor.get_weights())
+    critic_target.set_weights(critic.get_weights())
+    train_step = ddpg.make_train_step(actor, critic, actor_target, critic_target, params['gamma'],
+                                      params['tau'], params['lra'], params['lrc'])
+
+    buff = ReplayBuffer(capacity=params['buffer_size'])
+    batch_size = params['batch_size']
+    batch = (np.empty((batch_size, state_dim), np.float32), np.empty((batch_size, action_dim), np.float32),
+             np.empty((batch_size, 1), np.float32), np.empty((batch_size, state_dim), np.float32),
+             np.empty((batch_size, 1), np.float32))
+
+    # playGame's exploration for every car in one call, fading out over the same number of car steps
+    exploration = PlayGameNoise(sim.num_envs, scale=1.0, final_scale=0.0,
+                                decay_steps=max(1, params['explore'] // sim.num_envs))
+    s_t = sim.ddpg_states(sim.reset())
+    episode_rewards = np.zeros(sim.num_envs)
+    finished = []
+    steps = 0
+    start = time.time()
+    for iteration in range(1, total_steps // sim.num_envs + 1):
+        a_t = actor(s_t, training=False).numpy()
+        a_t = a_t + exploration.perturb(a_t)
+        a_t[:, 0] /= 4
+
+        ob, r_t, done, info = sim.step(a_t)
+        s_t1 = sim.ddpg_states(ob)
+        # Only terminations are stored as done; cars at the step limit are just reset
+        buff.add_batch(s_t, a_t, r_t, s_t1, done)
+        ended = done | info['truncated']
+        steps += sim.num_envs
+
+        if len(buff) > batch_size:
+            for _ in range(updates_per_step):
+                buff.sample_into(batch_size, batch)
+                train_step(batch[0], batch[1], batch[2][:, 0], batch[3], batch[4][:, 0])
+
+        episode_rewards += r_t
+        if ended.any():
+            finished.extend(episode_rewards[ended])
+            episode_rewards[ended] = 0.0
+            exploration.reset(ended)
+            s_t1 = sim.ddpg_states(sim.reset(ended))
+        s_t = s_t1
+
+        if iteration % report_every == 0:
+            recent = np.mean(finished[-100:]) if finished else float('nan')
+            print(f"Steps: {steps}, {steps / (time.time() - start):.0f} steps/s, "
+                  f"episodes: {len(finished)}, mean reward (last 100): {recent:.1f}")
+
+    # Same files and atomic writes as playGame
+    checkpoints = CheckpointWriter()
+    checkpoints.submit(KerasSnapshot(actor).writer(actor), "actormodel.h5", tmp_suffix='.tmp.weights.h5')
+    checkpoints.submit(text_writer(json.dumps(actor.to_json())), "actormodel.json")
+    checkpoints.submit(KerasSnapshot(critic).writer(critic), "criticmodel.h5", tmp_suffix='.tmp.weights.h5')
+    checkpoints.submit(text_writer(json.dumps(critic.to_json())), "criticmodel.json")
+    checkpoints.close()
+    print("Pretrained weights saved to actormodel.h5 and criticmodel.h5")
+    return finished
+
+
+def pretrain_agent(agent, sim, total_steps=1000000, updates_per_step=4, report_every=50, filepath=None):
+    """
+    Pretrain a DDPGAgent on the surrogate
+
+    The actor runs on all cars at once with the agent's kind of noise,
+    scaled by its epsilon as in get_action and decayed once per batched
+    step, and every transition goes into the agent's replay
+    buffer before its usual updates. The model is saved with save_model.
+
+    Args:
+        agent: DDPGAgent with a StateProcessor-sized state.
+        sim: SurrogateTorcs to drive.
+        total_steps: Car steps to collect, summed over cars.
+        updates_per_step: agent.train() calls per batched step of all cars.
+        report_every: Batched steps between progress lines.
+        filepath: Where to save the model; save_model picks a name if None.
+    """
+    import torch # type: ignore
+
+    exploration = make_noise(agent.noise_type, sim.num_envs, agent.action_size)
+    sim.reset()
+    s_t = sim.agent_states()
+    episode_rewards = np.zeros(sim.num_envs)
+    finished = []
+    steps = 0
+    start = time.time()
+    for iteration in range(1, total_steps // sim.num_envs + 1):
+        with torch.no_grad():
+            a_t = agent.actor(torch.from_numpy(s_t)).numpy()
+        if agent.epsilon > agent.epsilon_min:
+            a_t = a_t + agent.epsilon * exploration.sample()
+            a_t[:, 0] = np.clip(a_t[:, 0], -1, 1)
+            a_t[:, 1:] = np.clip(a_t[:, 1:], 0, 1)
+
+        _, r_t, done, info = sim.step(a_t)
+        s_t1 = sim.agent_states()
+        # Only terminations are stored as done; cars at the step limit are just reset
+        agent.replay_buffer.add_batch(s_t, a_t.astype(np.float32), r_t, s_t1, done, sim.raw['distFromStart'])
+        agent.decay_epsilon()
+        ended = done | info['truncated']
+        steps += sim.num_envs
+
+        if len(agent.replay_buffer) >= agent.batch_size:
+            for _ in range(updates_per_step):
+                agent.train()
+
+        episode_rewards += r_t
+        if ended.any():
+            finished.extend(episode_rewards[ended])
+            episode_rewards[ended] = 0.0
+            exploration.reset(ended)
+            sim.reset(ended)
+            s_t1 = sim.agent_states()
+        s_t = s_t1
+
+        if iteration % report_every == 0:
+            recent = np.mean(finished[-100:]) if finished else float('nan')
+            print(f"Steps: {steps}, {steps / (time.time() - start):.0f} steps/s, "
+                  f"episodes: {len(finished)}, mean reward (last 100): {recent:.1f}")
+
+    recent = float(np.mean(finished[-100:])) if finished else 0.0
+    agent.save_model(0, recent, filepath=filepath)
+    return finished
+
+
+def benchmark(num_envs=4096, steps=100, seed=0):
+    """Car steps per second of the surrogate under random actions"""
+    sim = SurrogateTorcs(num_envs, seed=seed)
+    sim.reset()
+    rng = np.random.default_rng(seed)
+    actions = np.column_stack([rng.uniform(-0.2, 0.2, num_envs), np.full(num_envs, 0.6), np.zeros(num_envs)])
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, done, info = sim.step(actions)
+        ended = done | info['truncated']
+        if ended.any():
+            sim.reset(ended)
+    elapsed = time.perf_counter() - start
+    return num_envs * steps / elapsed
+
+
+def main():
+    """Pretrain either stack on the surrogate, or measure its throughput"""
+    parser = argparse.ArgumentParser(description='Vectorized surrogate TORCS for pretraining')
+    parser.add_argument('mode', choices=['ddpg', 'agent', 'benchmark'])
+    parser.add_argument('--envs', type=int, default=1024, help='Cars stepped together')
+    parser.add_argument('--steps', type=int, default=1000000, help='Car steps to collect')
+    parser.add_argument('--updates-per-step', type=int, default=4, help='Gradient updates per batched step')
+    parser.add_argument('--max-steps', type=int, default=1000, help='Steps per episode')
+    parser.add_argument('--track', nargs='*', default=None, help='Recorded centerlines (.npy or x,y CSV)')
+    parser.add_argument('--track-width', type=float, default=12.0, help='Width of recorded tracks (m)')
+    parser.add_argument('--config', default=None, help='JSON overrides of the ddpg.py hyperparameters')
+    parser.add_argument('--model', default=None, help='DDPGAgent checkpoint to start from')
+    parser.add_argument('--save', default=None, help='Where to save the DDPGAgent model')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode == 'benchmark':
+        print(f"{benchmark(args.envs, seed=args.seed):.0f} car steps/s with {args.envs} cars")
+        return
+
+    tracks = [Track.load(path, args.track_width) for path in args.track] if args.track else None
+    sim = SurrogateTorcs(args.envs, tracks=tracks, seed=args.seed, max_steps=args.max_steps)
+
+    if args.mode == 'ddpg':
+        config = None
+        if args.config:
+            with open(args.config) as f:
+                config = json.load(f)
+        pretrain_ddpg(sim, args.steps, config, args.updates_per_step)
+    else:
+        from learningAgent import DDPGAgent, checkpoint_hidden_size
+        hidden_size = (checkpoint_hidden_size(args.model) if args.model else None) or 128
+        agent = DDPGAgent(StateProcessor().get_state_dim(), 3, hidden_size=hidden_size, buffer_size=1000000)
+        if args.model:
+            agent.load_model(args.model)
+        pretrain_agent(agent, sim, args.steps, args.updates_per_step, filepath=args.save)
+        agent.close()
+
+
+if __name__ == "__main__":
+    main()
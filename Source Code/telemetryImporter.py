@@ -0,0 +1,185 @@
+import argparse
+import glob
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from learningAgent import RacingAI, StateProcessor
+
+SCALAR_COLUMNS = ['angle', 'curLapTime', 'damage', 'distFromStart', 'distRaced',
+                  'rpm', 'speedX', 'speedY', 'speedZ', 'trackPos', 'z',
+                  'steering', 'acceleration', 'brake', 'reward', 'episode', 'episode_step']
+PIPE_COLUMNS = {'track_data': 19, 'opponents_data': 36, 'wheelSpinVel_data': 4}
+
+
+def _parse_pipe_column(values, width):
+    """Parse a column of pipe-delimited floats into an (N, width) array"""
+    # Hand the column back to the C parser with '|' as the separator. Rows
+    # logged without sensors ("0") come back short and are padded with zeros.
+    text = io.StringIO('\n'.join(values.astype(str)))
+    parsed = pd.read_csv(text, sep='|', header=None, names=range(width),
+                         dtype=np.float32, engine='c')
+    return parsed.fillna(0.0).to_numpy(dtype=np.float32)
+
+
+def load_telemetry_arrays(paths):
+    """
+    Read one or many telemetry CSV files into column arrays
+
+    Args:
+        paths: Iterable of telemetry_*.csv paths, read in the given order.
+
+    Returns:
+        Dict of numpy arrays keyed by column name, plus 'file' holding the
+        index of the file every row came from.
+    """
+    frames = []
+    for file_index, path in enumerate(paths):
+        frame = pd.read_csv(path, usecols=SCALAR_COLUMNS + list(PIPE_COLUMNS),
+                            dtype={name: str for name in PIPE_COLUMNS}, engine='c')
+        frame['file'] = file_index
+        frames.append(frame)
+
+    if not frames:
+        return None
+
+    data = pd.concat(frames, ignore_index=True)
+    columns = {name: data[name].to_numpy(dtype=np.float32) for name in SCALAR_COLUMNS}
+    columns['file'] = data['file'].to_numpy()
+    columns['track'] = _parse_pipe_column(data['track_data'].to_numpy(), PIPE_COLUMNS['track_data'])
+    columns['opponents'] = _parse_pipe_column(data['opponents_data'].to_numpy(), PIPE_COLUMNS['opponents_data'])
+    columns['wheelSpinVel'] = _parse_pipe_column(data['wheelSpinVel_data'].to_numpy(), PIPE_COLUMNS['wheelSpinVel_data'])
+    return columns
+
+
+def episode_boundaries(columns):
+    """Mark rows that start a new episode
+
+    A new episode starts on a new file, a new episode number, or whenever
+    episode_step fails to increase.
+    """
+    n = len(columns['episode'])
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = ((columns['file'][1:] != columns['file'][:-1]) |
+                  (columns['episode'][1:] != columns['episode'][:-1]) |
+                  (columns['episode_step'][1:] <= columns['episode_step'][:-1]))
+    return starts
+
+
+def build_transitions(columns, state_processor=None):
+    """
+    Rebuild (s, a, r, s', done) transitions from telemetry columns
+
+    The logged reward is the running episode reward, so the reward of the step
+    from row t to row t + 1 is the difference between the two. The last
+    transition of an episode is terminal when the next row in the same file
+    starts a new episode; episodes cut off by the end of a file are not.
+    """
+    if state_processor is None:
+        state_processor = StateProcessor()
+
+    starts = episode_boundaries(columns)
+    states = state_processor.process_batch(columns, episode_starts=starts)
+    actions = np.stack([columns['steering'], columns['acceleration'], columns['brake']], axis=1)
+
+    # Row t pairs with row t + 1 only inside one episode
+    has_next = np.zeros(len(starts), dtype=bool)
+    has_next[:-1] = ~starts[1:]
+    t = np.flatnonzero(has_next)
+
+    # Row i closes a terminated episode when a new one starts right after it
+    ends_episode = np.zeros(len(starts), dtype=bool)
+    ends_episode[:-1] = starts[1:] & (columns['file'][1:] == columns['file'][:-1])
+    dones = ends_episode[t + 1]
+
+    rewards = columns['reward'][t + 1] - columns['reward'][t]
+    return states[t], actions[t], rewards, states[t + 1], dones.astype(np.float32), columns['distFromStart'][t]
+
+
+def import_telemetry(paths, replay_buffer, state_processor=None):
+    """
+    Import telemetry logs straight into a replay buffer
+
+    Returns:
+        Number of transitions added.
+    """
+    columns = load_telemetry_arrays(paths)
+    if columns is None:
+        print("No telemetry files found.")
+        return 0
+
+    states, actions, rewards, next_states, dones, dist_from_start = build_transitions(columns, state_processor)
+    replay_buffer.add_batch(states, actions, rewards, next_states, dones, dist_from_start)
+    return len(states)
+
+
+def train_offline(agent, updates=None, duration=None, report_every=1000):
+    """
+    Run DDPGAgent.train back to back without a simulator
+
+    Args:
+        agent: DDPGAgent whose replay buffer is already filled.
+        updates: Number of gradient updates to run. Unlimited if None.
+        duration: Wall-clock limit in seconds. Unlimited if None.
+        report_every: Print throughput every this many updates.
+
+    Returns:
+        Number of updates run.
+    """
+    if len(agent.replay_buffer) < agent.batch_size:
+        print("Not enough experiences in the replay buffer to train.")
+        return 0
+
+    start = time.perf_counter()
+    last_report = start
+    done_updates = 0
+    while updates is None or done_updates < updates:
+        agent.train()
+        done_updates += 1
+
+        if done_updates % report_every == 0:
+            now = time.perf_counter()
+            print(f"Updates: {done_updates}, {report_every / (now - last_report):.1f} updates/s")
+            last_report = now
+
+        if duration is not None and time.perf_counter() - start >= duration:
+            break
+
+    elapsed = time.perf_counter() - start
+    print(f"Ran {done_updates} updates in {elapsed:.1f}s ({done_updates / max(elapsed, 1e-9):.1f} updates/s)")
+    return done_updates
+
+
+def main():
+    """Import telemetry logs and train the racing agent offline"""
+    parser = argparse.ArgumentParser(description='Offline DDPG training from telemetry logs')
+    parser.add_argument('paths', nargs='*', help='Telemetry CSV files [logs/telemetry_*.csv]')
+    parser.add_argument('--model', default=None, help='Checkpoint to start from')
+    parser.add_argument('--buffer-size', type=int, default=1000000, help='Replay capacity')
+    parser.add_argument('--updates', type=int, default=None, help='Number of gradient updates')
+    parser.add_argument('--duration', type=float, default=None, help='Training time limit in seconds')
+    parser.add_argument('--save', default=None, help='Where to save the trained model')
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join('logs', 'telemetry_*.csv')))
+    if args.updates is None and args.duration is None:
+        args.updates = 10000
+
+    ai = RacingAI(load_model_path=args.model, buffer_size=args.buffer_size)
+
+    start = time.perf_counter()
+    count = import_telemetry(paths, ai.agent.replay_buffer, ai.state_processor)
+    elapsed = time.perf_counter() - start
+    print(f"Imported {count} transitions from {len(paths)} files in {elapsed:.1f}s "
+          f"({count / max(elapsed, 1e-9) * 60:.0f} rows/min)")
+
+    train_offline(ai.agent, updates=args.updates, duration=args.duration)
+    ai.agent.save_model(ai.episode_count, 0.0, filepath=args.save)
+    ai.agent.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -74,6 +74,8 @@ class TorcsEnv( gym.Env):
         self.vision = vision
         self.throttle = throttle
         self.gear_change = gear_change
+        # Parallel instances talk to scr_server rank + 1, on port 3001 + rank
+        self.rank = rank
         self.race_speed = race_speed
         self.rendering = rendering
         self.damage = damage
@@ -417,7 +419,7 @@ class TorcsEnv( gym.Env):
         if self.randomisation:
             self.randomise_track()
 
-        self.client = snakeoil3.Client(p=3001, vision=self.vision,
+        self.client = snakeoil3.Client(p=3001 + self.rank, vision=self.vision,
             process_id=self.torcs_process_id,
             race_config_path=self.race_config_path,
             race_speed=self.race_speed,
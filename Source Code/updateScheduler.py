@@ -0,0 +1,144 @@
+import math
+import threading
+import time
+
+
+class UpdateScheduler(object):
+    """Schedules gradient updates against environment steps.
+
+    Every env step earns updates_per_step updates. At most inline_updates of
+    them run right away; the rest are banked and run in bulk while the
+    environment is busy resetting or relaunching TORCS. The bank is capped at
+    max_banked updates so learning never runs far ahead of the data; credit
+    beyond the cap is dropped.
+
+    Only resets passed through during() are used. playGame wraps its
+    gym_torcs env.reset calls this way. torcs_env's hard_reset_interval
+    relaunches and the RacingAI/Driver loop do not go through a scheduler.
+    """
+
+    def __init__(self, train_fn, updates_per_step=1.0, inline_updates=None, max_banked=1000,
+                 ready_fn=None):
+        """
+        Args:
+            train_fn: Runs one gradient update and returns its result.
+            updates_per_step: Target number of updates per env step, may be fractional.
+            inline_updates: Most updates run inside step(). None runs them all inline.
+            max_banked: Most deferred updates kept for later.
+            ready_fn: Returns False while there is not enough data to train;
+                no credit is earned until it returns True.
+        """
+        self.train_fn = train_fn
+        self.updates_per_step = updates_per_step
+        self.inline_updates = inline_updates
+        self.max_banked = max_banked
+        self.ready_fn = ready_fn
+
+        self.credit = 0.0
+        self.banked = 0
+
+        # Counters
+        self.env_steps = 0
+        self.inline_done = 0
+        self.banked_done = 0
+        self.dropped = 0
+
+    @property
+    def updates(self):
+        """Total updates run so far"""
+        return self.inline_done + self.banked_done
+
+    def replay_ratio(self):
+        """Updates run per env step so far"""
+        return self.updates / max(self.env_steps, 1)
+
+    def step(self):
+        """Account for one env step and run the inline share of its updates
+
+        Returns:
+            Result of the last update run, or None if none ran.
+        """
+        self.env_steps += 1
+        if self.ready_fn is not None and not self.ready_fn():
+            return None
+
+        self.credit += self.updates_per_step
+        due = int(math.floor(self.credit))
+        self.credit -= due
+
+        inline = due if self.inline_updates is None else min(due, self.inline_updates)
+        self._bank(due - inline)
+
+        result = None
+        for _ in range(inline):
+            result = self.train_fn()
+        self.inline_done += inline
+        return result
+
+    def _bank(self, count):
+        """Defer updates, dropping what does not fit under the cap"""
+        room = max(self.max_banked - self.banked, 0)
+        self.banked += min(count, room)
+        self.dropped += max(count - room, 0)
+
+    def drain(self, max_updates=None, deadline=None, stop_event=None):
+        """
+        Run banked updates on the calling thread
+
+        Args:
+            max_updates: Most updates to run. All banked ones if None.
+            deadline: time.perf_counter() value after which to stop.
+            stop_event: threading.Event that stops draining once set.
+
+        Returns:
+            Number of updates run.
+        """
+        done = 0
+        while self.banked > 0 and (max_updates is None or done < max_updates):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if stop_event is not None and stop_event.is_set():
+                break
+            self.train_fn()
+            self.banked -= 1
+            done += 1
+        self.banked_done += done
+        return done
+
+    def during(self, fn, *args, **kwargs):
+        """
+        Call a blocking function, e.g. env.reset, and train on the bank while it waits
+
+        The call runs in a worker thread while banked updates run on the
+        calling thread, so the networks are only ever touched from here.
+        Draining stops as soon as the call returns.
+
+        Returns:
+            Whatever fn returns.
+        """
+        if self.banked == 0:
+            return fn(*args, **kwargs)
+
+        finished = threading.Event()
+        outcome = {}
+
+        def call():
+            try:
+                outcome['value'] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                finished.set()
+
+        worker = threading.Thread(target=call, name='env-wait', daemon=True)
+        start = time.perf_counter()
+        worker.start()
+        done = self.drain(stop_event=finished)
+        worker.join()
+        waited = time.perf_counter() - start
+        if done:
+            print(f"Ran {done} banked updates in {waited:.1f}s of env downtime, {self.banked} left")
+
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('value')